@@ -0,0 +1,114 @@
+"""Pick the cheapest SAM backend that still masks like ViT-H.
+
+Runs every ``--backends`` entry (``checkpoint[:traced][:int8]``, see
+``data/extract_mask.py``) on ``--frames`` frames sampled evenly from an
+experiment, and compares its masks to those of the ``--reference`` backend
+by IoU. The backends whose mean IoU reaches ``--min_iou`` qualify, and the
+fastest of them is recommended as the ``--backend`` of ``extract_mask.py``.
+The embedding cache is not used, so the timings include the image encoder.
+"""
+import argparse
+import json
+import time
+from functools import partial
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from data.extract_mask import MaskJob, SAMMaskGenerator, load_job, parse_backend
+from utils.frame_index import frame_paths
+from utils.roi import FullFrameLoader
+
+DEFAULT_BACKENDS = ["vit-huge:int8", "vit-large", "vit-large:int8", "vit-base", "vit-base:traced",
+                    "vit-base:int8", "vit-base:traced:int8"]
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def sample_jobs(exp_path: Path, frames: int) -> List[MaskJob]:
+    bbox_paths = frame_paths(exp_path, "bbox")
+    picks = np.unique(np.linspace(0, len(bbox_paths) - 1, num=min(frames, len(bbox_paths))).round().astype(int))
+    mask_loader = FullFrameLoader(exp_path, "mask")
+    load = partial(load_job, frame_dir=exp_path / "images", mask_dir=exp_path / "masks", mask_loader=mask_loader,
+                   overwrite=True)
+    return [load(bbox_paths[i]) for i in picks]
+
+
+def run_backend(spec: str, jobs: List[MaskJob], checkpoint_dir=None) -> dict:
+    """Masks of ``jobs`` one frame at a time, after a warm-up frame that also traces the encoder"""
+    start = time.perf_counter()
+    generator = SAMMaskGenerator(backend=parse_backend(spec, checkpoint_dir))
+    generator.generate_masks([jobs[0].image], [jobs[0].bbox])
+    setup_seconds = time.perf_counter() - start
+
+    masks, seconds = [], []
+    for job in jobs:
+        start = time.perf_counter()
+        mask = generator.generate_masks([job.image], [job.bbox])[0]
+        seconds.append(time.perf_counter() - start)
+        masks.append(mask[0].numpy() > 0)
+    return {
+        "backend": generator.backend.name,
+        "device": generator.device,
+        "setup_seconds": setup_seconds,
+        "seconds_per_frame": float(np.median(seconds)),
+        "masks": masks,
+    }
+
+
+def select_backend(results: List[Dict], min_iou: float):
+    """The fastest result with a mean IoU of at least ``min_iou``, None when none has"""
+    passing = [result for result in results if result["mean_iou"] >= min_iou]
+    return min(passing, key=lambda result: result["seconds_per_frame"], default=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_path",type=str,help="path to an experiment with images/ and bbox/")
+    parser.add_argument("--backends",type=str,nargs="+",default=DEFAULT_BACKENDS,help="backends to compare")
+    parser.add_argument("--reference",type=str,default="vit-huge",help="backend whose masks count as correct")
+    parser.add_argument("--checkpoint_dir",type=str,default=None,
+                        help="directory with local vit-base/, vit-large/, vit-huge/ checkpoints, used before the hub")
+    parser.add_argument("--frames",type=int,default=20,help="frames sampled evenly from the experiment")
+    parser.add_argument("--min_iou",type=float,default=0.9,help="mean mask IoU against the reference a backend needs")
+    parser.add_argument("--threads",type=int,default=None,help="torch CPU threads, all cores by default")
+    parser.add_argument("--output",type=str,default=None,help="also write the results to this JSON file")
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    checkpoint_dir = Path(args.checkpoint_dir) if args.checkpoint_dir else None
+
+    jobs = sample_jobs(Path(args.exp_path), args.frames)
+    print(f"Benchmarking on {len(jobs)} frames")
+    reference = run_backend(args.reference, jobs, checkpoint_dir)
+    reference.update(mean_iou=1.0, min_iou=1.0)
+    results = [reference]
+    for spec in args.backends:
+        if spec == args.reference:
+            continue
+        result = run_backend(spec, jobs, checkpoint_dir)
+        ious = [mask_iou(mask, expected) for mask, expected in zip(result["masks"], reference["masks"])]
+        result.update(mean_iou=float(np.mean(ious)), min_iou=float(np.min(ious)))
+        results.append(result)
+        # the masks are large, only the reference's are kept
+        del result["masks"]
+        print(f"{result['backend']:>24}: {result['seconds_per_frame']:.3f} s/frame on {result['device']}, "
+              f"IoU mean {result['mean_iou']:.3f} min {result['min_iou']:.3f}")
+    del reference["masks"]
+    print(f"{reference['backend']:>24}: {reference['seconds_per_frame']:.3f} s/frame on {reference['device']} (reference)")
+
+    best = select_backend(results, args.min_iou)
+    if best is None:
+        print(f"No backend reaches a mean IoU of {args.min_iou}")
+    else:
+        print(f"Fastest backend with a mean IoU of at least {args.min_iou}: --backend {best['backend']} "
+              f"({reference['seconds_per_frame'] / best['seconds_per_frame']:.1f}x the reference)")
+    if args.output:
+        with open(args.output, mode="w") as fout:
+            json.dump({"reference": reference["backend"], "min_iou": args.min_iou, "frames": len(jobs),
+                       "selected": None if best is None else best["backend"], "results": results}, fout, indent=2)
@@ -22,6 +22,7 @@ import re
 from tqdm import tqdm
 
 from data.schema import KeyPoints2D, Keypoint2D
+from utils.frame_index import frame_paths
 
 
 if __name__ == "__main__":
@@ -30,8 +31,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
     exp_path = Path(args.exp_path)
     
-    keypoint_dir = exp_path / "keypoints"
-    keypoint_paths = list(keypoint_dir.iterdir())
+    keypoint_paths = frame_paths(exp_path, "keypoints")
 
     output_folder = exp_path/ "openpose-keypoints"
     output_folder.mkdir(parents=True,exist_ok=True)
@@ -8,6 +8,8 @@ import re
 from tqdm import tqdm
 
 from data.schema import BBox, KeyPoints2D, Keypoint2D
+from utils.frame_index import frame_paths
+from utils.image_codec import find_image
 
 
 if __name__ == "__main__":
@@ -20,12 +22,9 @@ if __name__ == "__main__":
     exp_path = Path(args.exp_path)
     height = args.height
     width = args.width
-    keypoint_dir = exp_path / "keypoints"
-    keypoint_paths = list(keypoint_dir.iterdir())
-    keypoint_paths.sort(key=lambda x: int(re.search("\d+",x.name).group()))
-    bbox_dir = exp_path / "bbox"
-    bbox_paths = list(bbox_dir.iterdir())
-    bbox_paths.sort(key=lambda x: int(re.search("\d+",x.name).group()))
+    # in frame order, only the frames data/trim_entries.py kept
+    keypoint_paths = frame_paths(exp_path, "keypoints")
+    bbox_paths = frame_paths(exp_path, "bbox")
   
     annots = exp_path / "annots"
     annots.mkdir(parents=True,exist_ok=True)
@@ -67,7 +66,7 @@ if __name__ == "__main__":
         idx = re.search("\d+",kpath.name).group()
         
         all_annot = {
-            "filename": str(exp_path / "images"/ f"{idx}.png"),
+            "filename": str(find_image(exp_path / "images", idx)),
             "height": height,
             "width" : width,
             "annots": [
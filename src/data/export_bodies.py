@@ -0,0 +1,14 @@
+import argparse
+from pathlib import Path
+
+from utils.body_records import export_bodies_json
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_path",type=str,help="path to the experiment")
+    parser.add_argument("--out_dir",type=str,help="where to write the json files, defaults to EXP_PATH/bodies",default=None)
+    args = parser.parse_args()
+    exp_path = Path(args.exp_path)
+
+    written = export_bodies_json(exp_path, out_dir=Path(args.out_dir) if args.out_dir else None)
+    print(f"Wrote {len(written)} body files")
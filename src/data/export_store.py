@@ -0,0 +1,19 @@
+import argparse
+from pathlib import Path
+
+from utils.capture_store import CaptureStoreReader, export_legacy
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_path",type=str,help="path to the experiment")
+    parser.add_argument("--store_path",type=str,help="path to the capture store, defaults to EXP_PATH/store",default=None)
+    parser.add_argument("--modalities",type=str,nargs="*",help="modalities to export, defaults to all of them",default=None)
+    args = parser.parse_args()
+    exp_path = Path(args.exp_path)
+    store_path = Path(args.store_path) if args.store_path else exp_path / "store"
+
+    reader = CaptureStoreReader(store_path)
+    print(f"Found modalities: {reader.modalities()}")
+    exported = export_legacy(store_path, exp_path, modalities=args.modalities)
+    for modality, count in exported.items():
+        print(f"{modality}: {count} frames")
@@ -0,0 +1,16 @@
+import argparse
+from pathlib import Path
+
+from utils.trajectory import export_camera_json, read_trajectory
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_path",type=str,help="path to the experiment")
+    parser.add_argument("--out_dir",type=str,help="where to write the json files, defaults to EXP_PATH/camera",default=None)
+    args = parser.parse_args()
+    exp_path = Path(args.exp_path)
+
+    trajectory = read_trajectory(exp_path)
+    print(f"Trajectory: {len(trajectory)} poses, {int(trajectory['ok'].sum())} with tracking OK")
+    written = export_camera_json(exp_path, out_dir=Path(args.out_dir) if args.out_dir else None)
+    print(f"Wrote {len(written)} camera files")
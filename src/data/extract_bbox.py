@@ -5,15 +5,15 @@ from data.schema import BBox
 from glob import glob
 from dataclasses import asdict
 from tqdm import tqdm
+from utils.frame_index import frame_paths
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--exp_path",type=str,help="path to the experiment")
     args = parser.parse_args()
     exp_path = Path(args.exp_path)
-    bodies_path = Path(exp_path) / "bodies"
     path_to_save = exp_path / "bbox"
     path_to_save.mkdir(parents=True,exist_ok=True)
-    all_bodie_paths = list(bodies_path.iterdir())
+    all_bodie_paths = frame_paths(exp_path, "bodies")
     for path in tqdm(all_bodie_paths,desc="Extracting BBOX"):
         bbox_obj = BBox.from_path(path=path)
         filename = path.name
@@ -1,70 +1,348 @@
 from abc import ABC
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import List
+import time
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, TypeVar
 from PIL import Image
 from tqdm import tqdm
 from transformers import SamModel, SamProcessor
 import torch
 from torchvision.utils import save_image
 import json
-from pathlib import Path
 import argparse
 import re 
+import numpy as np
+
+from data.mask_propagation import KEYFRAME_DISAGREEMENT, TemporalConfig, TemporalMasker
+from data.schema import KeyPoints2D
+from utils.embedding_cache import DEFAULT_CACHE_BYTES, DEFAULT_CACHE_DIR, EmbeddingCache, image_hash
+from utils.frame_index import frame_paths
+from utils.image_codec import find_image, load_image
+from utils.roi import FullFrameLoader
 
 class MaskGeneratorBase(ABC):
     def generate_mask(self,image:Image,bbox:List[List[List[float]]]):
         pass
 
+    def generate_masks(self, images: List[Image.Image], bboxes: List[List[float]]) -> List[torch.Tensor]:
+        """One ``(1, H, W)`` mask per image and its ``[x0, y0, x1, y1]`` box; one image at a time unless overridden"""
+        return [self.generate_mask(image=image, bbox=[[bbox]]) for image, bbox in zip(images, bboxes)]
+
+SAM_MODEL_ID = "facebook/sam-vit-huge"
+SAM_CHECKPOINTS = {
+    "vit-base": "facebook/sam-vit-base",
+    "vit-large": "facebook/sam-vit-large",
+    "vit-huge": SAM_MODEL_ID,
+}
+BACKEND_OPTIONS = ("traced", "int8")
+
+
+@dataclass
+class SamBackend:
+    """How SAM runs: a checkpoint, optionally with a traced image encoder and int8 dynamic quantization"""
+    checkpoint: str = "vit-huge"  # a key of SAM_CHECKPOINTS, a hub id or a local directory
+    traced: bool = False
+    int8: bool = False
+    checkpoint_dir: Optional[Path] = None  # holds vit-base/, vit-large/, ... saved with save_pretrained
+
+    @property
+    def name(self) -> str:
+        return ":".join([self.checkpoint] + [option for option in BACKEND_OPTIONS if getattr(self, option)])
+
+    def model_path(self) -> str:
+        if self.checkpoint in SAM_CHECKPOINTS:
+            if self.checkpoint_dir is not None and (self.checkpoint_dir / self.checkpoint).is_dir():
+                return str(self.checkpoint_dir / self.checkpoint)
+            return SAM_CHECKPOINTS[self.checkpoint]
+        return self.checkpoint
+
+
+def parse_backend(spec: str, checkpoint_dir: Optional[Path] = None) -> SamBackend:
+    """``checkpoint[:traced][:int8]``, e.g. ``vit-base:traced:int8``"""
+    checkpoint, *options = spec.split(":")
+    unknown = set(options) - set(BACKEND_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown SAM backend options {sorted(unknown)} in {spec}, expected {BACKEND_OPTIONS}")
+    return SamBackend(checkpoint=checkpoint, traced="traced" in options, int8="int8" in options,
+                      checkpoint_dir=checkpoint_dir)
+
+
 class SAMMaskGenerator(MaskGeneratorBase):
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = SamModel.from_pretrained("facebook/sam-vit-huge").to(self.device)
-        self.processor = SamProcessor.from_pretrained("facebook/sam-vit-huge")
+    def __init__(self, backend: SamBackend = SamBackend(), embedding_cache: Optional[EmbeddingCache] = None):
+        self.backend = backend
+        # quantized kernels only exist for the CPU
+        self.device = "cuda" if torch.cuda.is_available() and not backend.int8 else "cpu"
+        model_path = backend.model_path()
+        # the cache keeps embeddings of different checkpoints and precisions apart
+        self.model_id = SAM_CHECKPOINTS.get(backend.checkpoint, model_path)
+        if backend.int8:
+            self.model_id += ":int8"
+        self.model = SamModel.from_pretrained(model_path).eval()
+        if backend.int8:
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = self.model.to(self.device)
+        self.processor = SamProcessor.from_pretrained(model_path)
+        self.embedding_cache = embedding_cache
+        self._traced_encoder = None
     def generate_mask(self, image, bbox)->torch.Tensor:
+        return self.generate_masks([image], [bbox[0][0]])[0]
+
+    def generate_masks(self, images, bboxes) -> List[torch.Tensor]:
+        # one forward pass for the batch; the processor resizes and pads every image on its own
         inputs = self.processor(
-            images=image,
-            input_boxes=bbox,
-            return_tensors="pt").to(self.device)
+            images=images,
+            input_boxes=[[bbox] for bbox in bboxes],
+            return_tensors="pt")
         
         with torch.no_grad():
-        
-            outputs = self.model(**inputs, multimask_output=False)
+            if self.embedding_cache is None and not self.backend.traced:
+                outputs = self.model(**inputs.to(self.device), multimask_output=False)
+            else:
+                # only the prompt encoder and mask decoder run for cached images
+                outputs = self.model(image_embeddings=self.image_embeddings(images, inputs["pixel_values"]),
+                                     input_boxes=inputs["input_boxes"].to(self.device),
+                                     multimask_output=False)
 
         masks = self.processor.image_processor.post_process_masks(outputs.pred_masks.cpu(),
                                                             inputs["original_sizes"].cpu(),
                                                             inputs["reshaped_input_sizes"].cpu())
-        mask = masks[0].squeeze(0).squeeze(0)  # shape (H, W)
-        mask = mask.unsqueeze(0).float()  # convert to (1, H, W) float
-        return mask
+        # shape (H, W) per image, as (1, H, W) float
+        return [mask.squeeze(0).squeeze(0).unsqueeze(0).float() for mask in masks]
+
+    def image_embeddings(self, images, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Image encoder output per image, from the embedding cache where possible"""
+        if self.embedding_cache is None:
+            return self.encode(pixel_values.to(self.device))
+        keys = [image_hash(image) for image in images]
+        embeddings = [self.embedding_cache.get(self.model_id, key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            # the same encoder call the full forward pass makes, once for all misses
+            computed = self.encode(pixel_values[missing].to(self.device)).cpu().numpy()
+            for i, embedding in zip(missing, computed):
+                self.embedding_cache.put(self.model_id, keys[i], embedding)
+                embeddings[i] = embedding
+        return torch.from_numpy(np.stack(embeddings)).to(self.device)
+
+    def encode(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """The image encoder, as a frozen TorchScript graph for a traced backend"""
+        if not self.backend.traced:
+            return self.model.get_image_embeddings(pixel_values)
+        if self._traced_encoder is None:
+            # traced on one image, so it is run one image at a time
+            traced = torch.jit.trace(_ImageEncoder(self.model), pixel_values[:1], check_trace=False)
+            self._traced_encoder = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+        return torch.cat([self._traced_encoder(pixel_values[i:i + 1]) for i in range(len(pixel_values))])
+
+
+class _ImageEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model.get_image_embeddings(pixel_values)
+
+
+@dataclass
+class MaskJob:
+    name: str
+    image: Image.Image
+    bbox: List[float]
+    to_save: Path
+    keypoints: Optional[np.ndarray] = None
+
 
+def load_keypoints(bodies_path: Path) -> Optional[np.ndarray]:
+    """``(N, 2)`` image keypoints of the first body ordered by joint id, None without a body file"""
+    if not bodies_path.exists():
+        return None
+    points = sorted(KeyPoints2D.from_path(bodies_path).points, key=lambda point: point.joint_id)
+    return np.array([[point.x, point.y] for point in points], dtype=np.float64).reshape(-1, 2)
+
+
+def load_job(bbox_path: Path, frame_dir: Path, mask_dir: Path, mask_loader: FullFrameLoader,
+             overwrite: bool = False, bodies_dir: Optional[Path] = None) -> Optional[MaskJob]:
+    """Decode a frame and its box prompt, and its keypoints with ``bodies_dir``; None when the capture already saved its mask"""
+    file_name = re.search("\d+",bbox_path.name).group()
+    with bbox_path.open("r") as fin:
+         bbox_dict = json.load(fp=fin) 
+    bbox = list(bbox_dict.values())[:-1] # ignore confidence
+    
+    image_raw = load_image(find_image(frame_dir, file_name))
+
+    to_save = mask_dir / f"{file_name}.png"
+    # masks from the ZED instance segmentation (zed/person_mask.py) are already in this format
+    if not overwrite and has_full_frame_mask(to_save, image_raw.size, mask_loader):
+        return None
+    keypoints = None if bodies_dir is None else load_keypoints(bodies_dir / f"{file_name}.json")
+    return MaskJob(name=file_name, image=image_raw, bbox=bbox, to_save=to_save, keypoints=keypoints)
+
+
+T = TypeVar("T")
+
+
+def prefetch(load: Callable[..., T], items: Iterable, lookahead: int, workers: int) -> Iterator[T]:
+    """``load(item)`` for every item in order, up to ``lookahead`` items ahead in ``workers`` threads"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        for item in items:
+            pending.append(executor.submit(load, item))
+            if len(pending) >= lookahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class MaskWriter:
+    """Encodes and writes masks in the background, at most ``max_pending`` behind the model"""
+
+    def __init__(self, workers: int = 2, max_pending: int = 16):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending: Deque[Future] = deque()
+        self.max_pending = max_pending
+
+    def submit(self, mask: torch.Tensor, to_save: Path):
+        # the exact call of the per-image path, so the PNG bytes are the same
+        self._pending.append(self._executor.submit(save_image, mask * 255, to_save))
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._executor.shutdown()
+
+
+def has_full_frame_mask(mask_path: Path, image_size, mask_loader: FullFrameLoader) -> bool:
+    """Whether the capture already saved a mask of the whole frame (``image_size`` is ``(width, height)``)"""
+    if not mask_path.exists():
+        return False
+    size = mask_loader.full_size(mask_path)
+    if size is None:
+        with Image.open(mask_path) as mask:
+            size = mask.size
+    return tuple(size) == tuple(image_size)
+
+
+def generate_temporal(jobs: Iterable[MaskJob], sam: Callable[[List[MaskJob]], List[torch.Tensor]],
+                      writer: MaskWriter, masker: TemporalMasker):
+    """SAM on the keyframes ``masker`` picks, the propagated keyframe mask on every other frame"""
+    for job in jobs:
+        reason = masker.keyframe_reason(job.bbox, job.keypoints)
+        if reason is None:
+            width, height = job.image.size
+            mask, agreement = masker.propagate(job.bbox, job.keypoints, width, height)
+            if agreement >= masker.config.min_agreement:
+                masker.propagated()
+                writer.submit(torch.from_numpy(mask).unsqueeze(0).float(), job.to_save)
+                continue
+            reason = KEYFRAME_DISAGREEMENT
+        mask = sam([job])[0]
+        masker.keyframe(mask[0].numpy() > 0, job.bbox, job.keypoints, reason)
+        writer.submit(mask, job.to_save)
 
     
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--exp_path",type=str,help="path to the experiment")
+    parser.add_argument("--overwrite",action="store_true",help="also run SAM on frames the capture already saved a ZED mask for")
+    parser.add_argument("--batch_size",type=int,default=1,
+                        help="frames per SAM forward pass; batches above 1 may round differently from the per-image path")
+    parser.add_argument("--loaders",type=int,default=4,help="threads decoding images and box prompts ahead of the model")
+    parser.add_argument("--writers",type=int,default=2,help="threads encoding and writing masks behind the model")
+    parser.add_argument("--embedding_cache",type=str,default=str(DEFAULT_CACHE_DIR),
+                        help="directory caching SAM image embeddings across runs, '' to always run the image encoder")
+    parser.add_argument("--cache_size_gb",type=float,default=DEFAULT_CACHE_BYTES / 1024 ** 3,
+                        help="evict the least recently used embeddings beyond this size")
+    parser.add_argument("--backend",type=str,default="vit-huge",
+                        help="SAM checkpoint[:traced][:int8], e.g. vit-base:traced:int8; see data/benchmark_sam.py")
+    parser.add_argument("--checkpoint_dir",type=str,default=None,
+                        help="directory with local vit-base/, vit-large/, vit-huge/ checkpoints, used before the hub")
+    parser.add_argument("--temporal",action="store_true",
+                        help="run SAM on keyframes only and warp their masks onto the frames in between; "
+                             "frames are then segmented one at a time")
+    parser.add_argument("--keyframe_stride",type=int,default=TemporalConfig.stride,
+                        help="a keyframe at least every this many frames, 0 for keyframes on change only")
+    parser.add_argument("--keyframe_min_iou",type=float,default=TemporalConfig.min_bbox_iou,
+                        help="new keyframe when the body box overlaps the keyframe's by less than this")
+    parser.add_argument("--keyframe_max_motion",type=float,default=TemporalConfig.max_keypoint_motion,
+                        help="new keyframe when the median keypoint moved more than this fraction of the box diagonal")
+    parser.add_argument("--propagation_min_iou",type=float,default=TemporalConfig.min_agreement,
+                        help="run SAM when the propagated mask's box overlaps the body box by less than this")
     args = parser.parse_args()
     exp_path = Path(args.exp_path)
     frame_dir = exp_path / "images"
-    bbox_dir = exp_path / "bbox"
     mask_dir = exp_path /"masks"
     mask_dir.mkdir(parents=True,exist_ok=True)
 
-    all_bbox_paths = list(bbox_dir.iterdir())
+    all_bbox_paths = frame_paths(exp_path, "bbox")
 
-    mask_generator = SAMMaskGenerator()
+    # loaded on the first frame without a ZED mask
+    mask_generator = None
+    mask_loader = FullFrameLoader(exp_path, "mask")
+    load = partial(load_job, frame_dir=frame_dir, mask_dir=mask_dir, mask_loader=mask_loader, overwrite=args.overwrite,
+                   bodies_dir=exp_path / "bodies" if args.temporal else None)
+    jobs = tqdm(prefetch(load, all_bbox_paths, lookahead=2 * max(args.batch_size, args.loaders), workers=args.loaders),
+                desc="Generating Masks", total=len(all_bbox_paths))
+    writer = MaskWriter(workers=args.writers, max_pending=2 * args.batch_size)
+    masker = TemporalMasker(TemporalConfig(stride=args.keyframe_stride, min_bbox_iou=args.keyframe_min_iou,
+                                           max_keypoint_motion=args.keyframe_max_motion,
+                                           min_agreement=args.propagation_min_iou))
+    generated = 0
+    sam_seconds = 0.0
+    start_all = time.perf_counter()
 
-    for bbox_path in tqdm(all_bbox_paths,desc="Generating Masks"):
-        file_name = re.search("\d+",bbox_path.name).group()
-        with bbox_path.open("r") as fin:
-             bbox_dict = json.load(fp=fin) 
-        bbox_list = list(bbox_dict.values())[:-1] # ignore confidence   
-        bbox = [[bbox_list]]
-        
-        image_path = frame_dir / f"{file_name}.png"
-        image_raw = Image.open(image_path)
-        
-        mask = mask_generator.generate_mask(image=image_raw,
-                                            bbox=bbox)
+    def sam(batch: List[MaskJob]) -> List[torch.Tensor]:
+        global mask_generator, generated, sam_seconds
+        if mask_generator is None:
+            embedding_cache = None
+            if args.embedding_cache:
+                embedding_cache = EmbeddingCache(Path(args.embedding_cache), int(args.cache_size_gb * 1024 ** 3))
+            backend = parse_backend(args.backend, Path(args.checkpoint_dir) if args.checkpoint_dir else None)
+            mask_generator = SAMMaskGenerator(backend=backend, embedding_cache=embedding_cache)
+        start = time.perf_counter()
+        masks = mask_generator.generate_masks([job.image for job in batch], [job.bbox for job in batch])
+        sam_seconds += time.perf_counter() - start
+        generated += len(batch)
+        return masks
 
-        to_save = mask_dir / f"{file_name}.png"
-        save_image(mask * 255,to_save)
+    try:
+        if args.temporal:
+            generate_temporal((job for job in jobs if job is not None), sam, writer, masker)
+        else:
+            for batch in batched((job for job in jobs if job is not None), args.batch_size):
+                for job, mask in zip(batch, sam(batch)):
+                    writer.submit(mask, job.to_save)
+    finally:
+        writer.close()
+    print(f"Kept {len(all_bbox_paths) - generated - masker.stats.propagated} ZED masks, "
+          f"generated {generated} with SAM")
+    if args.temporal:
+        report = masker.stats.report()
+        print(f"Propagated {report['propagated']} of {report['frames']} masks, "
+              f"saving {report['saved_fraction']:.0%} of the SAM calls; keyframes by reason: {report['keyframes_by_reason']}")
+        with (exp_path / "mask-propagation.json").open(mode="w") as fout:
+            json.dump(report, fout, indent=2)
+    if generated:
+        print(f"SAM {mask_generator.backend.name} on {mask_generator.device}: {generated / sam_seconds:.2f} images/s in the model, "
+              f"{generated / (time.perf_counter() - start_all):.2f} images/s overall at batch size "
+              f"{1 if args.temporal else args.batch_size}")
+        if mask_generator.embedding_cache is not None:
+            print(f"Embedding cache: {mask_generator.embedding_cache.report()}")
@@ -0,0 +1,161 @@
+"""Keyframe SAM: propagate masks between keyframes instead of segmenting every frame.
+
+Consecutive sampled frames are nearly identical, so ``TemporalMasker`` only
+asks for SAM on keyframes: the first frame, every ``stride``-th frame, and
+frames whose body box overlaps the keyframe's by less than ``min_bbox_iou``
+or whose keypoints moved more than ``max_keypoint_motion`` of the box
+diagonal (median). Every other frame gets the last keyframe's mask warped by
+the affine transform that best maps the keyframe's box corners and
+keypoints onto the frame's. When the bounding box of the warped mask
+overlaps the frame's body box by less than ``min_agreement``, the frame goes
+to SAM after all and becomes the new keyframe.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+KEYFRAME_FIRST = "first"
+KEYFRAME_STRIDE = "stride"
+KEYFRAME_BBOX = "bbox"
+KEYFRAME_KEYPOINTS = "keypoints"
+KEYFRAME_DISAGREEMENT = "disagreement"
+
+
+@dataclass
+class TemporalConfig:
+    stride: int = 10  # at most this many frames per keyframe, 0 for no limit
+    min_bbox_iou: float = 0.7
+    max_keypoint_motion: float = 0.1
+    min_agreement: float = 0.8
+
+
+def bbox_iou(a, b) -> float:
+    """IoU of two ``[x0, y0, x1, y1]`` boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    intersection = max(width, 0) * max(height, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def _corners(bbox) -> np.ndarray:
+    x0, y0, x1, y1 = bbox
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float64)
+
+
+def _common_keypoints(a: Optional[np.ndarray], b: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Keypoints detected in both frames; the SDK leaves undetected ones NaN or negative."""
+    if a is None or b is None or len(a) != len(b):
+        return np.zeros((0, 2)), np.zeros((0, 2))
+    valid = np.isfinite(a).all(axis=1) & np.isfinite(b).all(axis=1) & (a >= 0).all(axis=1) & (b >= 0).all(axis=1)
+    return a[valid], b[valid]
+
+
+def keypoint_motion(key_keypoints: Optional[np.ndarray], keypoints: Optional[np.ndarray], bbox) -> Optional[float]:
+    """Median keypoint displacement as a fraction of the box diagonal, None without common keypoints."""
+    a, b = _common_keypoints(key_keypoints, keypoints)
+    if not len(a):
+        return None
+    diagonal = float(np.hypot(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    return float(np.median(np.linalg.norm(b - a, axis=1))) / diagonal if diagonal > 0 else None
+
+
+def estimate_affine(key_bbox, bbox, key_keypoints: Optional[np.ndarray] = None,
+                    keypoints: Optional[np.ndarray] = None) -> np.ndarray:
+    """Least-squares ``2 x 3`` affine from the keyframe to the frame, fitted on box corners and keypoints."""
+    a, b = _common_keypoints(key_keypoints, keypoints)
+    source = np.concatenate([_corners(key_bbox), a])
+    target = np.concatenate([_corners(bbox), b])
+    design = np.concatenate([source, np.ones((len(source), 1))], axis=1)
+    solution, *_ = np.linalg.lstsq(design, target, rcond=None)
+    return solution.T
+
+
+def warp_mask(mask: np.ndarray, affine: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Nearest-neighbour warp of a boolean ``mask`` into a ``height`` x ``width`` frame."""
+    matrix = np.vstack([affine, [0.0, 0.0, 1.0]])
+    try:
+        inverse = np.linalg.inv(matrix)
+    except np.linalg.LinAlgError:
+        return np.zeros((height, width), dtype=bool)
+    image = Image.fromarray(mask.astype(np.uint8) * 255)
+    # PIL maps output pixels back into the input
+    warped = image.transform((width, height), Image.AFFINE, tuple(inverse[:2].ravel()), resample=Image.NEAREST)
+    return np.asarray(warped) > 127
+
+
+def mask_bbox(mask: np.ndarray) -> Optional[List[float]]:
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return None
+    return [float(cols[0]), float(rows[0]), float(cols[-1] + 1), float(rows[-1] + 1)]
+
+
+@dataclass
+class TemporalStats:
+    frames: int = 0
+    propagated: int = 0
+    keyframes: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def sam_calls(self) -> int:
+        return sum(self.keyframes.values())
+
+    def report(self) -> dict:
+        return {
+            "frames": self.frames,
+            "sam_calls": self.sam_calls,
+            "propagated": self.propagated,
+            "sam_calls_saved": self.propagated,
+            "saved_fraction": self.propagated / self.frames if self.frames else 0.0,
+            "keyframes_by_reason": dict(self.keyframes),
+        }
+
+
+class TemporalMasker:
+    """Decides per frame, in frame order, between SAM and propagating the last keyframe's mask."""
+
+    def __init__(self, config: TemporalConfig = TemporalConfig()):
+        self.config = config
+        self.stats = TemporalStats()
+        self._mask: Optional[np.ndarray] = None
+        self._bbox = None
+        self._keypoints: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+
+    def keyframe_reason(self, bbox, keypoints: Optional[np.ndarray] = None) -> Optional[str]:
+        """Why this frame needs SAM, None when the keyframe mask can be propagated to it."""
+        if self._mask is None:
+            return KEYFRAME_FIRST
+        if self.config.stride and self._since_keyframe >= self.config.stride:
+            return KEYFRAME_STRIDE
+        if bbox_iou(self._bbox, bbox) < self.config.min_bbox_iou:
+            return KEYFRAME_BBOX
+        motion = keypoint_motion(self._keypoints, keypoints, bbox)
+        if motion is not None and motion > self.config.max_keypoint_motion:
+            return KEYFRAME_KEYPOINTS
+        return None
+
+    def propagate(self, bbox, keypoints: Optional[np.ndarray], width: int, height: int
+                  ) -> Tuple[np.ndarray, float]:
+        """The keyframe mask warped onto this frame, and how well its box agrees with ``bbox``."""
+        affine = estimate_affine(self._bbox, bbox, self._keypoints, keypoints)
+        mask = warp_mask(self._mask, affine, width, height)
+        box = mask_bbox(mask)
+        return mask, 0.0 if box is None else bbox_iou(box, bbox)
+
+    def keyframe(self, mask: np.ndarray, bbox, keypoints: Optional[np.ndarray], reason: str):
+        """Record a frame SAM segmented."""
+        self._mask, self._bbox, self._keypoints = mask, list(bbox), keypoints
+        self._since_keyframe = 1
+        self.stats.frames += 1
+        self.stats.keyframes[reason] = self.stats.keyframes.get(reason, 0) + 1
+
+    def propagated(self):
+        """Record a frame that got the propagated mask."""
+        self._since_keyframe += 1
+        self.stats.frames += 1
+        self.stats.propagated += 1
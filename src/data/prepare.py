@@ -1,57 +1,91 @@
 import argparse
 from dataclasses import astuple
+from functools import partial
 import json
-import os
 from pathlib import Path
-from glob import glob
-import re
-import shutil
-from typing import Tuple, List
+from typing import Optional
+import numpy as np
 import pandas as pd
 
+from utils.frame_index import read_frame_index
+from utils.manifest import load_manifest
+from utils.materialize import AUTO, MODES, Materializer
+from utils.roi import FullFrameLoader
 from utils.data_utils import get_bbox_2d_from_raw_bodies, get_keypoints_2d_from_raw_bodies, read_json
 
-def create_dataframe(paths:list):
-
-  data = [
-      {
-          "id": int(re.search("\d+",os.path.basename(path)).group()),
-          "path": str(path)
-      }
-      for path in paths
-  ]
-  return pd.DataFrame(data)
-
-def move_all_files(entry:pd.Series,keypoint_dir:Path,image_dir:Path,depth_dir:Path):
-    # print(entry)
-    new_id = entry['id']
-    old_keypoint_path = entry['keypoint']
-    old_image_path = entry['image']
-    old_depth_map_path = entry['depth_map']
-
-    # Define new file paths
-    new_keypoint_path = keypoint_dir / f"{new_id:05}.json"
-    new_image_path = image_dir / f"{new_id:05}.png"
-    new_depth_map_path = depth_dir / f"{new_id:05}.npy"
-
-    try:
-        # Copy files to new locations
-        shutil.copy(src=old_keypoint_path, dst=str(new_keypoint_path))
-        shutil.copy(src=old_image_path, dst=str(new_image_path))
-        shutil.copy(src=old_depth_map_path, dst=str(new_depth_map_path))
-
-        # Update entry with new file paths
-        entry['keypoint'] = str(new_keypoint_path)
-        entry['image'] = str(new_image_path)
-        entry['depth_map'] = str(new_depth_map_path)
-
-    except FileNotFoundError as e:
-        print(f"Error: {e}")
-        # Optionally, log or handle the error in a way that suits your needs
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-    return entry
+_depth_loaders = {}
+
+def place_depth_map(src: Path, dst: Path, materializer: Materializer) -> Path:
+    """Link or copy a depth map; ROI crops are pasted back into a full-frame .npy"""
+    exp_path = Path(src).parent.parent
+    loader = _depth_loaders.get(exp_path)
+    if loader is None:
+        loader = _depth_loaders[exp_path] = FullFrameLoader(exp_path, "depth")
+    if loader.roi(loader.frame_id(src)) is None:
+        materializer.place(src, dst)
+        return dst
+    dst = dst.with_suffix(".npy")
+    # never write through a link a previous run left to a capture file
+    dst.unlink(missing_ok=True)
+    np.save(dst, loader.load(src))
+    return dst
+
+def place_file(src: Path, dst: Path, materializer: Materializer) -> Path:
+    materializer.place(src, dst)
+    return dst
+
+def _report_errors(place):
+    """Frames whose files could not be placed are left out of annotation.csv"""
+    def wrapped(src: Path, dst: Path) -> Optional[Path]:
+        try:
+            return place(src, dst)
+        except OSError as e:
+            print(f"Error: {e}")
+            return None
+    return wrapped
+
+def format_dir(input_path: Path, output_path: Path, materializer: Materializer, rescan: bool = False) -> pd.DataFrame:
+    """Renumber the frames with keypoints, an image and a depth map into ``output_path``"""
+    manifest = load_manifest(input_path, rescan=rescan)
+    frame_ids = manifest.frame_ids("keypoint", "image", "depth_map")
+    index = read_frame_index(input_path)
+    if index is not None:
+        # only the frames data/trim_entries.py kept, in its order
+        complete = set(frame_ids)
+        frame_ids = [int(stem) for stem in index.stems if int(stem) in complete]
+    print(f"{len(frame_ids)} complete frames in {input_path}")
+
+    IMAGE_DIR = output_path / "images"
+    KEYPOINT_DIR = output_path / "keypoints"
+    DEPTH_MAP_DIR = output_path / "depth-maps"
+
+    IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+    KEYPOINT_DIR.mkdir(parents=True, exist_ok=True)
+    DEPTH_MAP_DIR.mkdir(parents=True, exist_ok=True)
+
+    keypoints, images, depth_maps = [], [], []
+    for new_id, frame in enumerate(frame_ids):
+        image = manifest.path("image", frame)
+        depth_map = manifest.path("depth_map", frame)
+        keypoints.append((manifest.path("keypoint", frame), KEYPOINT_DIR / f"{new_id:05}.json"))
+        images.append((image, IMAGE_DIR / f"{new_id:05}{image.suffix}"))
+        depth_maps.append((depth_map, DEPTH_MAP_DIR / f"{new_id:05}{depth_map.suffix}"))
+
+    columns = {
+        "keypoint": materializer.run(keypoints, desc="Keypoints",
+                                     place=_report_errors(partial(place_file, materializer=materializer))),
+        "image": materializer.run(images, desc="Images",
+                                  place=_report_errors(partial(place_file, materializer=materializer))),
+        "depth_map": materializer.run(depth_maps, desc="Depth maps",
+                                      place=_report_errors(partial(place_depth_map, materializer=materializer))),
+    }
+    all_df = pd.DataFrame({"id": range(len(frame_ids)),
+                           **{key: [None if path is None else str(path) for path in paths]
+                              for key, paths in columns.items()}})
+    incomplete = all_df.isna().any(axis=1)
+    if incomplete.any():
+        print(f"Leaving {int(incomplete.sum())} frames with missing files out of annotation.csv")
+    return all_df[~incomplete]
 
 def create_easymocap_annotation(entry:pd.Series,annot_dir:Path,width:int=1280,height:int=720):
     id = entry['id']
@@ -102,6 +136,11 @@ def main():
                         help="Flag to format the directory structure")
     parser.add_argument("-emc", "--easymocap_prepare", action="store_true",
                         help="Flag to format the directory structure")
+    parser.add_argument("--link_mode", type=str, default=AUTO, choices=list(MODES),
+                        help="How files reach the output: reflink, hardlink (shares the file with the capture), "
+                             "copy, or auto (the first that works, copying only across filesystems)")
+    parser.add_argument("--workers", type=int, default=8, help="Threads placing files")
+    parser.add_argument("--rescan", action="store_true", help="Rescan the experiment instead of using its cached manifest")
     
     args = parser.parse_args()
 
@@ -110,43 +149,13 @@ def main():
 
 
     if args.format_dir:
-
-        input_path = Path(args.input_exp_path)
-        
-        image_pattern=str(input_path / '**' / '*.png')
-        depth_pattern=str(input_path / '**' / '*.npy')
-        keypoint_pattern=str(input_path / '**' / '*.json')
-
-        image_paths = glob(image_pattern,recursive=True) 
-        depth_paths = glob(depth_pattern,recursive=True) 
-        keypoint_paths = glob(keypoint_pattern,recursive=True)
-
-        images_df = create_dataframe(image_paths)
-        depth_map_df = create_dataframe(depth_paths)
-        keypoints_df = create_dataframe(keypoint_paths)
-
-        columns_map= {
-            "path_x": "keypoint",
-            "path_y": "image",
-            "path":"depth_map"
-        }
-        all_df = keypoints_df.merge(images_df,on="id",how="inner")\
-                            .merge(depth_map_df,on="id",how="inner")\
-                            .sort_values("id")\
-                            .rename(columns=columns_map)
-        # create new index
-        all_df['id'] = range(len(all_df))
-        
-        IMAGE_DIR = output_path / "images"
-        KEYPOINT_DIR = output_path / "keypoints"
-        DEPTH_MAP_DIR = output_path / "depth-maps"
-
-        IMAGE_DIR.mkdir(parents=True, exist_ok=True)
-        KEYPOINT_DIR.mkdir(parents=True, exist_ok=True)
-        DEPTH_MAP_DIR.mkdir(parents=True, exist_ok=True)
-
-        all_df = all_df.apply(move_all_files,axis=1,args=(KEYPOINT_DIR,IMAGE_DIR,DEPTH_MAP_DIR))
+        materializer = Materializer(mode=args.link_mode, workers=args.workers)
+        all_df = format_dir(Path(args.input_exp_path), output_path, materializer, rescan=args.rescan)
         all_df.to_csv(output_path/"annotation.csv",index=False)
+        report = materializer.report()
+        print(f"Placed {report['files']} files ({report['bytes'] / 1e6:.1f} MB) in {report['seconds']:.1f}s: "
+              f"{report['files_per_second']:.0f} files/s, {report['megabytes_per_second']:.1f} MB/s, "
+              f"by method {report['methods']}")
 
     if args.easymocap_prepare:
         df = pd.read_csv(output_path/"annotation.csv")
@@ -1,109 +1,49 @@
-
 import argparse
-import os
 from pathlib import Path
-import re
-from typing import List
-
-import pandas as pd
-
-def sort_by_index(paths:List[Path]):
-    return sorted(paths,key=lambda x: int(re.search("\d+",x.name).group()))
-
-def create_dataframe(paths:list,key):
 
-  data = [
-      {
-          "id": int(re.search("\d+",os.path.basename(path)).group()),
-            key: path
-      }
-      for path in paths
-  ]
-  return pd.DataFrame(data)
+from utils.frame_index import COMPACTION_FILE, FrameIndex, compact_experiment, write_frame_index
+from utils.manifest import MODALITY_DIRS, load_manifest
 
-def rename_paths(entry:pd.Series,
-                 bodies_dir,
-                 image_dir,
-                 camera_dir,
-                 depth_dir
-                 ):
-    new_id = entry['new_id']
+# a frame is kept when it has a file in every one of these that the capture wrote
+TRIM_DIRS = ("bodies", "images", "camera", "depth-maps")
 
-    old_body_path = entry['body']
-    old_image_path = entry['image']
-    old_camera_path = entry['camera']
-    old_depth_map_path = entry['depth-map']
 
+def build_frame_index(exp_path: Path, rescan: bool = False) -> FrameIndex:
+    manifest = load_manifest(exp_path, rescan=rescan)
+    directories = [directory for directory in TRIM_DIRS if MODALITY_DIRS[directory] in manifest.files]
+    missing = sorted(set(TRIM_DIRS) - set(directories))
+    if missing:
+        print(f"No {missing} in {exp_path}, trimming on {directories}")
+    frames = manifest.frame_ids(*(MODALITY_DIRS[directory] for directory in directories))
+    files = {
+        directory: [Path(manifest.files[MODALITY_DIRS[directory]][frame]).name for frame in frames]
+        for directory in directories
+    }
+    stems = [files[directories[0]][i].split(".", 1)[0] for i in range(len(frames))] if directories else []
+    all_frames = set().union(*(manifest.files[MODALITY_DIRS[directory]] for directory in directories))
+    print(f"Keeping {len(frames)} of {len(all_frames)} frames")
+    return FrameIndex(stems=stems, files=files)
 
-    # Define new file paths
-    new_body_path = bodies_dir / f"{new_id:05}.json"
-    new_image_path = image_dir / f"{new_id:05}.png"
-    new_camera_path = camera_dir / f"{new_id:05}.json"
-    new_depth_map_path = depth_dir / f"{new_id:05}.npy"
 
-    try:
-        # Rename files 
-        os.rename(src=old_body_path, dst=str(new_body_path))
-        os.rename(src=old_image_path, dst=str(new_image_path))
-        os.rename(src=old_camera_path, dst=str(new_camera_path))
-        os.rename(src=old_depth_map_path, dst=str(new_depth_map_path))
-
-    except FileNotFoundError as e:
-        print(f"Error: {e}")
-        # Optionally, log or handle the error in a way that suits your needs
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-    return entry
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--exp_path",type=str,help="path to the experiment")
+    parser.add_argument("--compact",action="store_true",
+                        help="Also delete the dropped frames and rename the files to the dense numbering "
+                             "(resumes an interrupted compaction)")
+    parser.add_argument("--workers",type=int,default=8,help="Threads renaming and deleting files when compacting")
+    parser.add_argument("--rescan",action="store_true",help="Rescan the experiment instead of using its cached manifest")
 
     args = parser.parse_args()
     exp_path = Path(args.exp_path)
-    
-    bodies_dir = exp_path / "bodies"
-    image_dir = exp_path / "images"
-    camera_dir = exp_path / "camera"
-    depth_dir = exp_path / "depth-maps"
-
-    bodies_paths = sort_by_index(list(bodies_dir.iterdir()))
-    image_paths =  sort_by_index(list(image_dir.iterdir()))
-    camera_paths = sort_by_index(list(camera_dir.iterdir()))
-    depth_paths =  sort_by_index(list(depth_dir.iterdir()))
-    
-    bodies_df = create_dataframe(bodies_paths,key="body")
-    image_df  = create_dataframe(image_paths,key="image")
-    camera_df = create_dataframe(camera_paths,key="camera")
-    depth_df  = create_dataframe(depth_paths,key="depth-map")
-
-    full_df = (
-                bodies_df
-                .merge(image_df,  on="id", how="outer")
-                .merge(camera_df, on="id", how="outer")
-                .merge(depth_df,  on="id", how="outer")
-            )
-       
-    nan_entries = full_df[full_df.isna().any(axis=1)]
-    # print(nan_entries)
-    to_delete = []
-    
-    for idx,entry in nan_entries.iterrows():
-        entry_dict = list(entry.to_dict().values())
-        # print(entry_dict)
-        for path in entry_dict:
-            if path and isinstance(path,(str,Path)):
-                to_delete.append(path)
 
-    if to_delete:
-        for dentry in to_delete:
-            print(f"Deleting {dentry}")
-            os.remove(dentry)
-        
+    if (exp_path / COMPACTION_FILE).exists():
+        if not args.compact:
+            print("A compaction of this experiment was interrupted, rerun with --compact to finish it")
+            exit(1)
     else:
-        print("No files to be deleted!")
+        write_frame_index(exp_path, build_frame_index(exp_path, rescan=args.rescan))
 
-    # Process clean entries
-    clean_df = full_df.dropna().reset_index(drop=True)
-    clean_df['new_id'] = list(range(len(clean_df)))
-    clean_df.apply(rename_paths,axis=1,args=(bodies_dir,image_dir,camera_dir,depth_dir))
\ No newline at end of file
+    if args.compact:
+        counts = compact_experiment(exp_path, workers=args.workers)
+        print(f"Renamed {counts['renamed']} and deleted {counts['deleted']} files")
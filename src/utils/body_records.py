@@ -0,0 +1,143 @@
+"""Compact binary body tracking records.
+
+Every tracked body of a sampled frame becomes one fixed-size record of
+``body_record_dtype``. A session appends them to ``body-records.bin`` (plus a
+``body-records.json`` header holding the dtype), which reads back as a single
+structured array. ``export_bodies_json`` regenerates the legacy
+``bodies/NNNNN.json`` files the ``data/`` scripts consume.
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+RECORDS_FILE = "body-records.bin"
+RECORDS_HEADER = "body-records.json"
+RECORDS_VERSION = 1
+NUM_KEYPOINTS_BODY_38 = 38
+
+
+def body_record_dtype(num_keypoints: int = NUM_KEYPOINTS_BODY_38) -> np.dtype:
+    return np.dtype([
+        ("frame_id", "<i8"),
+        ("timestamp", "<i8"),
+        ("body_id", "<i4"),
+        ("confidence", "<f4"),
+        ("action_state", "S32"),
+        ("keypoints_2d", "<f4", (num_keypoints, 2)),
+        ("keypoints_3d", "<f4", (num_keypoints, 3)),
+        ("keypoint_confidence", "<f4", (num_keypoints,)),
+        ("bounding_box_2d", "<f4", (4, 2)),
+        ("bounding_box_3d", "<f4", (8, 3)),
+    ])
+
+
+def _box_corners(box: np.ndarray, keys: str) -> list:
+    # NaN corners stand for a box the SDK did not provide
+    if np.isnan(box).all():
+        return []
+    return [dict(zip(keys, corner)) for corner in box.tolist()]
+
+
+def records_to_frame_data(records: np.ndarray, timestamp: Optional[int] = None) -> dict:
+    """Rebuild the dict ZedRetrieval.extract_keypoints_and_masks used to produce for one frame."""
+    if timestamp is None:
+        timestamp = int(records["timestamp"][0]) if len(records) else 0
+    bodies = []
+    for record in records:
+        num_keypoints = len(record["keypoints_2d"])
+        bodies.append({
+            'id': int(record["body_id"]),
+            'confidence': float(record["confidence"]),
+            'action_state': record["action_state"].decode(),
+            'keypoints_2d': [
+                {'joint_id': i, 'x': x, 'y': y}
+                for i, (x, y) in zip(range(num_keypoints), record["keypoints_2d"].tolist())
+            ],
+            'keypoints_3d': [
+                {'joint_id': i, 'x': x, 'y': y, 'z': z}
+                for i, (x, y, z) in zip(range(num_keypoints), record["keypoints_3d"].tolist())
+            ],
+            'bounding_box_2d': _box_corners(record["bounding_box_2d"], "xy"),
+            'bounding_box_3d': _box_corners(record["bounding_box_3d"], "xyz"),
+            'mask': None
+        })
+    return {'bodies': bodies, 'timestamp': timestamp}
+
+
+class BodyRecordWriter:
+    """Appends record arrays to ``body-records.bin``; safe to share between writer threads."""
+
+    def __init__(self, exp_path: Path):
+        self.path = Path(exp_path) / RECORDS_FILE
+        self.header_path = Path(exp_path) / RECORDS_HEADER
+        self.dtype = None
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, records: np.ndarray):
+        if not len(records):
+            return
+        with self._lock:
+            if self._file is None:
+                self.dtype = records.dtype
+                with self.header_path.open(mode="w") as fout:
+                    json.dump({
+                        "version": RECORDS_VERSION,
+                        "dtype": np.lib.format.dtype_to_descr(records.dtype),
+                    }, fout, indent=4)
+                self._file = self.path.open(mode="ab")
+            elif records.dtype != self.dtype:
+                raise ValueError(f"Record dtype changed mid-session: {records.dtype} != {self.dtype}")
+            self._file.write(records.tobytes())
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def descr_to_dtype(descr) -> np.dtype:
+    # JSON turns the descr tuples into lists
+    return np.lib.format.descr_to_dtype([tuple(field) for field in descr])
+
+
+def read_body_records(exp_path: Path) -> np.ndarray:
+    """The whole session's records in one read, ordered by frame id."""
+    exp_path = Path(exp_path)
+    with (exp_path / RECORDS_HEADER).open(mode="r") as fin:
+        header = json.load(fin)
+    records = np.fromfile(exp_path / RECORDS_FILE, dtype=descr_to_dtype(header["dtype"]))
+    # writer threads may append frames out of order
+    return records[np.argsort(records["frame_id"], kind="stable")]
+
+
+def iter_frames(records: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield ``(frame_id, records)`` for each frame of a frame-id sorted record array."""
+    if not len(records):
+        return
+    frame_ids = records["frame_id"]
+    bounds = np.flatnonzero(np.diff(frame_ids)) + 1
+    for group in np.split(records, bounds):
+        yield int(group["frame_id"][0]), group
+
+
+def export_bodies_json(exp_path: Path, out_dir: Optional[Path] = None) -> Dict[int, Path]:
+    """Write ``bodies/NNNNN.json`` for every frame with at least one tracked body."""
+    exp_path = Path(exp_path)
+    out_dir = Path(out_dir) if out_dir else exp_path / "bodies"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = {}
+    for frame_id, group in iter_frames(read_body_records(exp_path)):
+        # ZedSaver numbers files from counter + 1
+        save_to = out_dir / f"{frame_id + 1:05}.json"
+        with save_to.open(mode="w") as fout:
+            json.dump(records_to_frame_data(group), fout, indent=2)
+        written[frame_id] = save_to
+    logger.info(f"Exported {len(written)} body frames to {out_dir}")
+    return written
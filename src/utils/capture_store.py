@@ -0,0 +1,335 @@
+"""Append-only, chunked container for capture sessions.
+
+Layout of a store (one directory per modality)::
+
+    store/
+    └── depth/
+        ├── header.json        # kind, shape, dtype, resolution, chunk size, ...
+        ├── index.bin          # fixed-size records, one per frame
+        ├── chunk-00000.npy    # fixed-shape frames: (chunk_frames, *shape) memmap
+        └── chunk-00001.npy
+
+Fixed-shape modalities (depth) are ``array`` streams written into ``.npy``
+memmaps, variable-size ones (encoded PNGs, JSON) are ``blob`` streams appended
+to ``chunk-XXXXX.bin`` files and located through an offset index. Both are
+safe to append to from several writer threads.
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from utils.body_records import descr_to_dtype, records_to_frame_data
+from utils.depth_codec import DEFAULT_DEPTH_SCALE
+from utils.trajectory import TRAJECTORY_DTYPE
+
+HEADER_FILE = "header.json"
+INDEX_FILE = "index.bin"
+STORE_VERSION = 1
+
+ARRAY_INDEX_DTYPE = np.dtype([("frame_id", "<i8"), ("slot", "<i8")])
+BLOB_INDEX_DTYPE = np.dtype([("frame_id", "<i8"), ("chunk", "<i4"), ("length", "<i4"), ("offset", "<i8")])
+
+
+def read_header(stream_dir: Path) -> dict:
+    with open(stream_dir / HEADER_FILE, mode="r") as fin:
+        return json.load(fin)
+
+
+def _write_header(stream_dir: Path, header: dict):
+    with open(stream_dir / HEADER_FILE, mode="w") as fout:
+        json.dump(header, fout, indent=4)
+
+
+class _ArrayStreamWriter:
+    def __init__(self, stream_dir: Path, shape: Tuple[int, ...], dtype, chunk_frames: int,
+                 resolution: Optional[Tuple[int, int]] = None, extra: Optional[dict] = None):
+        self.dir = stream_dir
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk_frames = chunk_frames
+        self.header = {
+            "version": STORE_VERSION,
+            "kind": "array",
+            "shape": list(self.shape),
+            "dtype": self.dtype.str,
+            "resolution": list(resolution) if resolution else None,
+            "chunk_frames": chunk_frames,
+            **(extra or {}),
+        }
+        _write_header(self.dir, self.header)
+        self._lock = threading.Lock()
+        self._index = open(self.dir / INDEX_FILE, mode="ab")
+        self._next_slot = 0
+        # chunk number -> [memmap, frames written]; full chunks are flushed and dropped
+        self._chunks: Dict[int, list] = {}
+
+    def _chunk(self, chunk: int) -> list:
+        entry = self._chunks.get(chunk)
+        if entry is None:
+            path = self.dir / f"chunk-{chunk:05}.npy"
+            mm = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype,
+                                           shape=(self.chunk_frames, *self.shape))
+            entry = self._chunks[chunk] = [mm, 0]
+        return entry
+
+    def append(self, frame_id: int, array: np.ndarray):
+        if array.shape != self.shape:
+            raise ValueError(f"Frame shape {array.shape} does not match stream shape {self.shape}")
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot += 1
+            chunk, row = divmod(slot, self.chunk_frames)
+            entry = self._chunk(chunk)
+        # the copy itself runs outside the lock so writers fill slots in parallel
+        entry[0][row] = array
+        with self._lock:
+            self._index.write(np.array([(frame_id, slot)], dtype=ARRAY_INDEX_DTYPE).tobytes())
+            self._index.flush()
+            entry[1] += 1
+            if entry[1] == self.chunk_frames:
+                entry[0].flush()
+                del self._chunks[chunk]
+
+    def close(self):
+        with self._lock:
+            for mm, _ in self._chunks.values():
+                mm.flush()
+            self._chunks.clear()
+            self._index.close()
+
+
+class _BlobStreamWriter:
+    def __init__(self, stream_dir: Path, ext: str, chunk_bytes: int, extra: Optional[dict] = None):
+        self.dir = stream_dir
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_bytes = chunk_bytes
+        self.header = {
+            "version": STORE_VERSION,
+            "kind": "blob",
+            "ext": ext,
+            "chunk_bytes": chunk_bytes,
+            **(extra or {}),
+        }
+        _write_header(self.dir, self.header)
+        self._lock = threading.Lock()
+        self._index = open(self.dir / INDEX_FILE, mode="ab")
+        self._chunk = -1
+        self._data = None
+        self._offset = 0
+
+    def _roll(self):
+        if self._data is not None:
+            self._data.close()
+        self._chunk += 1
+        self._data = open(self.dir / f"chunk-{self._chunk:05}.bin", mode="ab")
+        self._offset = 0
+
+    def append(self, frame_id: int, data: bytes):
+        with self._lock:
+            if self._data is None or (self._offset and self._offset + len(data) > self.chunk_bytes):
+                self._roll()
+            self._data.write(data)
+            self._data.flush()
+            record = (frame_id, self._chunk, len(data), self._offset)
+            self._offset += len(data)
+            self._index.write(np.array([record], dtype=BLOB_INDEX_DTYPE).tobytes())
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+            self._index.close()
+
+
+class CaptureStoreWriter:
+    """Creates one stream per modality on first use."""
+
+    def __init__(self, root: Path, chunk_frames: int = 64, chunk_bytes: int = 1 << 30):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunk_frames = chunk_frames
+        self.chunk_bytes = chunk_bytes
+        self._streams: Dict[str, Union[_ArrayStreamWriter, _BlobStreamWriter]] = {}
+        self._lock = threading.Lock()
+
+    def append_array(self, modality: str, frame_id: int, array: np.ndarray,
+                     resolution: Optional[Tuple[int, int]] = None, **extra):
+        array = np.asarray(array)
+        with self._lock:
+            stream = self._streams.get(modality)
+            if stream is None:
+                stream = self._streams[modality] = _ArrayStreamWriter(
+                    self.root / modality, array.shape, array.dtype, self.chunk_frames,
+                    resolution=resolution, extra=extra)
+        stream.append(frame_id, array)
+
+    def append_blob(self, modality: str, frame_id: int, data: bytes, ext: str, **extra):
+        with self._lock:
+            stream = self._streams.get(modality)
+            if stream is None:
+                stream = self._streams[modality] = _BlobStreamWriter(
+                    self.root / modality, ext, self.chunk_bytes, extra=extra)
+        stream.append(frame_id, data)
+
+    def close(self):
+        with self._lock:
+            for stream in self._streams.values():
+                stream.close()
+            self._streams.clear()
+
+
+class _StreamReader:
+    index_dtype: np.dtype
+
+    def __init__(self, stream_dir: Path):
+        self.dir = Path(stream_dir)
+        self.header = read_header(self.dir)
+        index_path = self.dir / INDEX_FILE
+        self.index = np.fromfile(index_path, dtype=self.index_dtype) if index_path.exists() \
+            else np.empty(0, dtype=self.index_dtype)
+        self._rows = {int(frame_id): row for row, frame_id in enumerate(self.index["frame_id"])}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, frame_id: int):
+        return frame_id in self._rows
+
+    @property
+    def frame_ids(self) -> np.ndarray:
+        return np.sort(self.index["frame_id"])
+
+    def row(self, frame_id: int) -> int:
+        try:
+            return self._rows[frame_id]
+        except KeyError:
+            raise KeyError(f"Frame {frame_id} not found in {self.dir}") from None
+
+    def get(self, frame_id: int):
+        return self.read_row(self.row(frame_id))
+
+    def read_row(self, row: int):
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Tuple[int, object]]:
+        for frame_id in self.frame_ids:
+            yield int(frame_id), self.get(int(frame_id))
+
+
+class ArrayStreamReader(_StreamReader):
+    index_dtype = ARRAY_INDEX_DTYPE
+
+    def __init__(self, stream_dir: Path):
+        super().__init__(stream_dir)
+        self.shape = tuple(self.header["shape"])
+        self.dtype = np.dtype(self.header["dtype"])
+        self.chunk_frames = self.header["chunk_frames"]
+        self._chunks: Dict[int, np.ndarray] = {}
+
+    def _chunk(self, chunk: int) -> np.ndarray:
+        mm = self._chunks.get(chunk)
+        if mm is None:
+            mm = self._chunks[chunk] = np.load(self.dir / f"chunk-{chunk:05}.npy", mmap_mode="r")
+        return mm
+
+    def read_row(self, row: int) -> np.ndarray:
+        """Read-only memmap view of one frame."""
+        chunk, offset = divmod(int(self.index["slot"][row]), self.chunk_frames)
+        return self._chunk(chunk)[offset]
+
+
+class BlobStreamReader(_StreamReader):
+    index_dtype = BLOB_INDEX_DTYPE
+
+    def __init__(self, stream_dir: Path):
+        super().__init__(stream_dir)
+        self.ext = self.header["ext"]
+        self._chunks: Dict[int, np.ndarray] = {}
+
+    def _chunk(self, chunk: int) -> np.ndarray:
+        mm = self._chunks.get(chunk)
+        if mm is None:
+            mm = self._chunks[chunk] = np.memmap(self.dir / f"chunk-{chunk:05}.bin", dtype=np.uint8, mode="r")
+        return mm
+
+    def read_row(self, row: int) -> bytes:
+        record = self.index[row]
+        offset = int(record["offset"])
+        return self._chunk(int(record["chunk"]))[offset:offset + int(record["length"])].tobytes()
+
+
+class CaptureStoreReader:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        if not self.root.is_dir():
+            raise FileNotFoundError(f"No capture store at {self.root}")
+        self._streams: Dict[str, _StreamReader] = {}
+
+    def modalities(self) -> List[str]:
+        return sorted(path.parent.name for path in self.root.glob(f"*/{HEADER_FILE}"))
+
+    def stream(self, modality: str) -> Union[ArrayStreamReader, BlobStreamReader]:
+        stream = self._streams.get(modality)
+        if stream is None:
+            stream_dir = self.root / modality
+            kind = read_header(stream_dir)["kind"]
+            stream = ArrayStreamReader(stream_dir) if kind == "array" else BlobStreamReader(stream_dir)
+            self._streams[modality] = stream
+        return stream
+
+    def __getitem__(self, modality: str):
+        return self.stream(modality)
+
+
+# store modality -> (legacy directory, file extension used for array streams)
+LEGACY_LAYOUT: Dict[str, Tuple[str, str]] = {
+    "depth": ("depth-maps", ".npy"),
+    "image": ("images", ".png"),
+    "keypoints": ("bodies", ".json"),
+    "camera": ("camera", ".json"),
+    "mask": ("masks", ".png"),
+    "body-records": ("bodies", ".json"),
+    "trajectory": ("camera", ".json"),
+}
+
+
+def export_legacy(store_root: Path, exp_path: Path, modalities: Optional[List[str]] = None) -> Dict[str, int]:
+    """Write a store back to the one-file-per-frame layout ZedSaver used to produce."""
+    reader = CaptureStoreReader(store_root)
+    exported = {}
+    for modality in modalities or reader.modalities():
+        folder, ext = LEGACY_LAYOUT.get(modality, (modality, ".npy"))
+        out_dir = Path(exp_path) / folder
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stream = reader.stream(modality)
+        for frame_id, value in stream:
+            # ZedSaver numbers files from counter + 1
+            name = f"{frame_id + 1:05}"
+            if isinstance(stream, ArrayStreamReader):
+                scale = stream.header.get("scale", DEFAULT_DEPTH_SCALE)
+                if value.dtype == np.uint16 and scale != DEFAULT_DEPTH_SCALE:
+                    # load_depth assumes millimetres for plain .npy, keep the scale alongside
+                    np.savez_compressed(out_dir / f"{name}.npz", depth=np.asarray(value), scale=np.float32(scale))
+                else:
+                    np.save(out_dir / f"{name}{ext}", np.asarray(value))
+            elif modality == "body-records":
+                records = np.frombuffer(value, dtype=descr_to_dtype(stream.header["dtype"]))
+                with open(out_dir / f"{name}{ext}", mode="w") as fout:
+                    json.dump(records_to_frame_data(records), fout, indent=2)
+            elif modality == "trajectory":
+                record = np.frombuffer(value, dtype=TRAJECTORY_DTYPE)[0]
+                if record["ok"]:
+                    with open(out_dir / f"{name}{ext}", mode="w") as fout:
+                        json.dump({"cam_extrinsics": record["pose"].tolist()}, fout, indent=4)
+            else:
+                with open(out_dir / f"{name}{stream.ext}", mode="wb") as fout:
+                    fout.write(value)
+        exported[modality] = len(stream)
+        logger.info(f"Exported {len(stream)} {modality} frames to {out_dir}")
+    return exported
@@ -0,0 +1,121 @@
+"""Depth map codecs for ``depth-maps/``.
+
+Codecs (values are in the camera's coordinate units, metres by default):
+
+* ``float32``   - lossless, the historical format. NaN/inf kept as is.
+* ``float16``   - half precision. Relative error <= 2**-11 (0.049 %), i.e.
+                  <= 2.5 mm at 5 m and <= 9.8 mm at 20 m. NaN/inf kept;
+                  values above 65504 become inf.
+* ``uint16-mm`` - depth * ``scale`` rounded to integers (millimetres for
+                  ``scale=1000``). Absolute error <= 0.5 / ``scale`` (0.5 mm)
+                  inside [1, 65535] / ``scale`` (1 mm .. 65.535 m). ``0`` is
+                  reserved for invalid pixels: NaN, +/-inf, non-positive or
+                  out-of-range depth all decode to NaN.
+
+Containers: ``npy`` (raw), ``npz`` (``np.savez_compressed``, any codec) and
+``png`` (16-bit grayscale PNG, ``uint16-mm`` only). ``load_depth`` decodes any
+combination back to float32 with NaN for invalid pixels.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+INVALID_DEPTH_U16 = 0
+MAX_DEPTH_U16 = np.iinfo(np.uint16).max
+DEFAULT_DEPTH_SCALE = 1000.0  # metres -> millimetres
+DEPTH_EXTENSIONS = (".npy", ".npz", ".png")
+
+
+class DepthCodec(str, Enum):
+    FLOAT32 = "float32"
+    FLOAT16 = "float16"
+    UINT16_MM = "uint16-mm"
+
+
+class DepthContainer(str, Enum):
+    NPY = "npy"
+    NPZ = "npz"
+    PNG = "png"
+
+
+@dataclass(frozen=True)
+class DepthFormat:
+    codec: DepthCodec = DepthCodec.FLOAT32
+    container: DepthContainer = DepthContainer.NPY
+    scale: float = DEFAULT_DEPTH_SCALE
+
+    def __post_init__(self):
+        object.__setattr__(self, "codec", DepthCodec(self.codec))
+        object.__setattr__(self, "container", DepthContainer(self.container))
+        if self.container == DepthContainer.PNG and self.codec != DepthCodec.UINT16_MM:
+            raise ValueError(f"PNG depth requires the {DepthCodec.UINT16_MM.value} codec, got {self.codec.value}")
+
+    @property
+    def suffix(self) -> str:
+        return f".{self.container.value}"
+
+
+def encode_depth(depth: np.ndarray, codec: DepthCodec = DepthCodec.FLOAT32, scale: float = DEFAULT_DEPTH_SCALE) -> np.ndarray:
+    codec = DepthCodec(codec)
+    depth = np.asarray(depth)
+    if codec == DepthCodec.FLOAT32:
+        return depth.astype(np.float32, copy=False)
+    if codec == DepthCodec.FLOAT16:
+        with np.errstate(over="ignore"):
+            return depth.astype(np.float16)
+    with np.errstate(invalid="ignore", over="ignore"):
+        quantized = np.rint(depth * scale)
+        # NaN compares False, so it lands on the invalid value together with inf and out-of-range depth
+        valid = (quantized >= 1) & (quantized <= MAX_DEPTH_U16)
+    return np.where(valid, quantized, INVALID_DEPTH_U16).astype(np.uint16)
+
+
+def decode_depth(encoded: np.ndarray, scale: float = DEFAULT_DEPTH_SCALE) -> np.ndarray:
+    """Decode any codec to float32; the codec is inferred from the dtype."""
+    encoded = np.asarray(encoded)
+    if encoded.dtype == np.uint16:
+        depth = encoded.astype(np.float32) / np.float32(scale)
+        depth[encoded == INVALID_DEPTH_U16] = np.nan
+        return depth
+    return encoded.astype(np.float32, copy=False)
+
+
+def save_depth(path: Union[str, Path], depth: np.ndarray, depth_format: DepthFormat = DepthFormat()) -> Path:
+    """Encode and write ``depth``; the container's suffix replaces the one of ``path``."""
+    return write_depth(path, encode_depth(depth, depth_format.codec, depth_format.scale), depth_format)
+
+
+def write_depth(path: Union[str, Path], encoded: np.ndarray, depth_format: DepthFormat = DepthFormat()) -> Path:
+    """Write an already ``encode_depth``-ed map in ``depth_format``'s container."""
+    path = Path(path).with_suffix(depth_format.suffix)
+    if depth_format.container == DepthContainer.NPY:
+        np.save(path, encoded)
+    elif depth_format.container == DepthContainer.NPZ:
+        np.savez_compressed(path, depth=encoded, scale=np.float32(depth_format.scale))
+    else:
+        info = PngImagePlugin.PngInfo()
+        info.add_text("depth_scale", str(depth_format.scale))
+        Image.fromarray(encoded).save(path, pnginfo=info)
+    return path
+
+
+def load_depth(path: Union[str, Path]) -> np.ndarray:
+    """Load a depth map written by any codec/container as float32, NaN where invalid."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".npy":
+        return decode_depth(np.load(path))
+    if suffix == ".npz":
+        with np.load(path) as data:
+            scale = float(data["scale"]) if "scale" in data else DEFAULT_DEPTH_SCALE
+            return decode_depth(data["depth"], scale=scale)
+    if suffix == ".png":
+        with Image.open(path) as image:
+            scale = float(image.info.get("depth_scale", DEFAULT_DEPTH_SCALE))
+            encoded = np.asarray(image).astype(np.uint16)
+        return decode_depth(encoded, scale=scale)
+    raise ValueError(f"Unsupported depth file: {path}")
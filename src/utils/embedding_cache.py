@@ -0,0 +1,125 @@
+"""Size-bounded on-disk cache of image embeddings.
+
+SAM spends nearly all of its time in the image encoder, whose output only
+depends on the image and the model. ``EmbeddingCache`` stores that output as
+``{root}/{model}/{content hash}.npy``: the hash is taken over the decoded
+pixels, so re-encoding a frame to another format still hits, and the model
+directory keeps checkpoints apart. Files are written atomically, so several
+processes can share a cache.
+
+The cache is bounded by ``max_bytes`` across all models. Reading an entry
+touches its mtime, and when a write would exceed the bound the least
+recently used entries are deleted first.
+"""
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent.parent / ".data" / "sam-embeddings"
+DEFAULT_CACHE_BYTES = 20 * 1024 ** 3
+CACHE_VERSION = 1  # part of every key, bump when the stored embeddings change meaning
+
+
+def image_hash(image: Image.Image) -> str:
+    """Hash of the decoded pixels, mode and size of ``image``."""
+    digest = hashlib.sha256(f"{CACHE_VERSION}:{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _model_dir(model_id: str) -> str:
+    return model_id.replace("/", "--")
+
+
+class EmbeddingCache:
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # path -> (size, last use in ns)
+        self._entries: Dict[Path, Tuple[int, int]] = {}
+        self._size = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        for model in os.scandir(self.root):
+            if not model.is_dir():
+                continue
+            for entry in os.scandir(model.path):
+                if entry.name.endswith(".npy"):
+                    stat = entry.stat()
+                    self._entries[Path(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+                    self._size += stat.st_size
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def path(self, model_id: str, key: str) -> Path:
+        return self.root / _model_dir(model_id) / f"{key}.npy"
+
+    def get(self, model_id: str, key: str) -> Optional[np.ndarray]:
+        path = self.path(model_id, key)
+        try:
+            embedding = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            # missing, evicted by another process or half written by one that died
+            self._forget(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._track(path)
+        self.hits += 1
+        return embedding
+
+    def put(self, model_id: str, key: str, embedding: np.ndarray):
+        path = self.path(model_id, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.tmp")
+        with tmp_path.open(mode="wb") as fout:
+            np.save(fout, np.ascontiguousarray(embedding))
+        os.replace(tmp_path, path)
+        self._track(path)
+        self._evict()
+
+    def _track(self, path: Path):
+        """(Re)account an entry, which another process may have written."""
+        self._forget(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self._entries[path] = (stat.st_size, stat.st_mtime_ns)
+        self._size += stat.st_size
+
+    def _forget(self, path: Path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._size -= entry[0]
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        for path, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._forget(path)
+            self.evicted += 1
+        logger.debug(f"Embedding cache at {self._size / 1e9:.2f} GB after evicting, {self.evicted} evicted so far")
+
+    def report(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted,
+                "entries": len(self._entries), "gigabytes": self._size / 1e9}
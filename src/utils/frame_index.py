@@ -0,0 +1,194 @@
+"""Dense frame numbering of a trimmed experiment.
+
+``data/trim_entries.py`` keeps the frames that have a file in every captured
+modality. Instead of deleting the others and renaming the rest, it writes
+``frame-index.json``: dense frame ``i`` is the frame whose files are named
+``stems[i]`` (``"00042"``), and ``files`` holds the file name of every
+trimmed modality directory per dense frame. The ``data/`` scripts list
+frames with ``frame_paths``, which follows the index when there is one, so a
+trim writes a single file.
+
+``compact_experiment`` makes the numbering physical: it deletes the files of
+the dropped frames and renames the kept ones to ``00000``, ``00001``, ...
+in every directory of ``FRAME_DIRS``, and rewrites ``roi.bin`` to match. The
+plan is written to ``compaction.json`` first and each of its phases is
+idempotent, so an interrupted compaction resumes where it stopped:
+
+1. rename every kept file to a temporary ``.compact`` name
+2. delete the files of the dropped frames
+3. rename the temporary files to their dense names
+
+While a compaction is unfinished ``frame_paths`` refuses to list frames.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from utils.manifest import frame_id
+from utils.roi import ROI_FILE, read_rois
+
+FRAME_INDEX_FILE = "frame-index.json"
+FRAME_INDEX_VERSION = 1
+COMPACTION_FILE = "compaction.json"
+COMPACT_SUFFIX = ".compact"
+
+# directories with one NNNNN.ext file per frame, captured or derived from bodies/
+FRAME_DIRS = ("bodies", "images", "camera", "depth-maps", "masks", "bbox", "keypoints")
+
+
+@dataclass
+class FrameIndex:
+    # dense frame id -> file stem of the original frame
+    stems: List[str] = field(default_factory=list)
+    # modality directory -> file name per dense frame
+    files: Dict[str, List[str]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.stems)
+
+
+def write_frame_index(exp_path: Path, index: FrameIndex):
+    path = Path(exp_path) / FRAME_INDEX_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open(mode="w") as fout:
+        json.dump({"version": FRAME_INDEX_VERSION, **asdict(index)}, fout)
+    os.replace(tmp_path, path)
+
+
+def read_frame_index(exp_path: Path) -> Optional[FrameIndex]:
+    """The frame index of a trimmed experiment, None when its files are numbered densely."""
+    if (Path(exp_path) / COMPACTION_FILE).exists():
+        raise RuntimeError(f"The compaction of {exp_path} was interrupted, "
+                           f"finish it with data/trim_entries.py --exp_path {exp_path} --compact")
+    path = Path(exp_path) / FRAME_INDEX_FILE
+    if not path.exists():
+        return None
+    with path.open(mode="r") as fin:
+        data = json.load(fin)
+    if data.get("version") != FRAME_INDEX_VERSION:
+        raise ValueError(f"Unsupported frame index version {data.get('version')} in {path}")
+    return FrameIndex(stems=data["stems"], files=data["files"])
+
+
+def frame_paths(exp_path: Path, directory: str) -> List[Path]:
+    """The files of ``exp_path/directory`` in dense frame order.
+
+    With a frame index, only the frames it kept; derived directories (e.g.
+    ``bbox``) are matched by file stem. Without one, every ``NNNNN.ext`` file
+    sorted by frame id.
+    """
+    exp_path = Path(exp_path)
+    root = exp_path / directory
+    index = read_frame_index(exp_path)
+    if index is not None and directory in index.files:
+        return [root / name for name in index.files[directory]]
+    by_stem = {}
+    for entry in os.scandir(root):
+        if entry.is_file() and frame_id(entry.name) is not None:
+            by_stem[entry.name.split(".", 1)[0]] = Path(entry.path)
+    if index is None:
+        return [by_stem[stem] for stem in sorted(by_stem, key=int)]
+    return [by_stem[stem] for stem in index.stems if stem in by_stem]
+
+
+def _stem(name: str) -> str:
+    return name.split(".", 1)[0]
+
+
+def plan_compaction(exp_path: Path, index: FrameIndex) -> dict:
+    """Renames and deletions that make ``index`` the physical numbering."""
+    exp_path = Path(exp_path)
+    dense = {stem: f"{new_id:05}" for new_id, stem in enumerate(index.stems)}
+    renames, deletes = [], []
+    for directory in FRAME_DIRS:
+        root = exp_path / directory
+        if not root.is_dir():
+            continue
+        for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+            if not entry.is_file() or frame_id(entry.name) is None:
+                continue
+            stem = _stem(entry.name)
+            relative = f"{directory}/{entry.name}"
+            if stem not in dense:
+                deletes.append(relative)
+                continue
+            target = f"{directory}/{dense[stem]}{entry.name[len(stem):]}"
+            if target != relative:
+                renames.append([relative, relative + COMPACT_SUFFIX, target])
+    return {"phase": 1, "renames": renames, "deletes": deletes, "roi": (exp_path / ROI_FILE).exists()}
+
+
+def _remap_rois(exp_path: Path, index: FrameIndex):
+    """Write the crop records under the dense frame ids next to roi.bin, swapped in when the files are."""
+    # ZedSaver numbers files from counter + 1, so frame ids are stem - 1
+    new_ids = {int(stem) - 1: new_id - 1 for new_id, stem in enumerate(index.stems)}
+    records = read_rois(exp_path)
+    keep = np.array([int(frame) in new_ids for frame in records["frame_id"]], dtype=bool)
+    records = records[keep]
+    records["frame_id"] = [new_ids[int(frame)] for frame in records["frame_id"]]
+    records.tofile(exp_path / (ROI_FILE + COMPACT_SUFFIX))
+
+
+def _save_journal(path: Path, journal: dict):
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open(mode="w") as fout:
+        json.dump(journal, fout)
+    os.replace(tmp_path, path)
+
+
+def _run(operations: list, operation: Callable, workers: int):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first failure
+        list(executor.map(operation, operations))
+
+
+def compact_experiment(exp_path: Path, workers: int = 8) -> dict:
+    """Apply the frame index to the files, or finish an interrupted compaction; returns the operation counts."""
+    exp_path = Path(exp_path)
+    journal_path = exp_path / COMPACTION_FILE
+    if journal_path.exists():
+        with journal_path.open(mode="r") as fin:
+            journal = json.load(fin)
+        logger.info(f"Resuming the compaction of {exp_path} at phase {journal['phase']}")
+    else:
+        index = read_frame_index(exp_path)
+        if index is None:
+            logger.info(f"{exp_path} has no frame index, nothing to compact")
+            return {"renamed": 0, "deleted": 0}
+        journal = plan_compaction(exp_path, index)
+        if journal["roi"]:
+            _remap_rois(exp_path, index)
+        _save_journal(journal_path, journal)
+
+    def to_temporary(rename):
+        source, temporary, _ = rename
+        # done if an earlier run got here
+        if not (exp_path / temporary).exists():
+            os.rename(exp_path / source, exp_path / temporary)
+
+    def delete(relative):
+        (exp_path / relative).unlink(missing_ok=True)
+
+    def to_target(rename):
+        _, temporary, target = rename
+        if (exp_path / temporary).exists():
+            os.replace(exp_path / temporary, exp_path / target)
+
+    phases = {1: (journal["renames"], to_temporary), 2: (journal["deletes"], delete), 3: (journal["renames"], to_target)}
+    for phase in range(journal["phase"], 4):
+        operations, operation = phases[phase]
+        _run(operations, operation, workers)
+        journal["phase"] = phase + 1
+        _save_journal(journal_path, journal)
+
+    if journal["roi"] and (exp_path / (ROI_FILE + COMPACT_SUFFIX)).exists():
+        os.replace(exp_path / (ROI_FILE + COMPACT_SUFFIX), exp_path / ROI_FILE)
+    (exp_path / FRAME_INDEX_FILE).unlink(missing_ok=True)
+    journal_path.unlink()
+    return {"renamed": len(journal["renames"]), "deleted": len(journal["deletes"])}
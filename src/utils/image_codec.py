@@ -0,0 +1,196 @@
+"""Image encoding for ``images/``.
+
+ZED images are BGRA with an always-opaque alpha channel, so they are handed to
+Pillow with the ``BGRX`` raw mode: Pillow reorders the channels while reading
+the buffer, with no NumPy copy and no alpha compositing. Pillow releases the
+GIL while compressing, and ``ImageEncoder(processes=N)`` moves the whole
+encode into worker processes for formats that are still CPU bound.
+"""
+import argparse
+import io
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".webp", ".npy")
+
+
+class ImageFormat(str, Enum):
+    PNG = "png"
+    JPEG = "jpeg"
+    WEBP = "webp"
+    RAW = "raw"
+
+
+@dataclass(frozen=True)
+class ImageEncoding:
+    format: ImageFormat = ImageFormat.PNG
+    png_compress_level: int = 6  # Pillow's default
+    quality: int = 90  # JPEG / WebP
+
+    def __post_init__(self):
+        object.__setattr__(self, "format", ImageFormat(self.format))
+
+    @property
+    def suffix(self) -> str:
+        return {
+            ImageFormat.PNG: ".png",
+            ImageFormat.JPEG: ".jpg",
+            ImageFormat.WEBP: ".webp",
+            ImageFormat.RAW: ".npy",
+        }[self.format]
+
+
+def to_pil_rgb(image_np: np.ndarray) -> Image.Image:
+    """Wrap a BGRA/BGR/RGB uint8 array as an RGB Pillow image without compositing."""
+    height, width = image_np.shape[:2]
+    channels = image_np.shape[2] if image_np.ndim == 3 else 1
+    if channels == 1:
+        return Image.fromarray(np.ascontiguousarray(image_np.reshape(height, width)), mode="L")
+    # a no-op for Mat views, which are already contiguous
+    image_np = np.ascontiguousarray(image_np)
+    rawmode = {4: "BGRX", 3: "BGR"}[channels]
+    return Image.frombuffer("RGB", (width, height), image_np, "raw", rawmode, 0, 1)
+
+
+def encode_image(image_np: np.ndarray, encoding: ImageEncoding = ImageEncoding()) -> bytes:
+    buffer = io.BytesIO()
+    if encoding.format == ImageFormat.RAW:
+        np.save(buffer, np.ascontiguousarray(image_np))
+        return buffer.getvalue()
+    image = to_pil_rgb(image_np)
+    if encoding.format == ImageFormat.PNG:
+        image.save(buffer, format="PNG", compress_level=encoding.png_compress_level)
+    elif encoding.format == ImageFormat.JPEG:
+        image.save(buffer, format="JPEG", quality=encoding.quality)
+    else:
+        image.save(buffer, format="WEBP", quality=encoding.quality)
+    return buffer.getvalue()
+
+
+def write_image(path: Union[str, Path], image_np: np.ndarray, encoding: ImageEncoding = ImageEncoding()) -> int:
+    """Encode ``image_np`` to ``path`` (its suffix is replaced); returns the bytes written."""
+    data = encode_image(image_np, encoding)
+    with open(Path(path).with_suffix(encoding.suffix), mode="wb") as fout:
+        fout.write(data)
+    return len(data)
+
+
+def load_image(path: Union[str, Path]) -> Image.Image:
+    """Open a frame written by any ImageFormat as an RGB Pillow image."""
+    path = Path(path)
+    if path.suffix == ".npy":
+        return to_pil_rgb(np.load(path))
+    return Image.open(path).convert("RGB")
+
+
+def find_image(image_dir: Path, stem: str) -> Path:
+    """Locate ``stem`` in ``image_dir`` whatever format the capture used."""
+    for ext in IMAGE_EXTENSIONS:
+        path = image_dir / f"{stem}{ext}"
+        if path.exists():
+            return path
+    raise FileNotFoundError(f"No image {stem} in {image_dir}")
+
+
+class ImageEncoder:
+    """Encodes frames inline or in a process pool and tracks throughput."""
+
+    def __init__(self, encoding: ImageEncoding = ImageEncoding(), processes: int = 0):
+        self.encoding = encoding
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def suffix(self) -> str:
+        return self.encoding.suffix
+
+    def _record(self, size: int, elapsed: float):
+        with self._lock:
+            self.frames += 1
+            self.bytes += size
+            self.seconds += elapsed
+
+    def encode(self, image_np: np.ndarray) -> bytes:
+        start = time.perf_counter()
+        if self._executor is not None:
+            data = self._executor.submit(encode_image, np.ascontiguousarray(image_np), self.encoding).result()
+        else:
+            data = encode_image(image_np, self.encoding)
+        self._record(len(data), time.perf_counter() - start)
+        return data
+
+    def write(self, path: Union[str, Path], image_np: np.ndarray) -> Path:
+        path = Path(path).with_suffix(self.suffix)
+        data = self.encode(image_np)
+        with open(path, mode="wb") as fout:
+            fout.write(data)
+        return path
+
+    def report(self) -> dict:
+        with self._lock:
+            frames, size, seconds = self.frames, self.bytes, self.seconds
+        return {
+            "format": self.encoding.format.value,
+            "frames": frames,
+            # per encoding thread; multiply by the number of writers for the aggregate
+            "frames_per_second": frames / seconds if seconds else 0.0,
+            "bytes_per_frame": size / frames if frames else 0.0,
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def benchmark_encodings(image_np: np.ndarray, encodings: List[ImageEncoding], repeats: int = 10) -> List[Dict]:
+    results = []
+    for encoding in encodings:
+        encoder = ImageEncoder(encoding)
+        for _ in range(repeats):
+            encoder.encode(image_np)
+        result = encoder.report()
+        result["png_compress_level"] = encoding.png_compress_level if encoding.format == ImageFormat.PNG else None
+        result["quality"] = encoding.quality if encoding.format in (ImageFormat.JPEG, ImageFormat.WEBP) else None
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image_path",type=str,help="frame to benchmark with, a synthetic HD2K frame is used otherwise",default=None)
+    parser.add_argument("--repeats",type=int,help="encodes per format",default=10)
+    args = parser.parse_args()
+
+    if args.image_path:
+        rgb = np.asarray(Image.open(args.image_path).convert("RGB"))
+        frame = np.concatenate([rgb[..., ::-1], np.full(rgb.shape[:2] + (1,), 255, np.uint8)], axis=2)
+    else:
+        # smooth gradients plus noise compress roughly like a real scene
+        height, width = 1242, 2208
+        yy, xx = np.mgrid[0:height, 0:width]
+        base = ((xx + yy) % 256).astype(np.uint8)
+        noise = np.random.default_rng(0).integers(0, 16, (height, width), dtype=np.uint8)
+        frame = np.stack([base, base // 2 + noise, 255 - base, np.full_like(base, 255)], axis=2)
+
+    encodings = [
+        ImageEncoding(ImageFormat.RAW),
+        ImageEncoding(ImageFormat.PNG, png_compress_level=1),
+        ImageEncoding(ImageFormat.PNG, png_compress_level=6),
+        ImageEncoding(ImageFormat.JPEG, quality=95),
+        ImageEncoding(ImageFormat.WEBP, quality=90),
+    ]
+    for result in benchmark_encodings(frame, encodings, repeats=args.repeats):
+        print(f"{result['format']:>5} level={result['png_compress_level']} quality={result['quality']}: "
+              f"{result['frames_per_second']:7.1f} frames/s, {result['bytes_per_frame'] / 1e6:6.2f} MB/frame")
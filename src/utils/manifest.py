@@ -0,0 +1,163 @@
+"""Experiment manifest: the frame files of an experiment, by modality.
+
+One recursive ``os.scandir`` pass classifies every file by the directory it
+is in (``bodies``, ``images``, ``depth-maps``, ``camera``, ``masks``) and
+takes the frame id from its name (``00042.png`` is frame 42). Modality
+directories are not searched further, and when a modality directory appears
+more than once (e.g. under ``shards/``) the one closest to the root wins.
+
+The manifest is cached in ``EXP/.manifest.json`` with the mtime of every
+directory scanned. Adding, removing or renaming a file changes the mtime of
+its directory, so a cache whose mtimes all match is current. A directory
+modified within ``RACY_SECONDS`` before the scan may have changed again in
+the same timestamp tick, so such a cache entry does not count as current.
+The cache file is rewritten in place, which leaves the mtime of ``EXP`` alone.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+MANIFEST_FILE = ".manifest.json"
+MANIFEST_VERSION = 1
+RACY_SECONDS = 0.05  # coarser than the kernel's timestamp clock
+
+# directory name -> modality
+MODALITY_DIRS = {
+    "bodies": "keypoint",
+    "images": "image",
+    "depth-maps": "depth_map",
+    "camera": "camera",
+    "masks": "mask",
+}
+
+
+def frame_id(name: str) -> Optional[int]:
+    """The frame id of a ``NNNNN.ext`` file name, None for other files."""
+    stem = name.split(".", 1)[0]
+    return int(stem) if stem.isdigit() else None
+
+
+@dataclass
+class Manifest:
+    root: Path
+    # modality -> frame id -> path relative to root
+    files: Dict[str, Dict[int, str]] = field(default_factory=dict)
+    # directory relative to root -> mtime in ns, for every directory scanned
+    directories: Dict[str, int] = field(default_factory=dict)
+    scanned_at: int = 0
+
+    def frame_ids(self, *modalities: str) -> List[int]:
+        """Sorted ids of the frames that have a file in every one of ``modalities``."""
+        ids = None
+        for modality in modalities:
+            present = set(self.files.get(modality, {}))
+            ids = present if ids is None else ids & present
+        return sorted(ids or ())
+
+    def path(self, modality: str, frame: int) -> Path:
+        return self.root / self.files[modality][frame]
+
+    def to_json(self) -> dict:
+        return {
+            "version": MANIFEST_VERSION,
+            "scanned_at": self.scanned_at,
+            "directories": self.directories,
+            "files": {modality: [[frame, path] for frame, path in sorted(files.items())]
+                      for modality, files in self.files.items()},
+        }
+
+    @classmethod
+    def from_json(cls, root: Path, data: dict) -> "Manifest":
+        return cls(root=root,
+                   files={modality: {frame: path for frame, path in files} for modality, files in data["files"].items()},
+                   directories=data["directories"],
+                   scanned_at=data["scanned_at"])
+
+
+def scan_experiment(root: Path) -> Manifest:
+    """Scan ``root`` once, see the module docstring."""
+    root = Path(root)
+    manifest = Manifest(root=root, scanned_at=time.time_ns())
+    # modality -> (depth, directory) it was taken from
+    sources: Dict[str, Tuple[int, str]] = {}
+    stack = [(root, "", 0)]
+    while stack:
+        directory, relative, depth = stack.pop()
+        manifest.directories[relative] = os.stat(directory).st_mtime_ns
+        modality = MODALITY_DIRS.get(directory.name) if relative else None
+        files = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                entry_path = f"{relative}/{entry.name}" if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if modality is None:
+                        stack.append((Path(entry.path), entry_path, depth + 1))
+                elif modality is not None:
+                    frame = frame_id(entry.name)
+                    if frame is not None:
+                        files[frame] = entry_path
+        if modality is None:
+            continue
+        previous = sources.get(modality)
+        if previous is not None and previous[0] == depth:
+            raise ValueError(f"Both {previous[1]} and {relative} hold {modality} files, "
+                             f"prepare one experiment at a time")
+        if previous is None or depth < previous[0]:
+            if previous is not None:
+                logger.warning(f"Ignoring {previous[1]}, {relative} is closer to {root}")
+            sources[modality] = (depth, relative)
+            manifest.files[modality] = files
+        else:
+            logger.warning(f"Ignoring {relative}, {previous[1]} is closer to {root}")
+    return manifest
+
+
+def _current(root: Path, data: dict) -> bool:
+    racy = data["scanned_at"] - int(RACY_SECONDS * 1e9)
+    for relative, mtime in data["directories"].items():
+        try:
+            current = os.stat(root / relative).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if current != mtime or mtime >= racy:
+            return False
+    return True
+
+
+def load_manifest(root: Path, rescan: bool = False) -> Manifest:
+    """The manifest of ``root``, from the cache when it is current, otherwise scanned and cached."""
+    root = Path(root)
+    cache_path = root / MANIFEST_FILE
+    if not rescan and cache_path.exists():
+        try:
+            with cache_path.open(mode="r") as fin:
+                data = json.load(fin)
+            if data.get("version") == MANIFEST_VERSION and _current(root, data):
+                logger.debug(f"Using the cached manifest of {root}")
+                return Manifest.from_json(root, data)
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable manifest cache {cache_path}: {e}")
+
+    cacheable = True
+    if not cache_path.exists():
+        try:
+            # created before the scan, so the scan sees the mtime of EXP with it
+            cache_path.touch()
+            time.sleep(RACY_SECONDS)
+        except OSError as e:
+            # a read-only experiment is scanned every time
+            logger.warning(f"Could not cache the manifest of {root}: {e}")
+            cacheable = False
+    manifest = scan_experiment(root)
+    if cacheable:
+        # an interrupted write is unreadable JSON, which is rescanned
+        with cache_path.open(mode="w") as fout:
+            json.dump(manifest.to_json(), fout)
+    return manifest
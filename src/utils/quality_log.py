@@ -0,0 +1,49 @@
+"""Quality switches of an adaptive capture.
+
+With ``--adaptive_quality`` the capture writes ``quality.json``: the quality
+ladder, and one entry per switch with the id of the first frame sampled at
+the new level, the level's settings and the depth/image intrinsics it
+retrieves at. The first entry is the level the capture started at, so every
+frame id maps to exactly one entry; ``level_at`` finds it.
+"""
+import json
+import os
+from pathlib import Path
+from typing import List, Optional
+
+QUALITY_FILE = "quality.json"
+QUALITY_VERSION = 1
+
+
+class QualityLog:
+    """Rewrites ``quality.json`` after every switch, so it is complete even if the capture dies."""
+
+    def __init__(self, exp_path: Path, ladder: List[dict], target_fps: float):
+        self.path = Path(exp_path) / QUALITY_FILE
+        self.log = {"version": QUALITY_VERSION, "target_fps": target_fps, "ladder": ladder, "switches": []}
+
+    def record(self, **switch):
+        self.log["switches"].append(switch)
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open(mode="w") as fout:
+            json.dump(self.log, fout, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+def read_quality_log(exp_path: Path) -> Optional[dict]:
+    """The quality log of an experiment, None if it was captured at a fixed quality."""
+    path = Path(exp_path) / QUALITY_FILE
+    if not path.exists():
+        return None
+    with path.open(mode="r") as fin:
+        return json.load(fin)
+
+
+def level_at(log: dict, frame_id: int) -> Optional[dict]:
+    """The switch entry in effect for ``frame_id``."""
+    current = None
+    for switch in log["switches"]:
+        if switch["frame_id"] > frame_id:
+            break
+        current = switch
+    return current
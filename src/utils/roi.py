@@ -0,0 +1,177 @@
+"""Region-of-interest crops for depth maps and masks.
+
+With ``--roi`` the capture stores depth and masks only inside the padded
+bounding box of the tracked bodies. Each crop appends one fixed-size record
+(frame id, modality, crop offset and size, full-frame size) to ``roi.bin``.
+Frames without a record were stored full-frame.
+
+``FullFrameLoader`` loads a depth map or mask file and, when the frame was
+cropped, pastes it back into a full-frame array filled with NaN (depth) or 0
+(masks), so consumers never see the crops.
+"""
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from utils.depth_codec import load_depth
+
+ROI_FILE = "roi.bin"
+ROI_HEADER = "roi.json"
+ROI_VERSION = 1
+
+ROI_DTYPE = np.dtype([
+    ("frame_id", "<i8"),
+    ("modality", "S8"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("width", "<i4"),
+    ("height", "<i4"),
+    ("full_width", "<i4"),
+    ("full_height", "<i4"),
+])
+
+# value of the pixels outside the crop, by modality
+FILL_VALUES = {"depth": np.nan, "mask": 0}
+
+
+@dataclass(frozen=True)
+class Roi:
+    x: int
+    y: int
+    width: int
+    height: int
+    full_width: int
+    full_height: int
+
+    def scaled(self, full_width: int, full_height: int) -> "Roi":
+        """The same region in a frame of another resolution."""
+        sx, sy = full_width / self.full_width, full_height / self.full_height
+        x0, y0 = int(np.floor(self.x * sx)), int(np.floor(self.y * sy))
+        x1 = min(full_width, int(np.ceil((self.x + self.width) * sx)))
+        y1 = min(full_height, int(np.ceil((self.y + self.height) * sy)))
+        return Roi(x0, y0, x1 - x0, y1 - y0, full_width, full_height)
+
+    def crop(self, array: np.ndarray) -> np.ndarray:
+        """Zero-copy view of the region of a full-frame array."""
+        return array[self.y:self.y + self.height, self.x:self.x + self.width]
+
+    def paste(self, crop: np.ndarray, fill=0) -> np.ndarray:
+        full = np.full((self.full_height, self.full_width) + crop.shape[2:], fill, dtype=crop.dtype)
+        full[self.y:self.y + self.height, self.x:self.x + self.width] = crop
+        return full
+
+    def to_record(self, frame_id: int, modality: str) -> np.ndarray:
+        record = np.zeros(1, dtype=ROI_DTYPE)
+        record["frame_id"] = frame_id
+        record["modality"] = modality.encode()
+        for field in ("x", "y", "width", "height", "full_width", "full_height"):
+            record[field] = getattr(self, field)
+        return record
+
+    @classmethod
+    def from_record(cls, record) -> "Roi":
+        return cls(*(int(record[field]) for field in ("x", "y", "width", "height", "full_width", "full_height")))
+
+
+def body_roi(boxes: np.ndarray, full_width: int, full_height: int, padding: float = 0.1) -> Optional[Roi]:
+    """Union of the ``(N, 4, 2)`` pixel boxes, padded by ``padding`` of its size on every side; None without a box."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4, 2)
+    # the SDK leaves zeros (or NaN) when a box is not available
+    boxes = boxes[np.isfinite(boxes).all(axis=(1, 2)) & boxes.any(axis=(1, 2))]
+    if not len(boxes):
+        return None
+    (x0, y0), (x1, y1) = boxes.min(axis=(0, 1)), boxes.max(axis=(0, 1))
+    pad_x, pad_y = (x1 - x0) * padding, (y1 - y0) * padding
+    x0, y0 = max(0, int(np.floor(x0 - pad_x))), max(0, int(np.floor(y0 - pad_y)))
+    x1, y1 = min(full_width, int(np.ceil(x1 + pad_x))), min(full_height, int(np.ceil(y1 + pad_y)))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return Roi(x0, y0, x1 - x0, y1 - y0, full_width, full_height)
+
+
+class RoiWriter:
+    """Appends crop records to ``roi.bin``; safe to share between writer threads."""
+
+    def __init__(self, exp_path: Path):
+        self.path = Path(exp_path) / ROI_FILE
+        self.header_path = Path(exp_path) / ROI_HEADER
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, frame_id: int, modality: str, roi: Roi):
+        with self._lock:
+            if self._file is None:
+                with self.header_path.open(mode="w") as fout:
+                    json.dump({
+                        "version": ROI_VERSION,
+                        "dtype": np.lib.format.dtype_to_descr(ROI_DTYPE),
+                    }, fout, indent=4)
+                self._file = self.path.open(mode="ab")
+            self._file.write(roi.to_record(frame_id, modality).tobytes())
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_rois(exp_path: Path) -> np.ndarray:
+    """All crop records ordered by frame id; empty when nothing was cropped."""
+    path = Path(exp_path) / ROI_FILE
+    if not path.exists():
+        return np.zeros(0, dtype=ROI_DTYPE)
+    records = np.fromfile(path, dtype=ROI_DTYPE)
+    return records[np.argsort(records["frame_id"], kind="stable")]
+
+
+def _load_mask(path: Path) -> np.ndarray:
+    with Image.open(path) as image:
+        return np.asarray(image)
+
+
+_LOADERS = {"depth": load_depth, "mask": _load_mask}
+
+
+class FullFrameLoader:
+    """Loads ``depth-maps/`` or ``masks/`` files of an experiment as full-frame arrays.
+
+    The crop records are read once; files are only read, and crops only
+    pasted, when ``load`` is called.
+    """
+
+    def __init__(self, exp_path: Path, modality: str):
+        if modality not in _LOADERS:
+            raise ValueError(f"No ROI loader for {modality}, expected one of {tuple(_LOADERS)}")
+        self.modality = modality
+        self.fill = FILL_VALUES[modality]
+        records = read_rois(exp_path)
+        records = records[records["modality"] == modality.encode()]
+        self.rois: Dict[int, Roi] = {int(record["frame_id"]): Roi.from_record(record) for record in records}
+
+    @staticmethod
+    def frame_id(path: Union[str, Path]) -> int:
+        # ZedSaver numbers files from counter + 1
+        return int(Path(path).stem) - 1
+
+    def roi(self, frame_id: int) -> Optional[Roi]:
+        return self.rois.get(frame_id)
+
+    def load(self, path: Union[str, Path]) -> np.ndarray:
+        array = _LOADERS[self.modality](Path(path))
+        roi = self.roi(self.frame_id(path))
+        # a full frame written over a crop later on (e.g. a SAM mask) keeps its record
+        if roi is None or array.shape[:2] == (roi.full_height, roi.full_width):
+            return array
+        return roi.paste(array, self.fill)
+
+    def full_size(self, path: Union[str, Path]) -> Optional[Tuple[int, int]]:
+        """``(width, height)`` of the frame a file was cropped from, None if it was stored full-frame."""
+        roi = self.roi(self.frame_id(path))
+        return None if roi is None else (roi.full_width, roi.full_height)
@@ -0,0 +1,418 @@
+"""Shared-memory ring of captured frames for other processes.
+
+With ``--shm_ring NAME`` the capture publishes every sampled frame (image,
+depth, body records, camera pose) into the ``multiprocessing.shared_memory``
+segment ``NAME``, so a mask generator or a preview can read it without
+waiting for the files and decoding them again. Layout::
+
+    header     magic, slot count and size, last published sequence number
+    consumers  one entry per attached consumer: pid, held frame, frames lost
+    slots      seq, frame id, timestamp, JSON array layout, array data
+
+Sequence numbers start at 1. A slot's ``seq`` is ``2n - 1`` while frame
+``n`` is being written and ``2n`` once it is complete (a seqlock), so a
+reader can tell that the frame it looked at has since been overwritten.
+
+The capture never waits for a consumer. With the ``overwrite`` policy the
+oldest slot is reused whatever happens to it, and a consumer that falls
+behind skips ahead and counts the frames it lost. With ``skip`` a slot that
+a consumer still holds is left alone and the new frame is not published,
+unless the hold is older than ``hold_timeout`` (a consumer that died).
+
+Consumers attach with ``FrameRingConsumer(NAME)``, take a frame with
+``next()`` (every frame, in order) or ``latest()`` (the newest), read its
+zero-copy ``arrays`` and ``release()`` it once done. Copy what must outlive
+the release: the producer may reuse the slot right after it.
+"""
+import argparse
+import json
+import os
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from utils.body_records import descr_to_dtype
+
+SHM_MAGIC = b"AVASHM01"
+SHM_VERSION = 1
+ALIGNMENT = 64
+MAX_CONSUMERS = 8
+META_SIZE = 4096
+POLL_SECONDS = 0.001
+
+HEADER_DTYPE = np.dtype({
+    "names": ["magic", "version", "num_slots", "slot_size", "max_consumers", "closed", "write_seq", "skipped",
+              "producer"],
+    "formats": ["S8", "<u4", "<u4", "<i8", "<u4", "<u4", "<i8", "<i8", "<i8"],
+    "offsets": [0, 8, 12, 16, 24, 28, 32, 40, 48],
+    "itemsize": 128,
+})
+CONSUMER_DTYPE = np.dtype({
+    "names": ["pid", "held_seq", "held_since", "done_seq", "lost"],
+    "formats": ["<i8", "<i8", "<i8", "<i8", "<i8"],
+    "offsets": [0, 8, 16, 24, 32],
+    "itemsize": 64,
+})
+SLOT_HEADER_DTYPE = np.dtype({
+    "names": ["seq", "frame_id", "timestamp", "meta_len"],
+    "formats": ["<i8", "<i8", "<i8", "<u4"],
+    "offsets": [0, 8, 16, 24],
+    "itemsize": ALIGNMENT,
+})
+SLOT_DATA_OFFSET = SLOT_HEADER_DTYPE.itemsize + META_SIZE
+
+# what to do when the slot to write is held by a consumer
+SLOW_CONSUMER_POLICIES = ("overwrite", "skip")
+
+
+def _align(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def slot_capacity(arrays: Dict[str, Tuple[Tuple[int, ...], object]]) -> int:
+    """Data bytes a slot needs for arrays of these ``(shape, dtype)``."""
+    return sum(_align(int(np.prod(shape)) * np.dtype(dtype).itemsize) for shape, dtype in arrays.values())
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Python 3.13+: do not let this process' resource tracker unlink the producer's segment
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _Ring:
+    """Views of the header, consumer table and slots of a segment."""
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if bytes(self.header["magic"]) != SHM_MAGIC:
+            raise ValueError(f"{shm.name} is not a frame ring")
+        self.num_slots = int(self.header["num_slots"])
+        self.slot_size = int(self.header["slot_size"])
+        self.consumers = np.ndarray((int(self.header["max_consumers"]),), dtype=CONSUMER_DTYPE,
+                                    buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+        self.slots_offset = _align(HEADER_DTYPE.itemsize + self.consumers.nbytes)
+
+    @staticmethod
+    def size(num_slots: int, slot_size: int, max_consumers: int) -> int:
+        return _align(HEADER_DTYPE.itemsize + max_consumers * CONSUMER_DTYPE.itemsize) + num_slots * slot_size
+
+    def slot_index(self, seq: int) -> int:
+        return (seq - 1) % self.num_slots
+
+    def slot_offset(self, seq: int) -> int:
+        return self.slots_offset + self.slot_index(seq) * self.slot_size
+
+    def slot_header(self, seq: int) -> np.ndarray:
+        return np.ndarray((), dtype=SLOT_HEADER_DTYPE, buffer=self.shm.buf, offset=self.slot_offset(seq))
+
+    def release_views(self):
+        # SharedMemory.close fails while NumPy views of the buffer exist
+        self.header = self.consumers = None
+
+
+class FrameRingPublisher:
+    """Producer side; owns (creates and unlinks) the segment."""
+
+    def __init__(self, name: str, slot_size: int, num_slots: int = 8, policy: str = "overwrite",
+                 hold_timeout: float = 1.0, max_consumers: int = MAX_CONSUMERS):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy}, expected one of {SLOW_CONSUMER_POLICIES}")
+        slot_size = _align(SLOT_DATA_OFFSET + slot_size)
+        size = _Ring.size(num_slots, slot_size, max_consumers)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            _remove_stale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        header["magic"] = SHM_MAGIC
+        header["version"] = SHM_VERSION
+        header["num_slots"] = num_slots
+        header["slot_size"] = slot_size
+        header["max_consumers"] = max_consumers
+        header["producer"] = os.getpid()
+        del header
+        self.ring = _Ring(self.shm)
+        self.ring.consumers[:] = 0
+        self.name = name
+        self.policy = policy
+        self.hold_timeout_ns = int(hold_timeout * 1e9)
+        self.capacity = slot_size - SLOT_DATA_OFFSET
+        self.published = 0
+        self.truncated = 0
+        logger.info(f"Publishing frames to shared memory {name}: {num_slots} slots of {slot_size / 1e6:.1f} MB, "
+                    f"{policy} slow consumers")
+
+    def _held(self, seq: int) -> bool:
+        now = time.monotonic_ns()
+        slot = self.ring.slot_index(seq)
+        for consumer in self.ring.consumers:
+            held = int(consumer["held_seq"])
+            if consumer["pid"] and held and self.ring.slot_index(held) == slot and \
+                    now - int(consumer["held_since"]) < self.hold_timeout_ns:
+                return True
+        return False
+
+    def publish(self, frame_id: int, timestamp: int, **arrays: Optional[np.ndarray]) -> bool:
+        """Copy the arrays of a frame into the next slot; False if the frame was not published."""
+        arrays = {key: np.ascontiguousarray(value) for key, value in arrays.items() if value is not None}
+        seq = int(self.ring.header["write_seq"]) + 1
+        if self.policy == "skip" and self._held(seq):
+            self.ring.header["skipped"] += 1
+            return False
+
+        layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            if offset + array.nbytes > self.capacity:
+                self.truncated += 1
+                if self.truncated == 1:
+                    logger.warning(f"Frame ring slots are too small for {key} {array.shape}, leaving it out")
+                continue
+            layout[key] = [np.lib.format.dtype_to_descr(array.dtype), list(array.shape), offset]
+            offset += _align(array.nbytes)
+        meta = json.dumps(layout).encode()
+        if len(meta) > META_SIZE:
+            raise ValueError(f"Frame ring layout takes {len(meta)} bytes, more than {META_SIZE}")
+
+        base = self.ring.slot_offset(seq)
+        slot = self.ring.slot_header(seq)
+        slot["seq"] = 2 * seq - 1
+        slot["frame_id"] = frame_id
+        slot["timestamp"] = timestamp
+        slot["meta_len"] = len(meta)
+        buf = self.shm.buf
+        buf[base + SLOT_HEADER_DTYPE.itemsize:base + SLOT_HEADER_DTYPE.itemsize + len(meta)] = meta
+        data = base + SLOT_DATA_OFFSET
+        for key, (_, _, array_offset) in layout.items():
+            array = arrays[key]
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=buf, offset=data + array_offset)
+            np.copyto(target, array)
+        slot["seq"] = 2 * seq
+        del slot
+        self.ring.header["write_seq"] = seq
+        self.published += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "skipped": int(self.ring.header["skipped"]),
+            "consumers": int((self.ring.consumers["pid"] != 0).sum()),
+            "consumer_lost": int(self.ring.consumers["lost"].sum()),
+        }
+
+    def close(self):
+        self.ring.header["closed"] = 1
+        logger.info(f"Frame ring {self.name}: {self.stats()}")
+        self.ring.release_views()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedFrame:
+    """A frame held in the ring; ``arrays`` are zero-copy views into the slot."""
+
+    def __init__(self, consumer: "FrameRingConsumer", seq: int, frame_id: int, timestamp: int,
+                 arrays: Dict[str, np.ndarray]):
+        self.consumer = consumer
+        self.seq = seq
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.arrays = arrays
+
+    def valid(self) -> bool:
+        """False once the producer started overwriting the slot; check after reading the arrays."""
+        return int(self.consumer.ring.slot_header(self.seq)["seq"]) == 2 * self.seq
+
+    def release(self):
+        self.consumer._release(self.seq)
+
+    def __enter__(self) -> "SharedFrame":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameRingConsumer:
+    """Attaches to the ring a capture publishes to; one frame is held at a time."""
+
+    def __init__(self, name: str, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.shm = _attach(name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+        self.ring = _Ring(self.shm)
+        self.entry = self._claim()
+        # start at the oldest frame still in the ring
+        self.last_seq = max(0, int(self.ring.header["write_seq"]) - self.ring.num_slots)
+        self.lost = 0
+
+    def _claim(self) -> int:
+        pid = os.getpid()
+        for index in range(len(self.ring.consumers)):
+            consumer = self.ring.consumers[index]
+            if consumer["pid"] == 0 or not _alive(int(consumer["pid"])):
+                consumer["pid"] = pid
+                consumer["held_seq"] = consumer["done_seq"] = consumer["lost"] = 0
+                # another process may have claimed it at the same time
+                time.sleep(POLL_SECONDS)
+                if consumer["pid"] == pid:
+                    return index
+        raise RuntimeError(f"All {len(self.ring.consumers)} consumer entries of {self.shm.name} are taken")
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.ring.header["closed"])
+
+    def _wait(self, seq: int, timeout: Optional[float]) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while int(self.ring.header["write_seq"]) < seq:
+            if self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(POLL_SECONDS)
+        return True
+
+    def _hold(self, seq: int) -> Optional[SharedFrame]:
+        consumer = self.ring.consumers[self.entry]
+        # announce the hold before checking the slot, so a skip-policy producer sees it
+        consumer["held_since"] = time.monotonic_ns()
+        consumer["held_seq"] = seq
+        slot = self.ring.slot_header(seq)
+        if int(slot["seq"]) != 2 * seq:
+            consumer["held_seq"] = 0
+            return None
+        base = self.ring.slot_offset(seq)
+        meta = bytes(self.shm.buf[base + SLOT_HEADER_DTYPE.itemsize:
+                                  base + SLOT_HEADER_DTYPE.itemsize + int(slot["meta_len"])])
+        data = base + SLOT_DATA_OFFSET
+        arrays = {key: np.ndarray(tuple(shape), dtype=descr_to_dtype(descr) if isinstance(descr, list)
+                                  else np.dtype(descr), buffer=self.shm.buf, offset=data + offset)
+                  for key, (descr, shape, offset) in json.loads(meta).items()}
+        return SharedFrame(self, seq, int(slot["frame_id"]), int(slot["timestamp"]), arrays)
+
+    def next(self, timeout: Optional[float] = None) -> Optional[SharedFrame]:
+        """The frame after the last one taken; skips ahead, counting ``lost`` frames, when it fell behind.
+
+        None on timeout, or once the producer closed the ring.
+        """
+        while True:
+            seq = self.last_seq + 1
+            if not self._wait(seq, timeout):
+                return None
+            oldest = int(self.ring.header["write_seq"]) - self.ring.num_slots + 1
+            if seq < oldest:
+                self._lose(oldest - seq)
+                seq = oldest
+            frame = self._hold(seq)
+            self.last_seq = seq
+            if frame is not None:
+                return frame
+            # overwritten between the check and the hold
+            self._lose(1)
+
+    def latest(self, timeout: Optional[float] = None) -> Optional[SharedFrame]:
+        """The newest published frame, if newer than the last one taken."""
+        while True:
+            if not self._wait(self.last_seq + 1, timeout):
+                return None
+            seq = int(self.ring.header["write_seq"])
+            frame = self._hold(seq)
+            self.last_seq = seq
+            if frame is not None:
+                return frame
+
+    def _lose(self, frames: int):
+        self.lost += frames
+        self.ring.consumers[self.entry]["lost"] += frames
+
+    def _release(self, seq: int):
+        consumer = self.ring.consumers[self.entry]
+        if int(consumer["held_seq"]) == seq:
+            consumer["held_seq"] = 0
+            consumer["done_seq"] = seq
+
+    def close(self):
+        if self.ring.consumers is not None:
+            self.ring.consumers[self.entry]["pid"] = 0
+            self.ring.consumers[self.entry]["held_seq"] = 0
+        self.ring.release_views()
+        try:
+            self.shm.close()
+        except BufferError:
+            # frames handed out are still referenced; the mapping goes away with them
+            pass
+
+
+def _remove_stale(name: str):
+    """Unlink the ring a crashed capture left behind; refuses to touch a live one."""
+    # tracked, as unlink() untracks it
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        ring = _Ring(shm)
+        producer = int(ring.header["producer"])
+        ring.release_views()
+    except ValueError:
+        shm.close()
+        raise FileExistsError(f"Shared memory {name} exists and is not a frame ring")
+    if _alive(producer):
+        shm.close()
+        raise FileExistsError(f"Frame ring {name} is in use by process {producer}")
+    logger.warning(f"Removing frame ring {name} left behind by process {producer}")
+    shm.close()
+    shm.unlink()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attach to a capture's --shm_ring and report what arrives")
+    parser.add_argument("--name", type=str, required=True, help="Shared memory name given to --shm_ring")
+    parser.add_argument("--latest", action='store_true', help="Always take the newest frame, like a preview")
+    args = parser.parse_args()
+
+    consumer = FrameRingConsumer(args.name)
+    start = time.perf_counter()
+    frames = 0
+    try:
+        while True:
+            frame = consumer.latest(timeout=1.0) if args.latest else consumer.next(timeout=1.0)
+            if frame is None:
+                if consumer.closed:
+                    break
+                continue
+            with frame:
+                shapes = {key: array.shape for key, array in frame.arrays.items()}
+                if frames % 30 == 0:
+                    print(f"frame {frame.frame_id} {shapes} valid={frame.valid()}")
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.close()
+    seconds = time.perf_counter() - start
+    print(f"{frames} frames in {seconds:.1f}s, {consumer.lost} lost")
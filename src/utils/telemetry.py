@@ -0,0 +1,278 @@
+"""Capture telemetry: per-stage latency histograms, counters and gauges.
+
+Instrumented code times a stage with ``with TELEMETRY.stage("grab"):`` and
+counts with ``TELEMETRY.count(...)``. Telemetry is disabled by default: then
+``stage`` hands back a shared no-op context manager and ``count``/``observe``
+return right away, so the instrumentation costs one attribute check per call.
+
+Gauges (frame counters, queue depths) are callbacks evaluated only when a
+snapshot is taken. ``TelemetryExporter`` writes snapshots to a JSON or
+Prometheus text file from a background thread; ``summarize`` formats the
+shutdown report.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+
+from loguru import logger
+
+# upper bounds in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TELEMETRY_FORMATS = ("json", "prometheus")
+METRIC_PREFIX = "capture"
+
+GaugeValue = Union[float, Dict[str, float]]
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (the observed max for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+        }
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("telemetry", "stage", "modality", "start")
+
+    def __init__(self, telemetry: "Telemetry", stage: str, modality: str):
+        self.telemetry = telemetry
+        self.stage = stage
+        self.modality = modality
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry.observe(self.stage, time.perf_counter() - self.start, self.modality)
+        return False
+
+
+class Telemetry:
+    """Thread-safe registry; histograms and counters are keyed by ``(name, modality)``."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._gauges: Dict[str, Callable[[], GaugeValue]] = {}
+        self._started = time.time()
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self._started = time.time()
+
+    def stage(self, name: str, modality: str = ""):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name, modality)
+
+    def observe(self, name: str, seconds: float, modality: str = ""):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get((name, modality))
+            if histogram is None:
+                histogram = self._histograms[(name, modality)] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, value: float = 1, modality: str = ""):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(name, modality)] = self._counters.get((name, modality), 0) + value
+
+    def register_gauge(self, name: str, fn: Callable[[], GaugeValue]):
+        """``fn`` returns a number, or a dict of numbers by label; it is called on every snapshot."""
+        with self._lock:
+            self._gauges[name] = fn
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {_key(name, modality): histogram.snapshot()
+                      for (name, modality), histogram in self._histograms.items()}
+            counters = {_key(name, modality): value for (name, modality), value in self._counters.items()}
+            gauges = dict(self._gauges)
+        values = {}
+        for name, fn in gauges.items():
+            try:
+                values[name] = fn()
+            except Exception as e:
+                logger.warning(f"Telemetry gauge {name} failed: {e}")
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": time.time() - self._started,
+            "stages": stages,
+            "counters": counters,
+            "gauges": values,
+        }
+
+
+def _key(name: str, modality: str) -> str:
+    return f"{name}/{modality}" if modality else name
+
+
+def _split_key(key: str) -> Tuple[str, str]:
+    name, _, modality = key.partition("/")
+    return name, modality
+
+
+def _labels(**labels) -> str:
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels.items() if value != "")
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def to_prometheus(snapshot: dict) -> str:
+    """Prometheus text exposition format."""
+    lines: List[str] = []
+    histogram = f"{METRIC_PREFIX}_stage_seconds"
+    lines.append(f"# TYPE {histogram} histogram")
+    for key, stats in sorted(snapshot["stages"].items()):
+        stage, modality = _split_key(key)
+        cumulative = 0
+        for bound, count in zip(stats["buckets"] + ["+Inf"], stats["counts"]):
+            cumulative += count
+            lines.append(f"{histogram}_bucket{_labels(stage=stage, modality=modality, le=bound)} {cumulative}")
+        lines.append(f"{histogram}_sum{_labels(stage=stage, modality=modality)} {stats['sum']}")
+        lines.append(f"{histogram}_count{_labels(stage=stage, modality=modality)} {stats['count']}")
+
+    counters: Dict[str, List[Tuple[str, float]]] = {}
+    for key, value in snapshot["counters"].items():
+        name, modality = _split_key(key)
+        counters.setdefault(name, []).append((modality, value))
+    for name, values in sorted(counters.items()):
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for modality, value in sorted(values):
+            lines.append(f"{metric}{_labels(modality=modality)} {value}")
+
+    for name, value in sorted(snapshot["gauges"].items()):
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# TYPE {metric} gauge")
+        if isinstance(value, dict):
+            for label, number in sorted(value.items()):
+                lines.append(f"{metric}{_labels(kind=label)} {number}")
+        else:
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize(snapshot: dict) -> str:
+    """Human readable shutdown report."""
+    lines = [f"{'stage':<28}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for key, stats in sorted(snapshot["stages"].items()):
+        lines.append(f"{key:<28}{stats['count']:>8}" + "".join(
+            f"{stats[field] * 1000:>10.2f}" for field in ("mean", "p50", "p95", "p99", "max")))
+    for key, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{key}: {value:g}")
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+class TelemetryExporter:
+    """Writes a snapshot to ``path`` every ``interval`` seconds, and once more on ``stop``."""
+
+    def __init__(self, telemetry: "Telemetry", path: Path, format: str = "json", interval: float = 5.0):
+        if format not in TELEMETRY_FORMATS:
+            raise ValueError(f"Unknown telemetry format {format}, expected one of {TELEMETRY_FORMATS}")
+        self.telemetry = telemetry
+        self.path = Path(path)
+        self.format = format
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry-export", daemon=True)
+
+    def start(self) -> "TelemetryExporter":
+        self._thread.start()
+        return self
+
+    def export(self) -> dict:
+        snapshot = self.telemetry.snapshot()
+        text = to_prometheus(snapshot) if self.format == "prometheus" else json.dumps(snapshot, indent=2)
+        # readers polling the file never see a partial write
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open(mode="w") as fout:
+            fout.write(text)
+        os.replace(tmp_path, self.path)
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.export()
+            except Exception as e:
+                logger.warning(f"Telemetry export failed: {e}")
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        return self.export()
+
+
+# process-wide registry used by the capture modules
+TELEMETRY = Telemetry()
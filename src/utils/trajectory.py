@@ -0,0 +1,98 @@
+"""Camera trajectory store.
+
+Every sampled frame appends one fixed-size record (frame id, timestamp,
+positional tracking state and the 4x4 float64 world pose) to
+``trajectory.bin``. ``read_trajectory`` loads the whole session in a single
+read; ``export_camera_json`` regenerates the legacy ``camera/NNNNN.json``
+files for frames whose tracking state was OK.
+"""
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+TRAJECTORY_FILE = "trajectory.bin"
+TRAJECTORY_HEADER = "trajectory.json"
+TRAJECTORY_VERSION = 1
+
+TRAJECTORY_DTYPE = np.dtype([
+    ("frame_id", "<i8"),
+    ("timestamp", "<i8"),
+    ("tracking_state", "<i4"),
+    ("ok", "?"),
+    ("pose", "<f8", (4, 4)),
+])
+
+
+@dataclass
+class CameraPose:
+    matrix: np.ndarray  # 4x4 world pose
+    timestamp: int  # nanoseconds
+    tracking_state: int
+    ok: bool
+
+    def to_record(self, frame_id: int) -> np.ndarray:
+        record = np.zeros(1, dtype=TRAJECTORY_DTYPE)
+        record["frame_id"] = frame_id
+        record["timestamp"] = self.timestamp
+        record["tracking_state"] = self.tracking_state
+        record["ok"] = self.ok
+        record["pose"][0] = self.matrix
+        return record
+
+
+class TrajectoryWriter:
+    """Appends pose records to ``trajectory.bin``; safe to share between writer threads."""
+
+    def __init__(self, exp_path: Path):
+        self.path = Path(exp_path) / TRAJECTORY_FILE
+        self.header_path = Path(exp_path) / TRAJECTORY_HEADER
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, frame_id: int, pose: CameraPose):
+        with self._lock:
+            if self._file is None:
+                with self.header_path.open(mode="w") as fout:
+                    json.dump({
+                        "version": TRAJECTORY_VERSION,
+                        "dtype": np.lib.format.dtype_to_descr(TRAJECTORY_DTYPE),
+                    }, fout, indent=4)
+                self._file = self.path.open(mode="ab")
+            self._file.write(pose.to_record(frame_id).tobytes())
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_trajectory(exp_path: Path) -> np.ndarray:
+    """All pose records in one read, ordered by frame id; ``["pose"]`` is the (N, 4, 4) array."""
+    records = np.fromfile(Path(exp_path) / TRAJECTORY_FILE, dtype=TRAJECTORY_DTYPE)
+    # writer threads may append frames out of order
+    return records[np.argsort(records["frame_id"], kind="stable")]
+
+
+def export_camera_json(exp_path: Path, out_dir: Optional[Path] = None) -> Dict[int, Path]:
+    """Write ``camera/NNNNN.json`` like ZedSaver.save_extrinsic_matrix, skipping lost-tracking frames."""
+    exp_path = Path(exp_path)
+    out_dir = Path(out_dir) if out_dir else exp_path / "camera"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = {}
+    records = read_trajectory(exp_path)
+    for record in records[records["ok"]]:
+        frame_id = int(record["frame_id"])
+        # ZedSaver numbers files from counter + 1
+        save_to = out_dir / f"{frame_id + 1:05}.json"
+        with save_to.open(mode="w") as fout:
+            json.dump({"cam_extrinsics": record["pose"].tolist()}, fout, indent=4)
+        written[frame_id] = save_to
+    logger.info(f"Exported {len(written)} camera poses to {out_dir}")
+    return written
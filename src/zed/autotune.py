@@ -0,0 +1,315 @@
+"""Tune the persistence settings for the disk experiments are written to.
+
+Writes synthetic frames (image, depth map, body records and camera pose from
+``SyntheticCamera``) through the real ``ZedSaver`` and ``PersistencePool``
+into a scratch directory under the experiments root, for every combination
+of writer threads, encoding processes, image encoding and depth format:
+
+* flat out, for the sustained frames/s; the time includes flushing the
+  page cache, so a fast cache in front of a slow disk does not count
+* paced at the capture rate, for the latency from submitting a frame to its
+  last file being written (p50/p95/p99); skipped when the configuration
+  cannot keep up anyway
+
+The profile takes the configuration that keeps up with the capture rate
+plus ``--headroom`` and stays within ``--max_latency`` at p99, writing the
+fewest bytes per frame; ties go to fewer threads, which leave more CPU to the
+SDK. Without such a configuration it takes the fastest one. ``zed/main.py``
+loads the profile at startup.
+
+Lossy depth codecs and image formats are only tried with ``--allow_lossy``.
+"""
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from utils.depth_codec import DepthCodec, DepthContainer, DepthFormat
+from utils.image_codec import ImageEncoder, ImageEncoding, ImageFormat
+from utils.trajectory import CameraPose
+from zed.camera import BODIES, DEPTH, IMAGE, resolution_size
+from zed.options import CAPTURE_FPS, SAVE_INTERVAL_SECONDS, sampling_stride
+from zed.persist import EXPERIMENTS_ROOT, ZedSaver
+from zed.persist_pool import PersistencePool
+from zed.persist_profile import DEFAULT_PROFILE_PATH, write_profile
+from zed.virtual_camera import SyntheticCamera
+
+LOSSLESS_DEPTH_FORMATS = ("float32:npy", "float32:npz")
+LOSSY_DEPTH_FORMATS = ("float16:npy", "uint16-mm:png", "uint16-mm:npz")
+TASKS_PER_FRAME = 4  # depth, image, body records, camera pose
+
+
+@dataclass
+class BenchmarkFrame:
+    image: np.ndarray
+    depth: np.ndarray
+    records: np.ndarray
+    pose: CameraPose
+
+
+@dataclass(frozen=True)
+class PersistConfig:
+    workers: int
+    encode_processes: int
+    image: ImageEncoding
+    depth: DepthFormat
+
+    def settings(self, queue_size: int) -> dict:
+        """As capture options, see ``persist_profile.PROFILE_SETTINGS``."""
+        return {
+            "persist_workers": self.workers,
+            "persist_queue_size": queue_size,
+            "encode_processes": self.encode_processes,
+            "image_format": self.image.format.value,
+            "png_compress_level": self.image.png_compress_level,
+            "image_quality": self.image.quality,
+            "depth_codec": self.depth.codec.value,
+            "depth_container": self.depth.container.value,
+        }
+
+    def __str__(self) -> str:
+        image = self.image.format.value
+        if self.image.format == ImageFormat.PNG:
+            image += f"-{self.image.png_compress_level}"
+        elif self.image.format != ImageFormat.RAW:
+            image += f"-q{self.image.quality}"
+        return (f"{self.workers} writers, {self.encode_processes} encoders, {image}, "
+                f"depth {self.depth.codec.value}:{self.depth.container.value}")
+
+
+def parse_depth_format(value: str) -> DepthFormat:
+    """``codec:container``, e.g. ``uint16-mm:png``."""
+    codec, _, container = value.partition(":")
+    return DepthFormat(codec=codec, container=container or DepthContainer.NPY.value)
+
+
+def synthetic_frames(width: int, height: int, image_scale: float = 1.0, depth_scale: float = 1.0,
+                     count: int = 8) -> List[BenchmarkFrame]:
+    """``count`` different frames, retrieved like the capture would."""
+    camera = SyntheticCamera(width, height, num_frames=None)
+    camera.enable_body_tracking(None)
+    image_res, depth_res = camera.info.scaled(image_scale), camera.info.scaled(depth_scale)
+    frames = []
+    for index in range(count):
+        # far enough apart for the people to move
+        camera.seek(index * 15)
+        camera.grab()
+        image = camera.new_buffer(IMAGE, image_res.width, image_res.height)
+        depth = camera.new_buffer(DEPTH, depth_res.width, depth_res.height)
+        bodies = camera.new_buffer(BODIES)
+        camera.retrieve(IMAGE, image)
+        camera.retrieve(DEPTH, depth)
+        camera.retrieve(BODIES, bodies)
+        frames.append(BenchmarkFrame(image=image, depth=depth, records=camera.body_records(bodies, index),
+                                     pose=camera.pose()))
+    camera.close()
+    return frames
+
+
+class _FrameDone:
+    """Release callback of a frame's tasks; records the latency once the last one is done."""
+
+    def __init__(self, latencies: List[float], lock: threading.Lock):
+        self.latencies = latencies
+        self.lock = lock
+        self.start = time.perf_counter()
+        self.remaining = TASKS_PER_FRAME
+
+    def __call__(self):
+        with self.lock:
+            self.remaining -= 1
+            if not self.remaining:
+                self.latencies.append(time.perf_counter() - self.start)
+
+
+def run_benchmark(config: PersistConfig, frames: List[BenchmarkFrame], scratch: Path, seconds: float,
+                  rate: Optional[float] = None, queue_size: int = 64, keypoint_format: str = "json",
+                  camera_format: str = "json") -> dict:
+    """Write frames for ``seconds``, flat out or at ``rate`` frames/s; returns the throughput and latencies."""
+    exp_path = Path(tempfile.mkdtemp(prefix="run-", dir=scratch))
+    pool = PersistencePool(num_workers=config.workers, max_queue_size=queue_size)
+    encoder = ImageEncoder(config.image, processes=config.encode_processes)
+    latencies: List[float] = []
+    lock = threading.Lock()
+    counter = 0
+    try:
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            if rate:
+                delay = start + counter / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            frame = frames[counter % len(frames)]
+            done = _FrameDone(latencies, lock)
+            pool.submit("depth", ZedSaver.save_depth_map, frame.depth, exp_path, counter, config.depth, release=done)
+            pool.submit("image", ZedSaver.save_image_from_zed, frame.image, exp_path, counter, encoder, release=done)
+            pool.submit("keypoints", ZedSaver.save_body_records, frame.records, exp_path, counter, keypoint_format,
+                        release=done)
+            pool.submit("camera", ZedSaver.save_camera_pose, frame.pose, exp_path, counter, camera_format,
+                        release=done)
+            counter += 1
+        pool.flush()
+        ZedSaver.close_session_writers()
+        # the capture has to sustain the rate of the disk, not of the page cache
+        if hasattr(os, "sync"):
+            os.sync()
+        elapsed = time.perf_counter() - start
+        written = sum(path.stat().st_size for path in exp_path.rglob("*") if path.is_file())
+    finally:
+        pool.close()
+        encoder.close()
+        ZedSaver.close_session_writers()
+        shutil.rmtree(exp_path, ignore_errors=True)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (np.nan,) * 3
+    return {
+        "frames": counter,
+        "frames_per_second": counter / elapsed if elapsed else 0.0,
+        "bytes_per_frame": written / counter if counter else 0.0,
+        "latency_p50": float(p50),
+        "latency_p95": float(p95),
+        "latency_p99": float(p99),
+        "failed": sum(pool.stats.failed.values()),
+    }
+
+
+def sweep(configs: List[PersistConfig], frames: List[BenchmarkFrame], scratch: Path, seconds: float,
+          target_fps: float, headroom: float, **kwargs) -> List[dict]:
+    results = []
+    for index, config in enumerate(configs):
+        result = {"config": config}
+        result.update(run_benchmark(config, frames, scratch, seconds, **kwargs))
+        paced = None
+        if result["frames_per_second"] >= target_fps * (1 + headroom) and not result["failed"]:
+            paced = run_benchmark(config, frames, scratch, seconds, rate=target_fps, **kwargs)
+            result["failed"] += paced["failed"]
+        # latency at the capture rate when it keeps up, otherwise the saturated one
+        result["paced"] = paced is not None
+        for key in ("latency_p50", "latency_p95", "latency_p99"):
+            result[key] = (paced or result)[key]
+        results.append(result)
+        logger.info(f"[{index + 1}/{len(configs)}] {config}: {result['frames_per_second']:.1f} frames/s, "
+                    f"{result['bytes_per_frame'] / 1e6:.2f} MB/frame, "
+                    f"p99 {result['latency_p99'] * 1000:.0f} ms{'' if paced else ' (saturated)'}"
+                    f"{', ' + str(result['failed']) + ' failed writes' if result['failed'] else ''}")
+    return results
+
+
+def select_config(results: List[dict], target_fps: float, headroom: float, max_latency: float
+                  ) -> Tuple[dict, bool]:
+    """The result to use and whether it meets the capture rate and latency budget."""
+    usable = [result for result in results if not result["failed"]] or results
+    good = [result for result in usable
+            if result["paced"] and result["frames_per_second"] >= target_fps * (1 + headroom)
+            and result["latency_p99"] <= max_latency]
+    if good:
+        best = min(good, key=lambda result: (result["bytes_per_frame"],
+                                             result["config"].workers + result["config"].encode_processes,
+                                             result["latency_p99"]))
+        return best, True
+    return max(usable, key=lambda result: result["frames_per_second"]), False
+
+
+def build_configs(workers: List[int], encode_processes: List[int], png_levels: List[int],
+                  depth_formats: List[DepthFormat], lossy_quality: Optional[int] = None) -> List[PersistConfig]:
+    encodings = [ImageEncoding(ImageFormat.PNG, png_compress_level=level) for level in png_levels]
+    if lossy_quality is not None:
+        encodings += [ImageEncoding(ImageFormat.JPEG, quality=lossy_quality),
+                      ImageEncoding(ImageFormat.WEBP, quality=lossy_quality)]
+    return [PersistConfig(workers=num_workers, encode_processes=processes, image=encoding, depth=depth_format)
+            for num_workers, processes, encoding, depth_format
+            in itertools.product(workers, encode_processes, encodings, depth_formats)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark persistence settings on the experiments disk and "
+                                                 "write the profile zed/main.py starts with")
+    parser.add_argument('--exp_root', type=str, default=str(EXPERIMENTS_ROOT),
+                        help='Directory the captures are written to; the benchmark writes to a scratch directory in it')
+    parser.add_argument('--profile', type=str, default=str(DEFAULT_PROFILE_PATH), help='Where to write the profile')
+    parser.add_argument('--resolution', type=str, default='', help='Camera resolution to benchmark, HD2K by default')
+    parser.add_argument('--image_resolution', type=float, default=1.0, help='As for zed/main.py')
+    parser.add_argument('--depth_resolution', type=float, default=1.0, help='As for zed/main.py')
+    parser.add_argument('--save_interval', type=float, default=SAVE_INTERVAL_SECONDS,
+                        help='As for zed/main.py, sets the frame rate to sustain')
+    parser.add_argument('--target_fps', type=float, default=0,
+                        help='Sampled frames per second to sustain, instead of deriving it from --save_interval')
+    parser.add_argument('--headroom', type=float, default=0.2, help='Throughput margin over the target rate')
+    parser.add_argument('--max_latency', type=float, default=1.0, help='Largest acceptable p99 write latency in seconds')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Duration of every benchmark run')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Writer thread counts to try')
+    parser.add_argument('--encode_processes', type=int, nargs='+', default=[0], help='Encoding process counts to try')
+    parser.add_argument('--png_levels', type=int, nargs='+', default=[1, 3, 6], help='PNG compression levels to try')
+    parser.add_argument('--depth_formats', type=str, nargs='+', default=None,
+                        help=f'codec:container pairs to try, by default {" ".join(LOSSLESS_DEPTH_FORMATS)} '
+                             f'(and {" ".join(LOSSY_DEPTH_FORMATS)} with --allow_lossy)')
+    parser.add_argument('--allow_lossy', action='store_true',
+                        help='Also try lossy depth codecs and JPEG/WebP images at --image_quality')
+    parser.add_argument('--image_quality', type=int, default=90, help='JPEG/WebP quality with --allow_lossy')
+    parser.add_argument('--persist_queue_size', type=int, default=64, help='As for zed/main.py')
+    parser.add_argument('--keypoint_format', type=str, default="json", choices=["json", "binary"], help='As for zed/main.py')
+    parser.add_argument('--camera_format', type=str, default="json", choices=["json", "trajectory"], help='As for zed/main.py')
+    opt = parser.parse_args()
+
+    logger.remove(0)
+    logger.add(sys.stdout, level="INFO")
+    # one line per run is enough
+    logger.disable("zed.persist_pool")
+
+    depth_formats = opt.depth_formats or list(LOSSLESS_DEPTH_FORMATS) + \
+        (list(LOSSY_DEPTH_FORMATS) if opt.allow_lossy else [])
+    try:
+        depth_formats = [parse_depth_format(value) for value in depth_formats]
+    except ValueError as e:
+        print(f"{e}. Exit program")
+        exit(1)
+    if not opt.allow_lossy and any(depth_format.codec != DepthCodec.FLOAT32 for depth_format in depth_formats):
+        print("Lossy depth codecs need --allow_lossy. Exit program")
+        exit(1)
+
+    stride = sampling_stride(CAPTURE_FPS, opt.save_interval)
+    target_fps = opt.target_fps or (CAPTURE_FPS / stride if stride else 1 / opt.save_interval)
+    width, height = resolution_size(opt.resolution)
+    configs = build_configs(opt.workers, opt.encode_processes, opt.png_levels, depth_formats,
+                            lossy_quality=opt.image_quality if opt.allow_lossy else None)
+    exp_root = Path(opt.exp_root)
+    exp_root.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Benchmarking {len(configs)} configurations at {width}x{height} on {exp_root}, "
+                f"target {target_fps:.1f} frames/s")
+
+    frames = synthetic_frames(width, height, opt.image_resolution, opt.depth_resolution)
+    scratch = Path(tempfile.mkdtemp(prefix=".autotune-", dir=exp_root))
+    try:
+        results = sweep(configs, frames, scratch, opt.seconds, target_fps, opt.headroom,
+                        queue_size=opt.persist_queue_size, keypoint_format=opt.keypoint_format,
+                        camera_format=opt.camera_format)
+    except KeyboardInterrupt:
+        logger.info("Interrupted by user, no profile written")
+        exit(1)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    best, meets_target = select_config(results, target_fps, opt.headroom, opt.max_latency)
+    if meets_target:
+        logger.info(f"Selected {best['config']}")
+    else:
+        logger.warning(f"No configuration sustains {target_fps * (1 + opt.headroom):.1f} frames/s within "
+                       f"{opt.max_latency}s at p99; selected the fastest, {best['config']}. "
+                       f"Consider --save_interval, lower resolutions or --allow_lossy")
+    settings = best["config"].settings(opt.persist_queue_size)
+    write_profile(Path(opt.profile), settings, exp_root,
+                  results=[dict(result, config=result["config"].settings(opt.persist_queue_size)) for result in results],
+                  resolution=[width, height], image_resolution=opt.image_resolution,
+                  depth_resolution=opt.depth_resolution, target_fps=target_fps, headroom=opt.headroom,
+                  max_latency=opt.max_latency, seconds=opt.seconds, meets_target=meets_target)
+    logger.info(f"Wrote {opt.profile}: {settings}")
@@ -1,16 +1,26 @@
-from pyzed import sl
+from dataclasses import dataclass
+from typing import Optional
 from loguru import logger
+from zed.camera import Camera
+
+
+@dataclass
+class BodyTrackingParameters:
+    # names follow sl.BodyTrackingParameters / sl.BodyTrackingRuntimeParameters
+    instance_module_id: int = 0
+    enable_tracking: bool = True                # Track people across images flow
+    enable_body_fitting: bool = True            # Smooth skeleton move
+    detection_model: str = "HUMAN_BODY_ACCURATE"  # sl.BODY_TRACKING_MODEL
+    body_format: str = "BODY_38"                # Choose the BODY_FORMAT you wish to use
+    detection_confidence_threshold: int = 40
+
+
 class BodyTracking:
-    def __init__(self,zed:sl.Camera):
-        self.body_param = self.initialize_body_tracker()
+    def __init__(self,camera:Camera,params:Optional[BodyTrackingParameters]=None):
+        self.body_param = params if params is not None else self.initialize_body_tracker()
 
-        # configure detection_model, instance_module_id, etc.
-        self.runtime_param = sl.BodyTrackingRuntimeParameters()
-        self.runtime_param.detection_confidence_threshold = 40
-        
         self.enabled = False
-        err = zed.enable_body_tracking(self.body_param)
-        if err != sl.ERROR_CODE.SUCCESS:
+        if not camera.enable_body_tracking(self.body_param):
             logger.error("Body tracking is not enabled")
         else:
             self.enabled = True
@@ -18,10 +28,4 @@ class BodyTracking:
 
 
     def initialize_body_tracker(self):
-        body_param = sl.BodyTrackingParameters()
-        body_param.instance_module_id = 0
-        body_param.enable_tracking = True                # Track people across images flow
-        body_param.enable_body_fitting = True            # Smooth skeleton move
-        body_param.detection_model = sl.BODY_TRACKING_MODEL.HUMAN_BODY_ACCURATE 
-        body_param.body_format =sl.BODY_FORMAT.BODY_38 # Choose the BODY_FORMAT you wish to use
-        return body_param
\ No newline at end of file
+        return BodyTrackingParameters()
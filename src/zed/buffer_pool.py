@@ -0,0 +1,86 @@
+import threading
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+
+class Lease:
+    """A buffer borrowed from a BufferPool.
+
+    ``item`` is the pooled object (an ``sl.Mat``, ``sl.Bodies``...), ``view``
+    whatever the borrower reads from it, typically a zero-copy NumPy view of a
+    Mat. Call ``release`` once the view is no longer needed; releasing twice
+    is a no-op.
+    """
+    __slots__ = ("pool", "item", "view", "_released")
+
+    def __init__(self, pool: "BufferPool", item: Any):
+        self.pool = pool
+        self.item = item
+        self.view = item
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.view = None
+        self.pool._give_back(self.item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BufferPool:
+    """Preallocated, recycled buffers with an explicit lease/release lifecycle.
+
+    ``size`` buffers are created up front. When all of them are leased the pool
+    grows up to ``max_size``; past that ``acquire`` returns None so the caller
+    can skip the modality instead of blocking the grab thread, unless it asks
+    to wait for a buffer to come back (offline replays, where no frame may be
+    lost).
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = 4, max_size: Optional[int] = None, name: str = "buffer"):
+        self.factory = factory
+        self.name = name
+        self.max_size = max(size, max_size or size)
+        self.allocations = 0
+        self.exhausted = 0
+        self._lock = threading.Condition()
+        self._free: List[Any] = [self._allocate() for _ in range(size)]
+        self._in_use = 0
+
+    @property
+    def in_use(self) -> int:
+        with self._lock:
+            return self._in_use
+
+    def _allocate(self):
+        self.allocations += 1
+        return self.factory()
+
+    def acquire(self, timeout: Optional[float] = 0) -> Optional[Lease]:
+        """Lease a buffer; when all are leased wait up to ``timeout`` seconds (None: forever) for one."""
+        with self._lock:
+            if not self._free and self._in_use >= self.max_size and timeout != 0:
+                self._lock.wait_for(lambda: self._free, timeout)
+            if self._free:
+                item = self._free.pop()
+            elif self._in_use < self.max_size:
+                item = self._allocate()
+            else:
+                self.exhausted += 1
+                logger.warning(f"{self.name} pool exhausted ({self.max_size} buffers leased)")
+                return None
+            self._in_use += 1
+        return Lease(self, item)
+
+    def _give_back(self, item):
+        with self._lock:
+            self._in_use -= 1
+            self._free.append(item)
+            self._lock.notify()
@@ -0,0 +1,158 @@
+"""Camera abstraction the capture pipeline goes through.
+
+Backends:
+
+* ``zed.zed_camera.ZedCamera``          - a ZED camera, stream or SVO file (needs pyzed)
+* ``zed.virtual_camera.SyntheticCamera`` - deterministic RGB, depth, bodies, objects and poses
+* ``zed.virtual_camera.ReplayCamera``    - replays a frame bundle recorded from any backend
+
+Retrieval goes through opaque buffers created by ``new_buffer``, which
+ZedRetrieval keeps in its pools (``sl.Mat``/``sl.Bodies`` for the ZED, NumPy
+arrays and small holders for the virtual backends). Only ``view``,
+``body_records`` and ``objects`` turn a buffer into NumPy data.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from utils.trajectory import CameraPose
+
+DEPTH = "depth"
+IMAGE = "image"
+BODIES = "bodies"
+OBJECTS = "objects"
+BUFFER_KINDS = (DEPTH, IMAGE, BODIES, OBJECTS)
+
+# ZED resolutions, in the order utils.zed_utils.parse_args matches them
+RESOLUTIONS = {
+    "HD2K": (2208, 1242),
+    "HD1200": (1920, 1200),
+    "HD1080": (1920, 1080),
+    "HD720": (1280, 720),
+    "SVGA": (960, 600),
+    "VGA": (672, 376),
+}
+DEFAULT_RESOLUTION = "HD2K"
+
+
+def resolution_size(name: str) -> Tuple[int, int]:
+    """``(width, height)`` for a ``--resolution`` value, HD2K when empty or unknown."""
+    for key, size in RESOLUTIONS.items():
+        if key in name:
+            return size
+    return RESOLUTIONS[DEFAULT_RESOLUTION]
+
+
+class GrabStatus(str, Enum):
+    SUCCESS = "success"
+    END_OF_STREAM = "end-of-stream"
+    ERROR = "error"
+
+
+@dataclass(frozen=True)
+class CameraInfo:
+    """Left camera resolution and intrinsics; doubles as the ``camera_res`` of ZedRetrieval."""
+    width: int
+    height: int
+    fps: float
+    fx: float
+    fy: float
+    cx: float
+    cy: float
+
+    def scaled(self, factor: float) -> "CameraInfo":
+        """Resolution and intrinsics of the frames retrieved at ``factor`` times the camera resolution."""
+        if factor == 1:
+            return self
+        width, height = max(1, round(self.width * factor)), max(1, round(self.height * factor))
+        sx, sy = width / self.width, height / self.height
+        return CameraInfo(width=width, height=height, fps=self.fps,
+                          fx=self.fx * sx, fy=self.fy * sy, cx=self.cx * sx, cy=self.cy * sy)
+
+    def intrinsics(self) -> dict:
+        return {"K": self.K, "width": self.width, "height": self.height}
+
+    @property
+    def K(self) -> List[List[float]]:
+        return [
+            [self.fx, 0, self.cx],
+            [0, self.fy, self.cy],
+            [0, 0, 1]
+        ]
+
+
+@dataclass
+class DetectedObject:
+    id: int
+    confidence: float
+    bounding_box_2d: np.ndarray  # (4, 2) corners, clockwise from top-left
+    mask: Optional[np.ndarray] = None  # uint8, bounding box sized
+
+
+class Camera(ABC):
+    info: CameraInfo
+
+    @abstractmethod
+    def grab(self, compute_depth: bool = True) -> GrabStatus:
+        """Advance to the next frame; the retrieve calls then refer to it.
+
+        Without ``compute_depth`` the frame's depth may not be retrieved.
+        """
+
+    @abstractmethod
+    def timestamp(self) -> int:
+        """Timestamp of the current frame in nanoseconds (SVO timestamps when replaying)."""
+
+    def seek(self, frame: int):
+        raise NotImplementedError(f"{type(self).__name__} cannot seek")
+
+    def num_frames(self) -> Optional[int]:
+        """Length of a recording, None for live sources."""
+        return None
+
+    @abstractmethod
+    def enable_positional_tracking(self) -> bool:
+        pass
+
+    @abstractmethod
+    def enable_body_tracking(self, params) -> bool:
+        """``params`` is a zed.body_tracking.BodyTrackingParameters; enabling again switches to ``params``."""
+
+    @abstractmethod
+    def enable_object_detection(self, params) -> bool:
+        """``params`` is a zed.object_detection.ObjectDetectionParameters; enabling again switches to ``params``."""
+
+    def set_depth_mode(self, mode: str) -> bool:
+        """Switch to another ``sl.DEPTH_MODE`` (by name) while running; False if the backend cannot."""
+        return False
+
+    @abstractmethod
+    def close(self):
+        """Disable the enabled modules and release the camera."""
+
+    @abstractmethod
+    def new_buffer(self, kind: str, width: int = 0, height: int = 0):
+        """A reusable buffer for ``kind``; depth and image buffers are ``width`` x ``height``."""
+
+    @abstractmethod
+    def retrieve(self, kind: str, buffer) -> bool:
+        """Fill ``buffer`` with the current frame's ``kind``; False on failure."""
+
+    def view(self, buffer) -> np.ndarray:
+        """Zero-copy NumPy view of a depth or image buffer."""
+        return buffer
+
+    @abstractmethod
+    def body_records(self, buffer, frame_id: int) -> np.ndarray:
+        """Tracked bodies of a bodies buffer as ``utils.body_records`` records."""
+
+    @abstractmethod
+    def objects(self, buffer) -> List[DetectedObject]:
+        """Detections of an objects buffer; masks are copies."""
+
+    @abstractmethod
+    def pose(self) -> CameraPose:
+        """World pose of the current frame."""
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+from functools import partial
+
+from loguru import logger
+
+from zed.options import add_capture_arguments, check_capture_options
+from zed.persist_profile import parse_capture_options
+from zed.scan_index import load_scan_index, parse_frame_ranges, select_segments
+from zed.svo_shard import capture_with_sdk, capture_with_stand_in, count_frames_with_sdk, extract_svo_files
+
+
+def _count_stand_in_frames(svo_path: str, num_frames: int) -> int:
+    return num_frames
+
+
+if __name__ == "__main__":
+    logger.remove(0)
+    logger.add(sys.stdout, level="INFO")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_svo_files', type=str, nargs='+', required=True, help='One or more .svo files to extract')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes, each with its own camera')
+    parser.add_argument('--shards_per_file', type=int, default=None, help='Frame ranges per SVO file, defaults to --workers')
+    parser.add_argument('--warmup_frames', type=int, default=30,
+                        help='Frames grabbed before each range so body tracking can settle; not saved')
+    parser.add_argument('--keep_shards', action='store_true', help='Keep EXP/shards after merging')
+    parser.add_argument('--stand_in_frames', type=int, default=0,
+                        help='Replay a synthetic SVO of this many frames instead of the files (no SDK needed)')
+    parser.add_argument('--scan_index', action='store_true',
+                        help='Only extract the segments with bodies, from the index zed/scan_svo.py wrote next to each file')
+    parser.add_argument('--frame_ranges', type=str, nargs='+', default=None,
+                        help='Only extract these START:END frame ranges (END exclusive) of every file')
+    parser.add_argument('--segment_min_confidence', type=float, default=50.0, help='Body confidence a segment needs, 0-100')
+    parser.add_argument('--segment_min_bodies', type=int, default=1, help='Bodies a segment needs in view')
+    parser.add_argument('--segment_max_gap', type=int, default=30, help='Merge segments fewer than this many frames apart')
+    parser.add_argument('--segment_padding', type=int, default=15, help='Frames added before and after every segment')
+    parser.add_argument('--segment_min_frames', type=int, default=15, help='Drop segments shorter than this')
+    add_capture_arguments(parser)
+    opt = parse_capture_options(parser)
+
+    error = check_capture_options(opt)
+    if error:
+        print(f"{error}. Exit program")
+        exit(1)
+    if opt.persist_backend != "files":
+        print("Sharded extraction merges per-frame files, use --persist_backend files. Exit program")
+        exit(1)
+    if opt.stand_in_frames == 0:
+        missing = [path for path in opt.input_svo_files if not os.path.isfile(path)]
+        if missing:
+            print(f"SVO files not found: {missing}. Exit program")
+            exit(1)
+    if opt.save_cam:
+        logger.warning("Positional tracking restarts in every shard: camera poses are relative to each range's first frame")
+
+    segments = None
+    if opt.scan_index and opt.frame_ranges:
+        print("Use either --scan_index or --frame_ranges, not both. Exit program")
+        exit(1)
+    if opt.frame_ranges:
+        try:
+            ranges = parse_frame_ranges(opt.frame_ranges)
+        except ValueError as e:
+            print(f"{e}. Exit program")
+            exit(1)
+        segments = {path: ranges for path in opt.input_svo_files}
+    elif opt.scan_index:
+        segments = {}
+        for path in opt.input_svo_files:
+            index = load_scan_index(path)
+            if index is None:
+                print(f"No current scan index for {path}, run zed/scan_svo.py first. Exit program")
+                exit(1)
+            records, header = index
+            segments[path] = select_segments(records, header["num_frames"] or int(records["frame"].max()) + 1,
+                                             min_confidence=opt.segment_min_confidence,
+                                             min_bodies=opt.segment_min_bodies,
+                                             max_gap=opt.segment_max_gap,
+                                             padding=opt.segment_padding,
+                                             min_frames=opt.segment_min_frames)
+            logger.info(f"{path}: {len(segments[path])} segments, "
+                        f"{sum(len(segment) for segment in segments[path])} of {header['num_frames']} frames")
+
+    if opt.stand_in_frames > 0:
+        capture = capture_with_stand_in
+        count_frames = partial(_count_stand_in_frames, num_frames=opt.stand_in_frames)
+    else:
+        capture = capture_with_sdk
+        count_frames = count_frames_with_sdk
+
+    experiments = extract_svo_files(opt.input_svo_files, opt,
+                                    workers=opt.workers,
+                                    num_shards=opt.shards_per_file or opt.workers,
+                                    capture=capture,
+                                    count_frames=count_frames,
+                                    warmup_frames=opt.warmup_frames,
+                                    keep_shards=opt.keep_shards,
+                                    segments=segments)
+    for svo_path, exp_dir in experiments.items():
+        print(f"{svo_path} -> {exp_dir}")
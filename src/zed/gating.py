@@ -0,0 +1,103 @@
+"""Content-aware gating of sampled frames.
+
+The stride sampler keeps every Nth frame whatever it shows. ``FrameGate``
+looks at the cheap body tracking output of a sampled frame first and only
+lets it through to the depth/image retrieval when a confident body is in view
+and has moved since the last kept frame. ``max_gap`` bounds how many sampled
+frames in a row can be skipped, so the capture never goes dark for long.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+# skip reasons
+NO_BODY = "no_body"
+LOW_CONFIDENCE = "low_confidence"
+STATIC = "static"
+SKIP_REASONS = (NO_BODY, LOW_CONFIDENCE, STATIC)
+# why a frame was kept
+PASSED = "passed"
+MAX_GAP = "max_gap"
+
+
+@dataclass
+class GateConfig:
+    min_confidence: float = 50.0  # body confidence, 0-100
+    min_displacement: float = 10.0  # median 2D keypoint displacement in pixels, 0 keeps static frames
+    max_gap: int = 30  # sampled frames skipped in a row before one is kept anyway, 0 for no limit
+
+    @classmethod
+    def from_options(cls, opt) -> "GateConfig":
+        return cls(min_confidence=opt.gate_min_confidence,
+                   min_displacement=opt.gate_min_displacement,
+                   max_gap=opt.gate_max_gap)
+
+
+def keypoint_displacement(previous: np.ndarray, current: np.ndarray) -> float:
+    """Median pixel displacement over the keypoints visible in both frames; inf if none are."""
+    # the SDK marks undetected 2D keypoints NaN or (-1, -1)
+    visible = (np.isfinite(previous).all(axis=-1) & np.isfinite(current).all(axis=-1)
+               & (previous >= 0).all(axis=-1) & (current >= 0).all(axis=-1))
+    if not visible.any():
+        return float("inf")
+    return float(np.median(np.linalg.norm(current[visible] - previous[visible], axis=-1)))
+
+
+class FrameGate:
+    """Decides, from a frame's body records (``utils.body_records``), whether to keep it."""
+
+    def __init__(self, config: GateConfig = GateConfig()):
+        self.config = config
+        self.kept: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self._gap = 0
+        # keypoints_2d of every confident body of the last kept frame, by body id
+        self._last_kept: Dict[int, np.ndarray] = {}
+
+    def _skip_reason(self, confident: np.ndarray) -> Optional[str]:
+        if self.config.min_displacement <= 0:
+            return None
+        for record in confident:
+            previous = self._last_kept.get(int(record["body_id"]))
+            # a body that just came into view counts as moved
+            if previous is None or previous.shape != record["keypoints_2d"].shape:
+                return None
+            if keypoint_displacement(previous, record["keypoints_2d"]) >= self.config.min_displacement:
+                return None
+        return STATIC
+
+    def check(self, records: np.ndarray) -> Optional[str]:
+        """The reason to skip the frame, or None to keep it."""
+        confident = records[records["confidence"] >= self.config.min_confidence]
+        if not len(records):
+            reason = NO_BODY
+        elif not len(confident):
+            reason = LOW_CONFIDENCE
+        else:
+            reason = self._skip_reason(confident)
+
+        if reason is not None and self.config.max_gap and self._gap >= self.config.max_gap:
+            self.kept[MAX_GAP] += 1
+            reason = None
+        elif reason is not None:
+            self.skipped[reason] += 1
+            self._gap += 1
+            return reason
+        else:
+            self.kept[PASSED] += 1
+
+        self._gap = 0
+        if len(confident):
+            self._last_kept = {int(record["body_id"]): record["keypoints_2d"].copy() for record in confident}
+        return None
+
+    def stats(self) -> dict:
+        checked = sum(self.kept.values()) + sum(self.skipped.values())
+        return {
+            "checked": checked,
+            "kept": dict(self.kept),
+            "skipped": {reason: self.skipped[reason] for reason in SKIP_REASONS},
+            "kept_ratio": sum(self.kept.values()) / checked if checked else 0.0,
+        }
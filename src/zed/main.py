@@ -1,237 +1,255 @@
 import json
-import numpy as np
 from zed.object_detection import ObjectDetection
 from zed.body_tracking import BodyTracking
-from utils.zed_utils import parse_args
 import argparse
-from pyzed import sl
 from loguru import logger
-from threading import Lock, Thread
-import os
 import sys
 from pathlib import Path
-import time
+from typing import Optional
 from zed.retrieve import ZedRetrieval
-from zed.persist import ZedSaver
-lock = Lock()
-logger.remove(0)
-logger.add(sys.stdout, level="TRACE")
-
-
-
-
-def main(opt):
-    ROOT_DIR = Path(__file__).parent.parent.parent / ".data" / "experiments"
-    ROOT_DIR.mkdir(parents=True, exist_ok=True)
-    COUNT = len(os.listdir(ROOT_DIR))
-    EXP_DIR = ROOT_DIR / f"EXP_{COUNT+1}"
-    EXP_DIR.mkdir(exist_ok=True, parents=True)
-
+from zed.persist import CaptureStoreSaver, ZedSaver, new_experiment_dir
+from utils.capture_store import CaptureStoreWriter
+from utils.depth_codec import DepthFormat
+from utils.image_codec import ImageEncoder, ImageEncoding
+from utils.body_records import body_record_dtype
+from utils.quality_log import QualityLog
+from utils.shm_ring import FrameRingPublisher, slot_capacity
+from utils.telemetry import TELEMETRY, TelemetryExporter, summarize
+from zed.camera import Camera, resolution_size
+from zed.gating import FrameGate, GateConfig
+from zed.options import CAPTURE_FPS, add_camera_arguments, add_capture_arguments, check_capture_options
+from zed.persist_pool import DropPolicy, PersistencePool
+from zed.persist_profile import parse_capture_options
+from zed.person_mask import MaskConfig
+from zed.pipeline import CaptureEngine, CapturePlan
+from zed.quality import ControllerConfig, QualityController, QualityLevel, ladder_metadata, load_ladder
+from zed.replay import ReplayMode
+from zed.virtual_camera import ReplayCamera, SyntheticCamera
+
+SHM_MAX_BODIES = 16  # body records a shared memory slot has room for
+
+
+def open_camera(opt) -> Camera:
+    """The ZED (camera, stream or SVO file), a synthetic camera or a recorded frame bundle, per ``--camera``."""
+    if opt.camera == "synthetic":
+        width, height = resolution_size(opt.resolution)
+        logger.info(f"Using a synthetic {width}x{height} camera")
+        return SyntheticCamera(width, height, fps=CAPTURE_FPS, num_frames=opt.synthetic_frames or None,
+                               realtime=opt.realtime)
+    if opt.camera == "replay":
+        logger.info(f"Replaying frame bundle {opt.bundle_path}")
+        return ReplayCamera(Path(opt.bundle_path), realtime=opt.realtime)
+    # the SDK is only needed for a real camera
+    from zed.zed_camera import ZedCamera
+    return ZedCamera.open(opt)
+
+
+def run_capture(opt, exp_dir: Path, start_frame: int = 0, end_frame: Optional[int] = None,
+                first_counter: int = 0, warmup_frames: int = 0) -> CaptureEngine:
+    """Capture into ``exp_dir``, optionally only SVO frames [start_frame, end_frame); returns the finished engine."""
     logger.info("Running Zed Capture Module.......")
-    
-    # Initialize camera parameters
-    init = sl.InitParameters(
-        depth_mode=sl.DEPTH_MODE.NEURAL_PLUS,
-        coordinate_units=sl.UNIT.METER,
-        coordinate_system=sl.COORDINATE_SYSTEM.RIGHT_HANDED_Y_UP,
-        camera_resolution=sl.RESOLUTION.HD2K,
-        camera_fps = 30
-    )
-
-    # Initialize the runtime parameters
-    runtime_parameters = sl.RuntimeParameters()
-    runtime_parameters.confidence_threshold = 50  # Reasonable confidence threshold (0-100)
-    runtime_parameters.texture_confidence_threshold = 100  # Filters weak textures (0-100)
-    # runtime_parameters.remove_saturated_areas = True  
-
-    # Parse additional arguments
-    parse_args(init, opt=opt)
-    
-    # Create and open camera
-    zed = sl.Camera()
-    status = zed.open(init)
-    if status != sl.ERROR_CODE.SUCCESS:
-        logger.error(f"Cannot open the camera: {repr(status)}")
-        exit(1)
+
+    camera = open_camera(opt)
     
     # Initialize object detection 
     object_detection = None
     if opt.enable_od:
         try:
-            object_detection = ObjectDetection(zed=zed)
+            object_detection = ObjectDetection(camera)
             logger.info("Object detection enabled")
         except Exception as e:
             logger.error(f"Failed to initialize object detection: {e}")
 
     # Initialize body tracking - Enable by default for keypoint extraction
     body_tracker = None
-    if opt.enable_body_tracking or opt.extract_keypoints:
+    if opt.enable_body_tracking or opt.extract_keypoints or opt.extract_masks or opt.gate or opt.roi:
         try:
-            body_tracker = BodyTracking(zed)
+            body_tracker = BodyTracking(camera)
             # body_tracker.initialize_body_tracker()
         except Exception as e:
             logger.error(f"Failed to initialize body tracking: {e}")
 
     # Get camera information
-    camera_infos = zed.get_camera_information()
-    camera_res = camera_infos.camera_configuration.resolution
-    calibration_params = camera_infos.camera_configuration.calibration_parameters
-    left_cam_params = calibration_params.left_cam
-
-    # Extract intrinsic parameters
-    fx = left_cam_params.fx
-    fy = left_cam_params.fy
-    cx = left_cam_params.cx
-    cy = left_cam_params.cy
-    K = [
-        [fx, 0,  cx],
-        [0,  fy, cy],
-        [0,  0,  1]
-    ]
-    logger.debug(f"Camera intrinsics - fx: {fx}, fy: {fy}, cx: {cx}, cy: {cy}")
-    with open(EXP_DIR/"camera_intrinsic.json",mode="w") as fin:
-        json.dump({"K":K},fin)
-
-    # Initialize counters and timing
-    counter = 0
-    frame_counter = 0
-    fps = 30
-    save_interval_seconds = 0.05  # Save a frame every 0.05 seconds
-    
-    # Handle unrealistic FPS values - cap at reasonable maximum
-    if fps > 200 or fps <= 0:
-        logger.warning(f"Unrealistic FPS reported: {fps}, using time-based capture instead")
-        use_time_based = True
-        last_save_time = time.time()
-    else:
-        use_time_based = False
-        frames_to_skip = max(1, int(fps * save_interval_seconds))
-        logger.info(f"Camera FPS: {fps}, saving every {frames_to_skip} frames ({1/save_interval_seconds} captures per second)")
-    
-    if use_time_based:
-        logger.info(f"Using time-based capture: saving every {save_interval_seconds} seconds")
+    camera_info = camera.info
+    logger.debug(f"Camera intrinsics - fx: {camera_info.fx}, fy: {camera_info.fy}, "
+                 f"cx: {camera_info.cx}, cy: {camera_info.cy}")
+    # depth and images may be retrieved below the camera resolution, each with its own intrinsics
+    depth_res = camera_info.scaled(opt.depth_resolution)
+    image_res = camera_info.scaled(opt.image_resolution)
+    if depth_res != camera_info or image_res != camera_info:
+        logger.info(f"Retrieving depth at {depth_res.width}x{depth_res.height}, "
+                    f"images at {image_res.width}x{image_res.height}")
+    with open(exp_dir/"camera_intrinsic.json",mode="w") as fin:
+        # "K" matches the saved images
+        json.dump({"K":image_res.K, "camera":camera_info.intrinsics(),
+                   "depth":depth_res.intrinsics(), "image":image_res.intrinsics()},fin)
 
     # initialize the zed_retrieval 
-    zed_retrieval = ZedRetrieval(zed=zed)
+    zed_retrieval = ZedRetrieval(camera, max_pool_size=opt.buffer_pool_size)
+
+    # bounded writer pool shared by every ZedSaver call
+    persist_pool = PersistencePool(num_workers=opt.persist_workers,
+                                   max_queue_size=opt.persist_queue_size,
+                                   policy=DropPolicy(opt.persist_policy))
+
+    # either one file per frame per modality, or chunked per-modality streams under exp_dir/store
+    capture_store = None
+    saver = ZedSaver
+    if opt.persist_backend == "store":
+        capture_store = CaptureStoreWriter(exp_dir / "store", chunk_frames=opt.store_chunk_frames)
+        saver = CaptureStoreSaver(capture_store)
+        logger.info(f"Writing to capture store at {capture_store.root}")
+
+    depth_format = DepthFormat(codec=opt.depth_codec, container=opt.depth_container)
+    logger.info(f"Depth format: {depth_format.codec.value} in {depth_format.container.value}")
+
+    image_encoder = ImageEncoder(ImageEncoding(format=opt.image_format,
+                                               png_compress_level=opt.png_compress_level,
+                                               quality=opt.image_quality),
+                                 processes=opt.encode_processes)
+
+    telemetry_exporter = None
+    if opt.telemetry:
+        TELEMETRY.enable()
+        suffix = ".prom" if opt.telemetry_format == "prometheus" else ".json"
+        telemetry_path = Path(opt.telemetry_path) if opt.telemetry_path else exp_dir / f"telemetry{suffix}"
+        telemetry_exporter = TelemetryExporter(TELEMETRY, telemetry_path, format=opt.telemetry_format,
+                                               interval=opt.telemetry_interval).start()
+        logger.info(f"Exporting telemetry to {telemetry_path} every {opt.telemetry_interval}s")
+
+    gate = None
+    if opt.gate:
+        if body_tracker is not None and body_tracker.enabled:
+            gate = FrameGate(GateConfig.from_options(opt))
+            logger.info(f"Gating sampled frames: {gate.config}")
+        else:
+            logger.warning("Gating needs body tracking, saving every sampled frame")
+
+    roi_padding = None
+    if opt.roi:
+        if body_tracker is not None and body_tracker.enabled:
+            roi_padding = opt.roi_padding
+            logger.info(f"Storing depth and masks inside the body bounding box padded by {roi_padding:.0%}")
+        else:
+            logger.warning("ROI crops need body tracking, storing full frames")
+
+    quality = quality_log = None
+    if opt.adaptive_quality:
+        body_params = body_tracker.body_param if body_tracker is not None and body_tracker.enabled else None
+        object_params = object_detection.obj_param if object_detection is not None else None
+        base = QualityLevel(name="configured", depth_mode=opt.depth_mode,
+                            body_model=body_params.detection_model if body_params is not None else None,
+                            object_model=object_params.detection_model if object_params is not None else None)
+        ladder = load_ladder(opt.quality_ladder, base)
+        target_fps = opt.target_fps or camera_info.fps
+        quality = QualityController(ladder, ControllerConfig(target_fps=target_fps),
+                                    body_params=body_params, object_params=object_params)
+        quality_log = QualityLog(exp_dir, ladder_metadata(ladder), target_fps)
+        logger.info(f"Adaptive quality at {target_fps} fps over {[level.name for level in ladder]}")
+
+    publisher = None
+    if opt.shm_ring:
+        # resolutions only go down with adaptive quality, so the configured ones bound the slot size
+        slot_size = slot_capacity({
+            "image": ((image_res.height, image_res.width, 4), "u1"),
+            "depth": ((depth_res.height, depth_res.width), "<f4"),
+            "bodies": ((SHM_MAX_BODIES,), body_record_dtype()),
+            "pose": ((4, 4), "<f8"),
+        })
+        publisher = FrameRingPublisher(opt.shm_ring, slot_size, num_slots=opt.shm_slots, policy=opt.shm_policy)
+
+    if opt.extract_masks and object_detection is None:
+        logger.warning("--extract_masks needs --enable_od, leaving the masks to data/extract_mask.py")
+
+    plan = CapturePlan.from_options(opt, body_tracker=body_tracker, object_detection=object_detection)
+    logger.info(f"Capture plan: {plan}")
+    engine = CaptureEngine(camera=camera,
+                           zed_retrieval=zed_retrieval,
+                           persist_pool=persist_pool,
+                           exp_dir=exp_dir,
+                           plan=plan,
+                           camera_res=camera_info,
+                           fps=CAPTURE_FPS,
+                           save_interval_seconds=opt.save_interval,
+                           ring_size=opt.ring_size,
+                           saver=saver,
+                           depth_format=depth_format,
+                           image_encoder=image_encoder,
+                           keypoint_format=opt.keypoint_format,
+                           camera_format=opt.camera_format,
+                           start_frame=start_frame,
+                           end_frame=end_frame,
+                           first_counter=first_counter,
+                           warmup_frames=warmup_frames,
+                           gate=gate,
+                           depth_res=depth_res,
+                           image_res=image_res,
+                           roi_padding=roi_padding,
+                           sampling=opt.sampling,
+                           replay_mode=ReplayMode(opt.replay_mode),
+                           quality=quality,
+                           quality_log=quality_log,
+                           publisher=publisher,
+                           mask_config=MaskConfig(min_iou=opt.mask_min_iou, min_fill=opt.mask_min_fill))
 
     try:
-        while True:
-            # Grab a new frame
-            if zed.grab(runtime_parameters) == sl.ERROR_CODE.SUCCESS:
-                # Determine if we should process this frame
-                should_process = False
-                
-                if use_time_based:
-                    current_time = time.time()
-                    if current_time - last_save_time >= save_interval_seconds:
-                        should_process = True
-                        last_save_time = current_time
-                else:
-                    if frame_counter % frames_to_skip == 0:
-                        should_process = True
-                
-                if should_process:
-                    logger.info(f"Processing frame #{counter} (frame_counter: {frame_counter})")
-
-                    # Retrieve data with proper error handling
-                    depth_map = None
-                    left_image = None
-                    keypoints_data = None
-                    mask_data = None
-                    extrinsic_matrix = None
-                    with lock:  # Use context manager for lock
-                        # Retrieve Camera Extrinsic Matrix 
-                        extrinsic_matrix = zed_retrieval.retrieve_camera_extrinsic_matrix()
-
-                        
-                        if object_detection:
-                            all_objects = zed_retrieval.zed_retrieve_object_detections(runtime_params=object_detection.obj_runtime_params,
-                                                                                       instance_id=object_detection.obj_param.instance_module_id)
-                            if all_objects:
-                                logger.debug(f"Detected {len(all_objects)} objects")
-
-                        # Retrieve body tracking data and keypoints
-                        if body_tracker and opt.extract_keypoints:
-                            bodies = zed_retrieval.zed_retrieve_bodies(tracking_params=body_tracker.runtime_param,
-                                                                       instance_module_id=body_tracker.body_param.instance_module_id)
-                            if bodies:
-                                keypoints_data = ZedRetrieval.extract_keypoints_and_masks(bodies, camera_res)
-                                logger.debug(f"Extracted keypoints for {len(keypoints_data['bodies'])} bodies")
-
-                        # Retrieve depth map
-                        depth_map = zed_retrieval.zed_retrieve_depth_map(camera_res=camera_res)
-                        if depth_map is None:
-                            logger.warning(f"Failed to retrieve depth map for frame {counter}")
-
-                        # Retrieve left image
-                        left_image = zed_retrieval.zed_retrieve_left_image(camera_res=camera_res)
-                        if left_image is None:
-                            logger.warning(f"Failed to retrieve left image for frame {counter}")
-                        
-                        # Retrieve mask if requested
-                        if opt.extract_masks:
-                            mask_data = zed_retrieval.zed_extract_segmentation_masks(all_objects)
-                            if mask_data is None:
-                                logger.warning(f"Failed to retrieve mask for frame {counter}")
-                            else:
-                                logger.info(f"detected_masks {len(mask_data)}")
-
-                                mask_data = mask_data[0]
-                    # Save data if requested
-                    if opt.save:
-                        if depth_map is not None:
-                            Thread(target=ZedSaver.save_depth_map, args=(depth_map, EXP_DIR, counter)).start()
-                        if left_image is not None:
-                            Thread(target=ZedSaver.save_image_from_zed, args=(left_image, EXP_DIR, counter)).start()
-                        if keypoints_data is not None and opt.extract_keypoints:
-                            Thread(target=ZedSaver.save_keypoints_and_masks, args=(keypoints_data, EXP_DIR, counter)).start()
-                        if mask_data is not None and opt.extract_masks:
-                            Thread(target=ZedSaver.save_mask, args=(mask_data, EXP_DIR, counter)).start()
-                    if opt.save_cam:
-                        if extrinsic_matrix is not None:
-                            Thread(target=ZedSaver.save_extrinsic_matrix, args=(extrinsic_matrix, EXP_DIR, counter)).start()
-                    counter += 1
-                    
-                frame_counter += 1
-                
-            elif zed.grab(runtime_parameters) == sl.ERROR_CODE.END_OF_SVOFILE_REACHED:
-                logger.info("End of SVO file reached")
-                break
-            else:
-                logger.error(f"Failed to grab frame: {zed.grab(runtime_parameters)}")
-                break
-                
+        engine.run()
     except KeyboardInterrupt:
         logger.info("Interrupted by user")
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
     finally:
         # Cleanup
+        logger.info("Flushing pending writes...")
+        persist_pool.close()
+        ZedSaver.close_session_writers()
+        if capture_store is not None:
+            capture_store.close()
+        image_encoder.close()
+        if publisher is not None:
+            publisher.close()
+        logger.info(f"Image encoding: {image_encoder.report()}")
+        if telemetry_exporter is not None:
+            logger.info(f"Capture telemetry:\n{summarize(telemetry_exporter.stop())}")
+            TELEMETRY.disable()
         logger.info("Closing camera...")
-        if body_tracker:
-            zed.disable_body_tracking()
-        if object_detection:
-            zed.disable_object_detection()
-        zed.close()
+        camera.close()
         logger.info("Camera closed successfully")
+    return engine
+
+
+def main(opt):
+    try:
+        run_capture(opt, new_experiment_dir())
+    except RuntimeError:
+        exit(1)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument('--log_level', type=str, default="INFO",
+                        help='Log level; DEBUG/TRACE log every frame, which slows the capture down')
     parser.add_argument('--input_svo_file', type=str, help='Path to an .svo file, if you want to replay it', default='')
     parser.add_argument('--ip_address', type=str, help='IP Address, in format a.b.c.d:port or a.b.c.d, if you have a streaming setup', default='')
-    parser.add_argument('--resolution', type=str, help='Resolution, can be either HD2K, HD1200, HD1080, HD720, SVGA or VGA', default='')
-    parser.add_argument('--enable_od', action='store_true', help="Enable object detection for filtering human from the environment")
-    parser.add_argument('--enable_body_tracking', action='store_true', help="Enable body tracker")
-    parser.add_argument('--extract_keypoints', action='store_true', help="Extract and save 2D/3D keypoints")
-    parser.add_argument('--extract_masks', action='store_true', help="Extract and save segmentation masks")
-    parser.add_argument("--save", action='store_true', help="Save captured data")
-    parser.add_argument("--save_cam", action='store_true', help="Save captured data")
-
-    opt = parser.parse_args()
+    add_camera_arguments(parser)
+    add_capture_arguments(parser)
+
+    opt = parse_capture_options(parser)
+
+    logger.remove(0)
+    logger.add(sys.stdout, level=opt.log_level)
     
+    error = check_capture_options(opt)
+    if error:
+        print(f"{error}. Exit program")
+        exit(1)
+
+    if opt.camera == "replay" and not opt.bundle_path:
+        print("--camera replay requires --bundle_path. Exit program")
+        exit(1)
+
     if len(opt.input_svo_file) > 0 and len(opt.ip_address) > 0:
         print("Specify only input_svo_file or ip_address, or none to use wired camera, not both. Exit program")
         exit(1)
     
-    main(opt=opt)
\ No newline at end of file
+    main(opt=opt)
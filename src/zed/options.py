@@ -0,0 +1,146 @@
+"""Command line options shared by the capture entry points (zed/main.py, zed/extract_svo.py).
+
+Kept free of SDK imports so the option parsing and sampling maths can be used
+on machines without pyzed.
+"""
+import argparse
+from typing import Optional
+
+from utils.depth_codec import DepthCodec, DepthContainer
+from utils.image_codec import ImageFormat
+from utils.shm_ring import SLOW_CONSUMER_POLICIES
+from utils.telemetry import TELEMETRY_FORMATS
+from zed.persist_pool import DropPolicy
+from zed.persist_profile import DEFAULT_PROFILE_PATH
+from zed.replay import ReplayMode
+
+CAPTURE_FPS = 30
+SAVE_INTERVAL_SECONDS = 0.05  # Save a frame every 0.05 seconds
+
+
+def sampling_stride(fps: int = CAPTURE_FPS, save_interval_seconds: float = SAVE_INTERVAL_SECONDS) -> Optional[int]:
+    """Every how many grabbed frames one is sampled, or None when ``fps`` is unrealistic and sampling is time based."""
+    if fps > 200 or fps <= 0:
+        return None
+    return max(1, int(fps * save_interval_seconds))
+
+
+CAMERA_BACKENDS = ("zed", "synthetic", "replay")
+
+
+def add_camera_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument('--camera', type=str, default="zed", choices=list(CAMERA_BACKENDS),
+                        help="Capture from the ZED, a synthetic camera, or replay a frame bundle (no SDK needed)")
+    parser.add_argument('--bundle_path', type=str, default='', help="Frame bundle to replay, see zed/record_bundle.py")
+    parser.add_argument('--synthetic_frames', type=int, default=300,
+                        help="Frames the synthetic camera produces (0 streams until interrupted)")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Pace the synthetic and replay cameras to the capture fps instead of running flat out")
+    return parser
+
+
+def add_capture_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument('--save_interval', type=float, default=SAVE_INTERVAL_SECONDS, help="Seconds between sampled frames")
+    parser.add_argument('--sampling', type=str, default="frames", choices=["frames", "timestamps"],
+                        help="Sample every N-th frame, or the first frame of every interval on the camera clock")
+    parser.add_argument('--replay_mode', type=str, default=ReplayMode.SKIP_DEPTH.value,
+                        choices=[mode.value for mode in ReplayMode],
+                        help="How recordings skip unsampled frames: grab them with depth (full), "
+                             "without depth (skip-depth), or seek past them (seek)")
+    parser.add_argument('--resolution', type=str, help='Resolution, can be either HD2K, HD1200, HD1080, HD720, SVGA or VGA', default='')
+    parser.add_argument('--enable_od', action='store_true', help="Enable object detection for filtering human from the environment")
+    parser.add_argument('--enable_body_tracking', action='store_true', help="Enable body tracker")
+    parser.add_argument('--extract_keypoints', action='store_true', help="Extract and save 2D/3D keypoints")
+    parser.add_argument('--extract_masks', action='store_true', help="Extract and save segmentation masks")
+    parser.add_argument("--save", action='store_true', help="Save captured data")
+    parser.add_argument("--save_cam", action='store_true', help="Save captured data")
+    parser.add_argument("--persist_profile", type=str, default=str(DEFAULT_PROFILE_PATH),
+                        help="Persistence settings tuned by zed/autotune.py, used unless given on the command line "
+                             "('' to ignore)")
+    parser.add_argument("--persist_workers", type=int, default=4, help="Number of writer threads")
+    parser.add_argument("--persist_queue_size", type=int, default=64, help="Maximum number of pending writes")
+    parser.add_argument("--persist_policy", type=str, default=DropPolicy.BLOCK.value,
+                        choices=[policy.value for policy in DropPolicy],
+                        help="What to do when the write queue is full")
+    parser.add_argument("--ring_size", type=int, default=8, help="Frames buffered between the grab and process stages")
+    parser.add_argument("--persist_backend", type=str, default="files", choices=["files", "store"],
+                        help="Write one file per frame, or append to a chunked capture store")
+    parser.add_argument("--store_chunk_frames", type=int, default=64, help="Frames per chunk for fixed-shape store streams")
+    parser.add_argument("--depth_codec", type=str, default=DepthCodec.FLOAT32.value,
+                        choices=[codec.value for codec in DepthCodec], help="How depth values are encoded")
+    parser.add_argument("--depth_container", type=str, default=DepthContainer.NPY.value,
+                        choices=[container.value for container in DepthContainer],
+                        help="File format for depth maps (png requires uint16-mm)")
+    parser.add_argument("--keypoint_format", type=str, default="json", choices=["json", "binary"],
+                        help="Write bodies/NNNNN.json, or append compact records to body-records.bin")
+    parser.add_argument("--camera_format", type=str, default="json", choices=["json", "trajectory"],
+                        help="Write camera/NNNNN.json, or append poses to a single trajectory.bin")
+    parser.add_argument("--image_format", type=str, default=ImageFormat.PNG.value,
+                        choices=[image_format.value for image_format in ImageFormat], help="How RGB frames are encoded")
+    parser.add_argument("--png_compress_level", type=int, default=6, help="PNG zlib level, 0 (fastest) to 9 (smallest)")
+    parser.add_argument("--image_quality", type=int, default=90, help="JPEG/WebP quality")
+    parser.add_argument("--encode_processes", type=int, default=0,
+                        help="Encode images in this many worker processes (0 encodes in the writer threads)")
+    parser.add_argument("--buffer_pool_size", type=int, default=16, help="Maximum number of recycled buffers per modality")
+    parser.add_argument("--depth_resolution", type=float, default=1.0,
+                        help="Retrieve depth at this fraction of the camera resolution, e.g. 0.5")
+    parser.add_argument("--image_resolution", type=float, default=1.0,
+                        help="Retrieve images at this fraction of the camera resolution")
+    parser.add_argument("--roi", action='store_true',
+                        help="Store depth and masks only inside the padded body bounding box (enables body tracking)")
+    parser.add_argument("--roi_padding", type=float, default=0.1,
+                        help="ROI padding on every side, as a fraction of the body bounding box size")
+    parser.add_argument("--mask_min_iou", type=float, default=0.5,
+                        help="Overlap a ZED person detection needs with the tracked body for its mask to be saved")
+    parser.add_argument("--mask_min_fill", type=float, default=0.1,
+                        help="Fraction of its bounding box a ZED mask has to cover to be saved")
+    parser.add_argument("--gate", action='store_true',
+                        help="Only save sampled frames with a confident, moving body (enables body tracking)")
+    parser.add_argument("--gate_min_confidence", type=float, default=50.0, help="Minimum body confidence (0-100) to keep a frame")
+    parser.add_argument("--gate_min_displacement", type=float, default=10.0,
+                        help="Minimum median keypoint displacement in pixels since the last kept frame (0 keeps static frames)")
+    parser.add_argument("--gate_max_gap", type=int, default=30,
+                        help="Keep a frame anyway after this many sampled frames in a row were skipped (0 for no limit)")
+    parser.add_argument("--depth_mode", type=str, default="NEURAL_PLUS", help="sl.DEPTH_MODE of the ZED")
+    parser.add_argument("--adaptive_quality", action='store_true',
+                        help="On live cameras, step down a quality ladder when the capture falls below --target_fps")
+    parser.add_argument("--quality_ladder", type=str, default=None,
+                        help="JSON list of quality levels (see zed/quality.py), defaults to the built-in ladder")
+    parser.add_argument("--target_fps", type=float, default=0,
+                        help="Grab rate adaptive quality keeps up with, 0 for the camera fps")
+    parser.add_argument("--shm_ring", type=str, default='',
+                        help="Also publish every sampled frame to this shared memory ring (see utils/shm_ring.py)")
+    parser.add_argument("--shm_slots", type=int, default=8, help="Frames the shared memory ring holds")
+    parser.add_argument("--shm_policy", type=str, default="overwrite", choices=list(SLOW_CONSUMER_POLICIES),
+                        help="Overwrite frames slow consumers still hold, or skip publishing until they let go")
+    parser.add_argument("--telemetry", action='store_true', help="Record per-stage latency histograms and frame counters")
+    parser.add_argument("--telemetry_format", type=str, default="json", choices=list(TELEMETRY_FORMATS),
+                        help="Export telemetry as JSON or Prometheus text")
+    parser.add_argument("--telemetry_path", type=str, default=None,
+                        help="Where to export telemetry, defaults to EXP_DIR/telemetry.json (.prom)")
+    parser.add_argument("--telemetry_interval", type=float, default=5.0, help="Seconds between telemetry exports")
+    return parser
+
+
+def check_capture_options(opt) -> Optional[str]:
+    """An error message for inconsistent options, or None."""
+    if opt.depth_container == DepthContainer.PNG.value and opt.depth_codec != DepthCodec.UINT16_MM.value:
+        return f"--depth_container png requires --depth_codec {DepthCodec.UINT16_MM.value}"
+    if opt.save_interval <= 0:
+        return "--save_interval must be > 0"
+    for name in ("depth_resolution", "image_resolution"):
+        if not 0 < getattr(opt, name) <= 1:
+            return f"--{name} must be in (0, 1]"
+    if opt.roi_padding < 0:
+        return "--roi_padding must be >= 0"
+    if opt.target_fps < 0:
+        return "--target_fps must be >= 0"
+    if opt.shm_ring and not opt.save:
+        return "--shm_ring publishes the retrieved frames, add --save"
+    if opt.shm_slots < 2:
+        return "--shm_slots must be at least 2"
+    if opt.roi and opt.persist_backend != "files":
+        return "--roi crops vary in size, use --persist_backend files"
+    if opt.adaptive_quality and opt.persist_backend != "files":
+        return "--adaptive_quality may change the retrieval resolution, use --persist_backend files"
+    return None
@@ -1,21 +1,80 @@
+import io
 import json
+import os
+import threading
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 from loguru import logger
 import numpy as np
 from PIL import Image
+from utils.body_records import BodyRecordWriter, records_to_frame_data
+from utils.capture_store import CaptureStoreWriter
+from utils.depth_codec import DepthFormat, encode_depth, write_depth
+from utils.image_codec import ImageEncoder, ImageEncoding, encode_image
+from utils.roi import ROI_DTYPE, Roi, RoiWriter
+from utils.telemetry import TELEMETRY
+from utils.trajectory import TRAJECTORY_DTYPE, CameraPose, TrajectoryWriter
+
+EXPERIMENTS_ROOT = Path(__file__).parent.parent.parent / ".data" / "experiments"
+
+# append-only session files (body-records.bin, trajectory.bin, roi.bin), one writer per
+# experiment and file type, shared by the writer threads
+_session_writers: Dict[Tuple[Path, type], object] = {}
+_session_writers_lock = threading.Lock()
+
+
+def _session_writer(exp_path: Path, writer_cls):
+    with _session_writers_lock:
+        writer = _session_writers.get((exp_path, writer_cls))
+        if writer is None:
+            writer = _session_writers[(exp_path, writer_cls)] = writer_cls(exp_path)
+    return writer
+
+
+def new_experiment_dir(root: Path = EXPERIMENTS_ROOT) -> Path:
+    """Create the next ``EXP_{N}`` directory under ``root``."""
+    root.mkdir(parents=True, exist_ok=True)
+    count = len(os.listdir(root))
+    exp_dir = root / f"EXP_{count+1}"
+    exp_dir.mkdir(exist_ok=True, parents=True)
+    return exp_dir
+
+
+def _count_written(modality: str, path: Path):
+    # stat only when someone is listening
+    if TELEMETRY.enabled:
+        TELEMETRY.count("bytes_written", path.stat().st_size, modality)
+
+
 class ZedSaver:
     @staticmethod
-    def save_depth_map(depth_image_np: np.ndarray, exp_path: Path, counter: int):
+    def to_mask_image(mask_np: np.ndarray) -> Image.Image:
+        """Binary mask as data/extract_mask.py writes it: RGB, 0 or 255"""
+        if len(mask_np.shape) == 3:
+            mask_np = mask_np[:, :, 0]  # Take first channel
+        binary = np.where(mask_np > 0, 255, 0).astype(np.uint8)
+        return Image.fromarray(np.repeat(binary[:, :, None], 3, axis=2), mode='RGB')
+
+    @staticmethod
+    def save_depth_map(depth_image_np: np.ndarray, exp_path: Path, counter: int, depth_format: DepthFormat = DepthFormat(),
+                       roi: Optional[Roi] = None):
+        """``roi``: where a cropped depth map sits in the full frame, recorded once it is written"""
         path_to_save = exp_path / "depth-maps"
         path_to_save.mkdir(parents=True,exist_ok=True)
 
-        save_to = path_to_save / f"{counter+1:05}.npy"
+        save_to = path_to_save / f"{counter+1:05}{depth_format.suffix}"
         depth_image_np = np.asarray(depth_image_np)
-        np.save(save_to, depth_image_np)
+        with TELEMETRY.stage("encode", "depth"):
+            encoded = encode_depth(depth_image_np, depth_format.codec, depth_format.scale)
+        with TELEMETRY.stage("write", "depth"):
+            write_depth(save_to, encoded, depth_format)
+        _count_written("depth", save_to)
+        if roi is not None:
+            ZedSaver.save_roi(roi, exp_path, counter, "depth")
         logger.debug(f"Saved depth map to {save_to}")
 
     @staticmethod
-    def save_image_from_zed(image_np: np.ndarray, exp_path: Path, counter: int):
+    def save_image_from_zed(image_np: np.ndarray, exp_path: Path, counter: int, encoder: Optional[ImageEncoder] = None):
         if image_np is None:
             logger.error("Cannot save None image")
             return
@@ -23,29 +82,23 @@ class ZedSaver:
         path_to_save.mkdir(parents=True,exist_ok=True)
         save_to = path_to_save / f"{counter+1:05}.png"
         try:
-            # Convert BGRA to RGBA if needed (ZED uses BGRA format)
-            if image_np.shape[2] == 4:
-                # Convert BGRA to RGBA
-                image_np = image_np[:, :, [2, 1, 0, 3]]
-            
-            image = Image.fromarray(image_np)
-            
-            # Check if the image has an alpha channel
-            if image.mode == 'RGBA':
-                # Create a white background
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                # Paste the RGBA image onto the background
-                background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
-                image = background
-
-            # Save the image
-            image.save(save_to)
+            # The ZED alpha channel is always opaque: BGRA goes straight to RGB, no compositing
+            with TELEMETRY.stage("encode", "image"):
+                if encoder is None:
+                    data = encode_image(image_np)
+                else:
+                    data = encoder.encode(image_np)
+            save_to = save_to.with_suffix(ImageEncoding().suffix if encoder is None else encoder.suffix)
+            with TELEMETRY.stage("write", "image"):
+                with open(save_to, mode="wb") as fout:
+                    fout.write(data)
+            TELEMETRY.count("bytes_written", len(data), "image")
             logger.debug(f"Saved image to {save_to}")
         except Exception as e:
             logger.error(f"Error saving image: {e}")
     
     @staticmethod
-    def save_mask(mask_np: np.ndarray, exp_path: Path, counter: int):
+    def save_mask(mask_np: np.ndarray, exp_path: Path, counter: int, roi: Optional[Roi] = None):
         """Save segmentation mask as image"""
         if mask_np is None:
             logger.error("Cannot save None mask")
@@ -55,12 +108,12 @@ class ZedSaver:
         path_to_save.mkdir(parents=True,exist_ok=True)
         save_to = path_to_save / f"{counter+1:05}.png"
         try:
-            # Convert to grayscale if needed
-            if len(mask_np.shape) == 3:
-                mask_np = mask_np[:, :, 0]  # Take first channel
-            
-            mask_image = Image.fromarray(mask_np, mode='L')
-            mask_image.save(save_to)
+            mask_image = ZedSaver.to_mask_image(mask_np)
+            with TELEMETRY.stage("write", "mask"):
+                mask_image.save(save_to)
+            _count_written("mask", save_to)
+            if roi is not None:
+                ZedSaver.save_roi(roi, exp_path, counter, "mask")
             logger.debug(f"Saved mask to {save_to}")
         except Exception as e:
             logger.error(f"Error saving mask: {e}")
@@ -76,12 +129,36 @@ class ZedSaver:
 
         save_to = path_to_save / f"{counter+1:05}.json"
         try:
-            with open(save_to, 'w') as f:
-                json.dump(frame_data, f, indent=2)
+            with TELEMETRY.stage("write", "keypoints"):
+                with open(save_to, 'w') as f:
+                    json.dump(frame_data, f, indent=2)
+            _count_written("keypoints", save_to)
             logger.debug(f"Saved keypoints data to {save_to}")
         except Exception as e:
             logger.error(f"Error saving keypoints data: {e}")
 
+    @staticmethod
+    def save_body_records(records: np.ndarray, exp_path: Path, counter: int, keypoint_format: str = "json"):
+        """Append to the session's body-records.bin, or write the legacy bodies/NNNNN.json"""
+        if keypoint_format == "json":
+            ZedSaver.save_keypoints_and_masks(records_to_frame_data(records), exp_path, counter)
+            return
+        if not len(records):
+            logger.debug(f"No bodies detected in frame {counter}")
+            return
+        writer = _session_writer(exp_path, BodyRecordWriter)
+        with TELEMETRY.stage("write", "keypoints"):
+            writer.append(records)
+        TELEMETRY.count("bytes_written", records.nbytes, "keypoints")
+        logger.debug(f"Appended {len(records)} body records to {writer.path}")
+
+    @staticmethod
+    def close_session_writers():
+        with _session_writers_lock:
+            for writer in _session_writers.values():
+                writer.close()
+            _session_writers.clear()
+
     @staticmethod
     def save_extrinsic_matrix(matrix:list,exp_path: Path, counter: int):
         path_to_save = exp_path / "camera"
@@ -89,8 +166,120 @@ class ZedSaver:
 
         file_path = path_to_save / f"{counter+1:05}.json"
         data ={
-                "cam_extrinsics": matrix
+                "cam_extrinsics": np.asarray(matrix).tolist()
             }
         
-        with file_path.open(mode="w") as fp:
-            json.dump(data, fp,indent=4)
\ No newline at end of file
+        with TELEMETRY.stage("write", "camera"):
+            with file_path.open(mode="w") as fp:
+                json.dump(data, fp,indent=4)
+        _count_written("camera", file_path)
+
+    @staticmethod
+    def save_camera_pose(pose: CameraPose, exp_path: Path, counter: int, camera_format: str = "json"):
+        """Append to the session's trajectory.bin, or write the legacy camera/NNNNN.json"""
+        if camera_format == "json":
+            if pose.ok:
+                ZedSaver.save_extrinsic_matrix(pose.matrix, exp_path, counter)
+            return
+        with TELEMETRY.stage("write", "camera"):
+            _session_writer(exp_path, TrajectoryWriter).append(counter, pose)
+        TELEMETRY.count("bytes_written", TRAJECTORY_DTYPE.itemsize, "camera")
+
+    @staticmethod
+    def save_roi(roi: Roi, exp_path: Path, counter: int, modality: str):
+        """Record where the ``modality`` file of this frame was cropped from, in the session's roi.bin"""
+        _session_writer(exp_path, RoiWriter).append(counter, modality, roi)
+        TELEMETRY.count("bytes_written", ROI_DTYPE.itemsize, modality)
+
+
+class CaptureStoreSaver:
+    """Drop-in replacement for ZedSaver that appends to a CaptureStoreWriter.
+
+    Method signatures match ZedSaver so the capture engine can use either;
+    ``exp_path`` is ignored since the store is bound at construction. Blobs
+    hold exactly the bytes ZedSaver would have written, so
+    ``export_legacy`` restores the per-frame layout byte for byte.
+    """
+
+    def __init__(self, store: CaptureStoreWriter):
+        self.store = store
+
+    @staticmethod
+    def _png_bytes(image: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _append_blob(self, modality: str, telemetry_modality: str, counter: int, data: bytes, ext: str, **extra):
+        with TELEMETRY.stage("write", telemetry_modality):
+            self.store.append_blob(modality, counter, data, ext=ext, **extra)
+        TELEMETRY.count("bytes_written", len(data), telemetry_modality)
+
+    def save_depth_map(self, depth_image_np: np.ndarray, exp_path: Path, counter: int, depth_format: DepthFormat = DepthFormat(),
+                       roi: Optional[Roi] = None):
+        # the store is a memmap, so only the codec applies, not the container
+        depth_image_np = np.asarray(depth_image_np)
+        height, width = depth_image_np.shape[:2]
+        with TELEMETRY.stage("encode", "depth"):
+            encoded = encode_depth(depth_image_np, depth_format.codec, depth_format.scale)
+        with TELEMETRY.stage("write", "depth"):
+            self.store.append_array("depth", counter, encoded, resolution=(width, height),
+                                    codec=depth_format.codec.value, scale=depth_format.scale)
+        TELEMETRY.count("bytes_written", encoded.nbytes, "depth")
+        if roi is not None:
+            self.save_roi(roi, exp_path, counter, "depth")
+        logger.debug(f"Stored depth map #{counter}")
+
+    def save_image_from_zed(self, image_np: np.ndarray, exp_path: Path, counter: int, encoder: Optional[ImageEncoder] = None):
+        if image_np is None:
+            logger.error("Cannot save None image")
+            return
+        with TELEMETRY.stage("encode", "image"):
+            if encoder is None:
+                data, ext = encode_image(image_np), ImageEncoding().suffix
+            else:
+                data, ext = encoder.encode(image_np), encoder.suffix
+        self._append_blob("image", "image", counter, data, ext=ext)
+        logger.debug(f"Stored image #{counter}")
+
+    def save_mask(self, mask_np: np.ndarray, exp_path: Path, counter: int, roi: Optional[Roi] = None):
+        if mask_np is None:
+            logger.error("Cannot save None mask")
+            return
+        self._append_blob("mask", "mask", counter, self._png_bytes(ZedSaver.to_mask_image(mask_np)), ext=".png")
+        if roi is not None:
+            self.save_roi(roi, exp_path, counter, "mask")
+        logger.debug(f"Stored mask #{counter}")
+
+    def save_keypoints_and_masks(self, frame_data: dict, exp_path: Path, counter: int):
+        if not frame_data['bodies']:
+            logger.debug(f"No bodies detected in frame {counter}")
+            return
+        self._append_blob("keypoints", "keypoints", counter, json.dumps(frame_data, indent=2).encode(), ext=".json")
+        logger.debug(f"Stored keypoints data #{counter}")
+
+    def save_body_records(self, records: np.ndarray, exp_path: Path, counter: int, keypoint_format: str = "json"):
+        if keypoint_format == "json":
+            self.save_keypoints_and_masks(records_to_frame_data(records), exp_path, counter)
+            return
+        if not len(records):
+            logger.debug(f"No bodies detected in frame {counter}")
+            return
+        self._append_blob("body-records", "keypoints", counter, records.tobytes(), ext=".bin",
+                          dtype=np.lib.format.dtype_to_descr(records.dtype))
+        logger.debug(f"Stored {len(records)} body records #{counter}")
+
+    def save_extrinsic_matrix(self, matrix: list, exp_path: Path, counter: int):
+        data = {"cam_extrinsics": np.asarray(matrix).tolist()}
+        self._append_blob("camera", "camera", counter, json.dumps(data, indent=4).encode(), ext=".json")
+
+    def save_camera_pose(self, pose: CameraPose, exp_path: Path, counter: int, camera_format: str = "json"):
+        if camera_format == "json":
+            if pose.ok:
+                self.save_extrinsic_matrix(pose.matrix, exp_path, counter)
+            return
+        self._append_blob("trajectory", "camera", counter, pose.to_record(counter).tobytes(), ext=".bin")
+
+    def save_roi(self, roi: Roi, exp_path: Path, counter: int, modality: str):
+        # crop records stay in EXP/roi.bin, next to the store
+        ZedSaver.save_roi(roi, exp_path, counter, modality)
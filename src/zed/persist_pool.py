@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, Deque, Dict, Optional
+
+from loguru import logger
+
+
+class DropPolicy(str, Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+
+
+# Higher value means more important: on overflow the lowest priority goes first,
+# so keypoints and camera poses are never dropped while depth is still queued.
+MODALITY_PRIORITY: Dict[str, int] = {
+    "keypoints": 3,
+    "camera": 3,
+    "mask": 2,
+    "image": 1,
+    "depth": 0,
+}
+
+
+@dataclass
+class PersistTask:
+    modality: str
+    priority: int
+    seq: int
+    fn: Callable
+    args: tuple
+    release: Optional[Callable] = None
+
+    def done(self):
+        if self.release is not None:
+            self.release()
+
+
+@dataclass
+class PersistStats:
+    queued: Dict[str, int] = field(default_factory=dict)
+    written: Dict[str, int] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+    failed: Dict[str, int] = field(default_factory=dict)
+
+    @staticmethod
+    def _incr(counter: Dict[str, int], modality: str):
+        counter[modality] = counter.get(modality, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": dict(self.queued),
+            "written": dict(self.written),
+            "dropped": dict(self.dropped),
+            "failed": dict(self.failed),
+        }
+
+
+class PersistencePool:
+    """Fixed set of writer threads fed by a bounded, priority-aware queue.
+
+    Tasks are dequeued in submission order; writes may complete out of
+    order across workers. When the queue is full the
+    ``policy`` decides what happens: ``block`` waits for a free slot,
+    ``drop-oldest`` evicts the oldest task of the lowest queued priority and
+    ``drop-newest`` evicts the newest one. An incoming task whose priority is
+    below everything queued is dropped itself.
+    """
+
+    def __init__(self,
+                 num_workers: int = 4,
+                 max_queue_size: int = 64,
+                 policy: DropPolicy = DropPolicy.BLOCK,
+                 priorities: Optional[Dict[str, int]] = None):
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be >= 1, got {num_workers}")
+        if max_queue_size < 1:
+            raise ValueError(f"max_queue_size must be >= 1, got {max_queue_size}")
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.policy = DropPolicy(policy)
+        self.priorities = dict(MODALITY_PRIORITY if priorities is None else priorities)
+        self.stats = PersistStats()
+
+        self._queues: Dict[int, Deque[PersistTask]] = {}
+        self._size = 0
+        self._in_flight = 0
+        self._seq = 0
+        self._closed = False
+        self._stopping = False
+        self._cond = threading.Condition()
+
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"persist-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._size + self._in_flight
+
+    def stats_snapshot(self) -> dict:
+        with self._cond:
+            return self.stats.snapshot()
+
+    def submit(self, modality: str, fn: Callable, *args, release: Optional[Callable] = None) -> bool:
+        """Queue ``fn(*args)``; returns False if the task was dropped.
+
+        ``release`` is called exactly once when the task has been written,
+        has failed or was dropped, e.g. to hand a leased buffer back.
+        """
+        priority = self.priorities.get(modality, 0)
+        with self._cond:
+            if self._closed:
+                if release is not None:
+                    release()
+                raise RuntimeError("Cannot submit to a closed persistence pool")
+            while self._size >= self.max_queue_size:
+                if self.policy == DropPolicy.BLOCK:
+                    self._cond.wait()
+                    if self._closed:
+                        if release is not None:
+                            release()
+                        raise RuntimeError("Persistence pool closed while waiting for a free slot")
+                    continue
+
+                lowest = min(p for p, q in self._queues.items() if q)
+                if priority < lowest or (priority == lowest and self.policy == DropPolicy.DROP_NEWEST):
+                    # the incoming task is the one to sacrifice
+                    self._drop(modality)
+                    if release is not None:
+                        release()
+                    return False
+
+                victims = self._queues[lowest]
+                victim = victims.popleft() if self.policy == DropPolicy.DROP_OLDEST else victims.pop()
+                self._size -= 1
+                self._drop(victim.modality)
+                victim.done()
+
+            task = PersistTask(modality=modality, priority=priority, seq=self._seq, fn=fn, args=args, release=release)
+            self._seq += 1
+            self._queues.setdefault(priority, deque()).append(task)
+            self._size += 1
+            PersistStats._incr(self.stats.queued, modality)
+            self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued task has been written; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._size or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting tasks, drain the queue and join the workers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        flushed = self.flush(timeout)
+        if not flushed:
+            logger.warning(f"Persistence pool closed with {self.pending} tasks still pending")
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        logger.info(f"Persistence stats: {self.stats.snapshot()}")
+        return flushed
+
+    def _drop(self, modality: str):
+        PersistStats._incr(self.stats.dropped, modality)
+        logger.warning(f"Persistence queue full ({self.max_queue_size}), dropped a {modality} task")
+
+    def _next_task(self) -> PersistTask:
+        # oldest task across all priorities, to keep frames written in order
+        queue = min((q for q in self._queues.values() if q), key=lambda q: q[0].seq)
+        self._size -= 1
+        return queue.popleft()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._size and not self._stopping:
+                    self._cond.wait()
+                if not self._size:
+                    return
+                task = self._next_task()
+                self._in_flight += 1
+                self._cond.notify_all()
+
+            ok = True
+            try:
+                task.fn(*task.args)
+            except Exception as e:
+                ok = False
+                logger.error(f"Failed to persist {task.modality}: {e}")
+            finally:
+                task.done()
+
+            with self._cond:
+                self._in_flight -= 1
+                PersistStats._incr(self.stats.written if ok else self.stats.failed, task.modality)
+                self._cond.notify_all()
@@ -0,0 +1,86 @@
+"""Tuned persistence settings, written by ``zed/autotune.py``.
+
+A profile is a JSON file holding the capture options that decide how fast
+frames reach the disk (writer threads, queue size, image encoding, depth
+format), the directory they were tuned on and the benchmark behind them.
+``parse_capture_options`` uses its settings as the option defaults, so
+options given on the command line still win.
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from loguru import logger
+
+from zed.persist import EXPERIMENTS_ROOT
+
+PROFILE_VERSION = 1
+DEFAULT_PROFILE_PATH = EXPERIMENTS_ROOT.parent / "persist-profile.json"
+PROFILE_SETTINGS = ("persist_workers", "persist_queue_size", "encode_processes", "image_format",
+                    "png_compress_level", "image_quality", "depth_codec", "depth_container")
+
+
+def _device(path: Path) -> int:
+    """Device id of ``path``, or of its closest existing parent."""
+    path = Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return os.stat(path).st_dev
+
+
+def write_profile(path: Path, settings: dict, target: Path, results: List[dict], **benchmark):
+    unknown = set(settings) - set(PROFILE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Not persistence settings: {sorted(unknown)}")
+    profile = {
+        "version": PROFILE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": str(Path(target).absolute()),
+        "device": _device(target),
+        "settings": settings,
+        "benchmark": benchmark,
+        "results": results,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open(mode="w") as fout:
+        json.dump(profile, fout, indent=4)
+    os.replace(tmp_path, path)
+
+
+def read_profile(path: Path) -> Optional[dict]:
+    """The profile at ``path``, None if there is none or it is from another version."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with path.open(mode="r") as fin:
+        profile = json.load(fin)
+    if profile.get("version") != PROFILE_VERSION:
+        logger.warning(f"Ignoring persistence profile {path}: version {profile.get('version')}, "
+                       f"expected {PROFILE_VERSION}; rerun zed/autotune.py")
+        return None
+    return profile
+
+
+def profile_defaults(profile: dict, exp_root: Path = EXPERIMENTS_ROOT) -> dict:
+    """The option defaults of ``profile``; warns when it was tuned on another disk than ``exp_root``."""
+    if profile.get("device") != _device(exp_root):
+        logger.warning(f"The persistence profile was tuned on {profile.get('target')}, "
+                       f"a different disk than {exp_root}")
+    return {key: value for key, value in profile["settings"].items() if key in PROFILE_SETTINGS}
+
+
+def parse_capture_options(parser: argparse.ArgumentParser, args: Optional[List[str]] = None) -> argparse.Namespace:
+    """``parser.parse_args`` with the ``--persist_profile`` settings as defaults."""
+    known, _ = parser.parse_known_args(args)
+    path = getattr(known, "persist_profile", "")
+    profile = read_profile(Path(path)) if path else None
+    if profile is not None:
+        defaults = profile_defaults(profile)
+        parser.set_defaults(**defaults)
+        logger.info(f"Persistence profile {path}: {defaults}")
+    return parser.parse_args(args)
@@ -0,0 +1,109 @@
+"""Full-frame person masks from the ZED instance segmentation.
+
+Object detection with ``enable_segmentation`` gives every detected person a
+mask the size of its 2D bounding box. ``person_mask`` picks the detection
+whose box best overlaps the tracked body that ``data/extract_bbox.py`` (and
+so SAM) would use, the first body record, and draws its mask into a binary
+full-frame mask. A detection is only accepted when its box overlaps the body
+box by ``min_iou`` and its mask covers at least ``min_fill`` of the box;
+otherwise the frame gets no mask and ``data/extract_mask.py`` segments it
+with SAM.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from zed.camera import DetectedObject
+
+
+@dataclass
+class MaskConfig:
+    min_iou: float = 0.5  # overlap of the detection and body boxes
+    min_fill: float = 0.1  # fraction of its box the mask has to cover
+
+
+def corners_to_boxes(corners: np.ndarray) -> np.ndarray:
+    """``(N, 4, 2)`` box corners as ``(N, 4)`` ``x0, y0, x1, y1`` boxes."""
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+    return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """``(N, M)`` intersection over union of ``(N, 4)`` and ``(M, 4)`` boxes."""
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def _mask_2d(obj: DetectedObject) -> np.ndarray:
+    return obj.mask if obj.mask.ndim == 2 else obj.mask[:, :, 0]
+
+
+def composite(objects: List[DetectedObject], width: int, height: int) -> np.ndarray:
+    """Binary ``height`` x ``width`` mask (0 or 255) of the union of the objects' box-local masks."""
+    full = np.zeros((height, width), dtype=np.uint8)
+    for obj in objects:
+        mask = _mask_2d(obj)
+        x, y = np.floor(np.asarray(obj.bounding_box_2d, dtype=np.float64).reshape(4, 2).min(axis=0)).astype(int)
+        # the part of the mask inside the frame, as one slice on each side
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mask.shape[1], width), min(y + mask.shape[0], height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        region = full[y0:y1, x0:x1]
+        region[mask[y0 - y:y1 - y, x0 - x:x1 - x] > 0] = 255
+    return full
+
+
+def match_body(records: np.ndarray, objects: List[DetectedObject], config: MaskConfig = MaskConfig()
+               ) -> Tuple[Optional[DetectedObject], float]:
+    """The detection matching the first body record and its IoU; None when no detection is good enough."""
+    objects = [obj for obj in objects if obj.mask is not None]
+    if not len(records) or not objects:
+        return None, 0.0
+    body = corners_to_boxes(records["bounding_box_2d"][:1])
+    if not np.isfinite(body).all():
+        # the SDK gave no box for the body
+        return None, 0.0
+    detections = corners_to_boxes(np.stack([obj.bounding_box_2d for obj in objects]))
+    ious = box_iou(body, detections)[0]
+    best = int(np.argmax(ious))
+    obj = objects[best]
+    mask = _mask_2d(obj)
+    if ious[best] < config.min_iou or np.count_nonzero(mask) < config.min_fill * mask.size:
+        return None, float(ious[best])
+    return obj, float(ious[best])
+
+
+def person_mask(records: Optional[np.ndarray], objects: List[DetectedObject], width: int, height: int,
+                config: MaskConfig = MaskConfig()) -> Tuple[Optional[np.ndarray], float]:
+    """Full-frame mask of the tracked body and the IoU it was matched with.
+
+    Without body records the most confident detection is used, as before
+    body matching existed.
+    """
+    if records is None:
+        candidates = [obj for obj in objects if obj.mask is not None]
+        if not candidates:
+            return None, 0.0
+        obj, iou = max(candidates, key=lambda candidate: candidate.confidence), float("nan")
+    else:
+        obj, iou = match_body(records, objects, config)
+        if obj is None:
+            return None, iou
+    return composite([obj], width, height), iou
+
+
+def resize_nearest(mask: np.ndarray, width: int, height: int) -> np.ndarray:
+    if mask.shape[:2] == (height, width):
+        return mask
+    rows = np.arange(height) * mask.shape[0] // height
+    cols = np.arange(width) * mask.shape[1] // width
+    return mask[rows[:, None], cols]
@@ -0,0 +1,595 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+
+from zed.buffer_pool import Lease
+from zed.camera import Camera, CameraInfo, GrabStatus
+from zed.gating import FrameGate
+from zed.replay import FrameSampler, ReplayMode, TimestampSampler
+from zed.options import sampling_stride
+from zed.persist import ZedSaver
+from zed.persist_pool import PersistencePool
+from zed.person_mask import MaskConfig, person_mask, resize_nearest
+from zed.quality import QualityController, QualityLevel
+from zed.retrieve import ZedRetrieval
+from utils.depth_codec import DepthFormat
+from utils.image_codec import ImageEncoder
+from utils.quality_log import QualityLog
+from utils.shm_ring import FrameRingPublisher
+from utils.telemetry import TELEMETRY
+from utils.body_records import body_record_dtype
+from utils.roi import body_roi
+from utils.trajectory import CameraPose
+
+
+class FrameRing:
+    """Fixed-capacity hand-off buffer between two stages.
+
+    By default ``put`` never blocks: when the ring is full the oldest entry is
+    overwritten and handed back to the caller, so a slow consumer can never
+    stall the grab thread. ``put(block=True)`` waits for room instead.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"capacity must be >= 1, got {capacity}")
+        self._items = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.overwritten = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item, block: bool = False):
+        """Append ``item``; returns the overwritten entry, if any (``item`` itself if the ring closed while blocked)."""
+        evicted = None
+        with self._cond:
+            if block:
+                self._cond.wait_for(lambda: self._closed or len(self._items) < self._items.maxlen)
+                if self._closed:
+                    return item
+            if len(self._items) == self._items.maxlen:
+                evicted = self._items.popleft()
+                self.overwritten += 1
+            self._items.append(item)
+            self._cond.notify()
+        return evicted
+
+    def get(self, timeout: Optional[float] = None):
+        """Pop the oldest entry, or None once the ring is closed and drained (or on timeout)."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    @property
+    def drained(self) -> bool:
+        with self._cond:
+            return self._closed and not self._items
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+@dataclass
+class CapturePlan:
+    """Which modalities are retrieved for a sampled frame; nothing else is pulled from the SDK."""
+    depth: bool = False
+    image: bool = False
+    keypoints: bool = False
+    masks: bool = False
+    camera: bool = False
+
+    @classmethod
+    def from_options(cls, opt, body_tracker=None, object_detection=None):
+        return cls(
+            depth=opt.save,
+            image=opt.save,
+            keypoints=opt.save and opt.extract_keypoints and body_tracker is not None,
+            masks=opt.save and opt.extract_masks and object_detection is not None,
+            camera=opt.save_cam,
+        )
+
+    @property
+    def objects(self) -> bool:
+        return self.masks
+
+
+@dataclass
+class FrameHandle:
+    """Everything snapshotted from the SDK for one sampled frame.
+
+    Depth, image, bodies and objects are leased from ZedRetrieval's buffer
+    pools and must be released once consumed.
+    """
+    counter: int
+    frame_counter: int
+    depth: Optional[Lease] = None
+    image: Optional[Lease] = None
+    bodies: Optional[Lease] = None
+    objects: Optional[Lease] = None
+    pose: Optional[CameraPose] = None
+    timestamp: int = 0  # ns, camera clock
+    # body records already extracted by the gate, saved instead of ``bodies``
+    records: Optional[np.ndarray] = None
+    # resolution the image was (or would have been) retrieved at, which quality switches change
+    image_res: Optional[CameraInfo] = None
+
+    def release(self):
+        for lease in (self.depth, self.image, self.bodies, self.objects):
+            if lease is not None:
+                lease.release()
+
+
+class CaptureEngine:
+    """Three-stage capture: grab -> process -> persist.
+
+    * grab: a single thread calls ``camera.grab`` exactly once per iteration
+      and, for sampled frames, snapshots the planned modalities into a
+      FrameHandle. Cameras only expose the most recently grabbed frame, so the
+      ``retrieve_*`` calls have to stay on this thread.
+      ``start_frame``/``end_frame`` restrict an SVO replay to a frame range
+      (seeked with ``set_svo_position``); sampled frames are numbered from
+      ``first_counter``. On recordings (``lossless``, the default when the
+      camera reports a frame count) the grab thread waits for free buffers and
+      ring slots instead of dropping frames. With a FrameGate, bodies are
+      retrieved first and frames the gate rejects are skipped before any
+      other retrieval; kept frames are still numbered contiguously.
+      Depth and images are retrieved at ``depth_res``/``image_res``
+      (``camera_res`` by default). On live cameras a QualityController
+      (``quality``) may lower the sampling rate, retrieval resolution, depth
+      mode and detection models while the frame budget is exceeded; every
+      switch is recorded in ``quality_log``.
+    * process: turns handles into saveable data (keypoint extraction, masks)
+      off the grab thread. With ``roi_padding`` set, depth and masks are
+      cropped to the padded body bounding box and the crops recorded in
+      ``roi.bin`` (see ``utils.roi``). With a ``publisher``, every frame is
+      also copied into a shared-memory ring for other processes
+      (``utils.shm_ring``). Fed through a FrameRing.
+    * persist: the PersistencePool and its own bounded queue.
+    """
+
+    def __init__(self,
+                 camera: Camera,
+                 zed_retrieval: ZedRetrieval,
+                 persist_pool: PersistencePool,
+                 exp_dir: Path,
+                 plan: CapturePlan,
+                 camera_res: CameraInfo,
+                 fps: int = 30,
+                 save_interval_seconds: float = 0.05,
+                 ring_size: int = 8,
+                 saver=ZedSaver,
+                 depth_format: DepthFormat = DepthFormat(),
+                 image_encoder: Optional[ImageEncoder] = None,
+                 keypoint_format: str = "json",
+                 camera_format: str = "json",
+                 start_frame: int = 0,
+                 end_frame: Optional[int] = None,
+                 first_counter: int = 0,
+                 warmup_frames: int = 0,
+                 lossless: Optional[bool] = None,
+                 gate: Optional[FrameGate] = None,
+                 depth_res: Optional[CameraInfo] = None,
+                 image_res: Optional[CameraInfo] = None,
+                 roi_padding: Optional[float] = None,
+                 sampling: str = "frames",
+                 replay_mode: ReplayMode = ReplayMode.FULL,
+                 quality: Optional[QualityController] = None,
+                 quality_log: Optional[QualityLog] = None,
+                 publisher: Optional[FrameRingPublisher] = None,
+                 mask_config: MaskConfig = MaskConfig()):
+        self.camera = camera
+        self.zed_retrieval = zed_retrieval
+        self.persist_pool = persist_pool
+        # ZedSaver or any object with the same save_* methods (e.g. CaptureStoreSaver)
+        self.saver = saver
+        self.depth_format = depth_format
+        self.image_encoder = image_encoder
+        self.keypoint_format = keypoint_format
+        self.camera_format = camera_format
+        self.exp_dir = exp_dir
+        self.plan = plan
+        self.camera_res = camera_res
+        self.depth_res = depth_res or camera_res
+        self.image_res = image_res or camera_res
+        self.roi_padding = roi_padding
+        self.save_interval_seconds = save_interval_seconds
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.first_counter = first_counter
+        # frames grabbed (not sampled) before start_frame so the tracking modules can settle
+        self.warmup_frames = warmup_frames
+        self.lossless = camera.num_frames() is not None if lossless is None else lossless
+        if self.lossless:
+            self.zed_retrieval.buffer_timeout = None
+        self.gate = gate
+        self.quality = quality
+        self.quality_log = quality_log
+        self.publisher = publisher
+        self.mask_config = mask_config
+        if self.quality is not None and self.lossless:
+            logger.info("Recordings are replayed without losing frames, adaptive quality is off")
+            self.quality = None
+        # the configured retrieval resolutions, which quality levels scale down
+        self._depth_factor = self.depth_res.width / camera_res.width
+        self._image_factor = self.image_res.width / camera_res.width
+        self._grab_seconds = 0.0
+
+        self.fps = fps
+        # Handle unrealistic FPS values - cap at reasonable maximum
+        self.frames_to_skip = sampling_stride(fps, save_interval_seconds)
+        if self.frames_to_skip is None or sampling == "timestamps":
+            if self.frames_to_skip is None:
+                logger.warning(f"Unrealistic FPS reported: {fps}, using time-based capture instead")
+            self.use_time_based = True
+            # camera timestamps, so an SVO replay samples the same frames however fast it runs
+            frame_period_ns = int(1e9 / fps) if self.frames_to_skip is not None else int(save_interval_seconds * 1e9)
+            self.sampler = TimestampSampler(int(save_interval_seconds * 1e9), frame_period_ns)
+            logger.info(f"Using time-based capture: saving every {save_interval_seconds} seconds")
+        else:
+            self.use_time_based = False
+            self.sampler = FrameSampler(self.frames_to_skip)
+            logger.info(f"Camera FPS: {fps}, saving every {self.frames_to_skip} frames ({1/save_interval_seconds} captures per second)")
+        # live cameras cannot skip frames
+        self.replay_mode = ReplayMode(replay_mode) if self.lossless else ReplayMode.FULL
+        if self.replay_mode != ReplayMode.FULL:
+            logger.info(f"Replay mode: {self.replay_mode.value}")
+
+        self.ring = FrameRing(ring_size)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._threads: List[threading.Thread] = []
+
+        self.frames_grabbed = 0
+        self.frames_without_depth = 0
+        self.frames_seeked = 0
+        self.frames_sampled = 0
+        self.frames_gated = 0
+        self.frames_processed = 0
+        self.frames_masked = 0
+        self._started = None
+        self.seconds = 0.0
+        self._first_timestamp: Optional[int] = None
+        self._last_timestamp: Optional[int] = None
+
+    def frame_stats(self) -> dict:
+        persisted = self.persist_pool.stats_snapshot()
+        return {
+            "grabbed": self.frames_grabbed,
+            "without_depth": self.frames_without_depth,
+            "seeked": self.frames_seeked,
+            "sampled": self.frames_sampled,
+            "gated": self.frames_gated,
+            "processed": self.frames_processed,
+            "masked": self.frames_masked,
+            "overwritten": self.ring.overwritten,
+            "persisted": sum(persisted["written"].values()),
+            "dropped": sum(persisted["dropped"].values()),
+            "failed": sum(persisted["failed"].values()),
+        }
+
+    @property
+    def stream_seconds(self) -> float:
+        """Recording time covered by the grabbed frames, on the camera clock."""
+        if self._first_timestamp is None:
+            return 0.0
+        return (self._last_timestamp - self._first_timestamp) / 1e9 + 1 / self.camera.info.fps
+
+    @property
+    def speedup(self) -> float:
+        """Recording time replayed per second of wall time."""
+        seconds = self.seconds or (time.perf_counter() - self._started if self._started is not None else 0.0)
+        return self.stream_seconds / seconds if seconds else 0.0
+
+    def queue_depths(self) -> dict:
+        return {"ring": len(self.ring), "persist": self.persist_pool.pending}
+
+    def run(self):
+        """Run until the stream ends, a grab fails or the caller is interrupted."""
+        TELEMETRY.register_gauge("frames", self.frame_stats)
+        TELEMETRY.register_gauge("queue_depth", self.queue_depths)
+        if self.lossless:
+            TELEMETRY.register_gauge("replay_speedup", lambda: self.speedup)
+        if self.quality is not None:
+            TELEMETRY.register_gauge("quality_level", lambda: self.quality.level)
+            self._record_quality(self.first_counter, None, reason=None)
+        self._started = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._grab_loop, name="capture-grab", daemon=True),
+            threading.Thread(target=self._process_loop, name="capture-process", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        try:
+            # join with a timeout so KeyboardInterrupt still reaches the main thread
+            while any(thread.is_alive() for thread in self._threads):
+                for thread in self._threads:
+                    thread.join(timeout=0.2)
+        finally:
+            self.stop()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        # hand back the buffers of frames that never reached the process stage
+        while True:
+            handle = self.ring.get(timeout=0)
+            if handle is None:
+                break
+            handle.release()
+        if self._started is not None:
+            self.seconds = time.perf_counter() - self._started
+        throughput = self.frames_grabbed / self.seconds if self.seconds else 0.0
+        logger.info(f"Capture stats: {self.frame_stats()} in {self.seconds:.1f}s ({throughput:.1f} frames/s)")
+        if self.lossless:
+            logger.info(f"Replayed {self.stream_seconds:.1f}s of recording in {self.seconds:.1f}s "
+                        f"({self.speedup:.2f}x real time, replay mode {self.replay_mode.value})")
+        logger.info(f"Retrieval buffers: {self.zed_retrieval.allocation_stats()}")
+        if self.gate is not None:
+            logger.info(f"Gate stats: {self.gate.stats()}")
+        if self.quality is not None:
+            logger.info(f"Quality level at shutdown: {self.quality.current.name} ({self.quality.level})")
+
+    def _grab_loop(self):
+        counter = self.first_counter
+        frame_counter = max(0, self.start_frame - self.warmup_frames)
+        try:
+            if frame_counter > 0:
+                logger.info(f"Seeking to frame {frame_counter} (range {self.start_frame}..{self.end_frame})")
+                self.camera.seek(frame_counter)
+            num_frames = self.camera.num_frames()
+            iteration_start = None
+            while not self._stop.is_set():
+                if self.quality is not None:
+                    now = time.perf_counter()
+                    if iteration_start is not None:
+                        self._observe_quality(now - iteration_start, counter, frame_counter)
+                    iteration_start = now
+                if self.end_frame is not None and frame_counter >= self.end_frame:
+                    logger.info(f"End of frame range reached at frame {frame_counter}")
+                    break
+                # warmup frames always get depth, they are there to settle the tracking modules
+                in_range = frame_counter >= self.start_frame
+                may_sample = not in_range or self.sampler.may_sample(frame_counter)
+                if not may_sample and self.replay_mode == ReplayMode.SEEK:
+                    target = self.sampler.next_candidate(frame_counter)
+                    if (self.end_frame is not None and target >= self.end_frame) or \
+                            (num_frames is not None and target >= num_frames):
+                        logger.info(f"No frame left to sample after frame {frame_counter}")
+                        break
+                    self.camera.seek(target)
+                    self.frames_seeked += target - frame_counter
+                    frame_counter = target
+                    continue
+                compute_depth = may_sample or self.replay_mode == ReplayMode.FULL
+                if not self._grab(compute_depth):
+                    break
+
+                if in_range and self.sampler.due(frame_counter, self.camera.timestamp()):
+                    if not compute_depth:
+                        # the clock ran ahead of the prediction (dropped frames): grab this one again with depth
+                        self.camera.seek(frame_counter)
+                        if not self._grab(True):
+                            break
+                    records = None
+                    if self.gate is not None:
+                        records = self._gate_records(counter)
+                        reason = self.gate.check(records)
+                        if reason is not None:
+                            logger.trace(f"Gated frame {frame_counter}: {reason}")
+                            TELEMETRY.count("gated", modality=reason)
+                            self.frames_gated += 1
+                            frame_counter += 1
+                            continue
+                    logger.debug(f"Processing frame #{counter} (frame_counter: {frame_counter})")
+                    self.frames_sampled += 1
+                    handle = self._snapshot(counter, frame_counter, records)
+                    logger.trace(f"Frame #{counter} buffers: {self.zed_retrieval.end_frame()}")
+                    evicted = self.ring.put(handle, block=self.lossless)
+                    if evicted is not None:
+                        logger.warning(f"Process stage is behind, overwrote pending frame #{evicted.counter}")
+                        evicted.release()
+                    counter += 1
+                frame_counter += 1
+        except BaseException as e:
+            logger.error(f"Unexpected error in grab stage: {e}")
+            self._error = e
+        finally:
+            self.ring.close()
+
+    def _grab(self, compute_depth: bool) -> bool:
+        start = time.perf_counter()
+        with TELEMETRY.stage("grab"):
+            status = self.camera.grab(compute_depth=compute_depth)
+        self._grab_seconds = time.perf_counter() - start
+        if status == GrabStatus.END_OF_STREAM:
+            logger.info("End of SVO file reached")
+            return False
+        if status != GrabStatus.SUCCESS:
+            logger.error(f"Failed to grab frame: {status}")
+            return False
+        self.frames_grabbed += 1
+        if not compute_depth:
+            self.frames_without_depth += 1
+        timestamp = self.camera.timestamp()
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+        self._last_timestamp = timestamp
+        return True
+
+    def _observe_quality(self, seconds: float, counter: int, frame_counter: int):
+        """Feed the last grab iteration to the controller and apply the level it switches to."""
+        previous = self.quality.current
+        backlog = self.persist_pool.pending / self.persist_pool.max_queue_size
+        reason = self.quality.observe(self._grab_seconds, seconds - self._grab_seconds, backlog)
+        if reason is None:
+            return
+        level = self.quality.current
+        failed = self.quality.switch_camera(self.camera, previous)
+        self._set_save_interval(self.save_interval_seconds * level.save_interval_scale)
+        self.depth_res = self.camera_res.scaled(self._depth_factor * level.resolution)
+        self.image_res = self.camera_res.scaled(self._image_factor * level.resolution)
+        logger.warning(f"Quality {previous.name} -> {level.name} ({reason}, {self.quality.last_window}) "
+                       f"from frame #{counter}")
+        TELEMETRY.count("quality_switch", modality=reason)
+        self._record_quality(counter, frame_counter, reason, failed)
+
+    def _set_save_interval(self, seconds: float):
+        if isinstance(self.sampler, TimestampSampler):
+            self.sampler.interval_ns = int(seconds * 1e9)
+        else:
+            self.frames_to_skip = sampling_stride(self.fps, seconds)
+            self.sampler.stride = self.frames_to_skip
+
+    def _record_quality(self, counter: int, frame_counter: Optional[int], reason: Optional[str],
+                        failed: Optional[List[str]] = None):
+        if self.quality_log is None:
+            return
+        level: QualityLevel = self.quality.current
+        self.quality_log.record(frame_id=counter, frame=frame_counter, timestamp=self._last_timestamp,
+                                level=self.quality.level, name=level.name, reason=reason,
+                                window=self.quality.last_window, failed=failed or [],
+                                save_interval=self.save_interval_seconds * level.save_interval_scale,
+                                depth_mode=level.depth_mode, body_model=level.body_model,
+                                object_model=level.object_model,
+                                depth=self.depth_res.intrinsics(), image=self.image_res.intrinsics())
+
+    def _gate_records(self, counter: int) -> np.ndarray:
+        """Body records the gate decides on; no records when the bodies cannot be retrieved."""
+        lease = self.zed_retrieval.lease_bodies()
+        if lease is None:
+            return np.zeros(0, dtype=body_record_dtype())
+        with lease:
+            return self.zed_retrieval.body_records(lease.item, counter)
+
+    def _snapshot(self, counter: int, frame_counter: int, records: Optional[np.ndarray] = None) -> FrameHandle:
+        handle = FrameHandle(counter=counter, frame_counter=frame_counter, timestamp=self._last_timestamp)
+        if self.plan.camera:
+            handle.pose = self.zed_retrieval.retrieve_camera_pose()
+
+        if self.plan.objects:
+            handle.objects = self.zed_retrieval.lease_object_detections()
+
+        # masks are matched to the tracked body
+        if self.plan.keypoints or self.plan.masks or self.roi_padding is not None:
+            if records is not None:
+                handle.records = records
+            else:
+                handle.bodies = self.zed_retrieval.lease_bodies()
+
+        if self.plan.depth:
+            handle.depth = self.zed_retrieval.lease_depth_map(camera_res=self.depth_res)
+            if handle.depth is None:
+                logger.warning(f"Failed to retrieve depth map for frame {counter}")
+
+        # masks are saved at this frame's image resolution, even when the images themselves are not
+        handle.image_res = self.image_res
+        if self.plan.image:
+            handle.image = self.zed_retrieval.lease_left_image(camera_res=handle.image_res)
+            if handle.image is None:
+                logger.warning(f"Failed to retrieve left image for frame {counter}")
+        return handle
+
+    def _process_loop(self):
+        handle = None
+        try:
+            while not self.ring.drained:
+                handle = self.ring.get(timeout=0.1)
+                if handle is None:
+                    continue
+                self._dispatch(handle)
+                handle = None
+                self.frames_processed += 1
+        except BaseException as e:
+            if handle is not None:
+                # only what _dispatch did not hand to the persistence pool
+                handle.release()
+            logger.error(f"Unexpected error in process stage: {e}")
+            self._error = e
+            self._stop.set()
+            # unblock a grab thread waiting for room
+            self.ring.close()
+
+    def _dispatch(self, handle: FrameHandle):
+        counter = handle.counter
+        records = handle.records
+        if handle.bodies is not None:
+            with handle.bodies:
+                records = self.zed_retrieval.body_records(handle.bodies.item, counter)
+        roi = None
+        if self.roi_padding is not None and records is not None:
+            roi = body_roi(records["bounding_box_2d"], self.camera_res.width, self.camera_res.height, self.roi_padding)
+
+        if self.publisher is not None:
+            # copied before the writers get the buffers, which go back to the pools once written
+            with TELEMETRY.stage("publish"):
+                self.publisher.publish(counter, handle.timestamp,
+                                       image=handle.image.view if handle.image is not None else None,
+                                       depth=handle.depth.view if handle.depth is not None else None,
+                                       bodies=records,
+                                       pose=handle.pose.matrix if handle.pose is not None else None)
+
+        # the writers borrow zero-copy views and hand the buffers back once written
+        if handle.depth is not None:
+            # the persistence pool owns the lease from here on, even when submit raises
+            lease, handle.depth = handle.depth, None
+            depth = lease.view
+            depth_roi = None
+            if roi is not None:
+                # the depth resolution may have changed since this frame was retrieved
+                depth_roi = roi.scaled(depth.shape[1], depth.shape[0])
+                depth = depth_roi.crop(depth)
+            self.persist_pool.submit("depth", self.saver.save_depth_map, depth, self.exp_dir, counter,
+                                     self.depth_format, depth_roi, release=lease.release)
+        if handle.image is not None:
+            lease, handle.image = handle.image, None
+            self.persist_pool.submit("image", self.saver.save_image_from_zed, lease.view, self.exp_dir, counter,
+                                     self.image_encoder, release=lease.release)
+
+        if records is not None and self.plan.keypoints:
+            logger.debug(f"Extracted keypoints for {len(records)} bodies")
+            # JSON formatting, if requested, happens on the writer threads
+            self.persist_pool.submit("keypoints", self.saver.save_body_records, records, self.exp_dir, counter,
+                                     self.keypoint_format)
+
+        if handle.objects is not None:
+            with handle.objects:
+                detected = [obj for obj in self.zed_retrieval.detected_objects(handle.objects.item)
+                            if obj.mask is not None]
+            mask, iou = person_mask(records, detected, self.camera_res.width, self.camera_res.height,
+                                    self.mask_config)
+            if mask is None:
+                # left to data/extract_mask.py
+                logger.debug(f"No ZED mask for frame {counter} ({len(detected)} detections, IoU {iou:.2f})")
+                TELEMETRY.count("mask_missing")
+            else:
+                self.frames_masked += 1
+                # the same resolution as the images, like the SAM masks
+                mask = resize_nearest(mask, handle.image_res.width, handle.image_res.height)
+                mask_roi = None
+                if roi is not None:
+                    mask_roi = roi.scaled(mask.shape[1], mask.shape[0])
+                    mask = mask_roi.crop(mask)
+                self.persist_pool.submit("mask", self.saver.save_mask, mask, self.exp_dir, counter, mask_roi)
+
+        if handle.pose is not None:
+            self.persist_pool.submit("camera", self.saver.save_camera_pose, handle.pose, self.exp_dir, counter,
+                                     self.camera_format)
@@ -0,0 +1,182 @@
+"""Adaptive capture quality for live cameras.
+
+A quality ladder is a list of levels, each overriding some settings of the
+one above it:
+
+* ``save_interval_scale`` - multiplies ``--save_interval`` (fewer sampled frames)
+* ``resolution``          - multiplies ``--depth_resolution`` and ``--image_resolution``
+* ``depth_mode``          - an ``sl.DEPTH_MODE`` name; the ZED reopens the camera
+                            for it, which restarts positional tracking
+* ``body_model``          - an ``sl.BODY_TRACKING_MODEL`` name
+* ``object_model``        - an ``sl.OBJECT_DETECTION_MODEL`` name
+
+Level 0 is the configured capture. ``QualityController`` watches the grab
+and retrieval latency of every grabbed frame and the fill of the persistence
+queue. After a window of frames over the frame budget, or with the queue
+filling up, it steps one level down; after ``headroom_windows`` windows
+within budget it steps back up. A step up that overloads the capture again
+doubles the wait before the next one.
+
+The ladder is cheapest to switch first: sampling and resolution take effect
+on the next frame, the detection models reload, and the depth mode reopens
+the camera.
+"""
+import json
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import List, Optional
+
+from loguru import logger
+
+from zed.camera import Camera
+
+DEFAULT_LADDER = [
+    {"name": "full"},
+    {"name": "half-rate", "save_interval_scale": 2.0},
+    {"name": "half-resolution", "resolution": 0.5},
+    {"name": "medium-models", "body_model": "HUMAN_BODY_MEDIUM", "object_model": "MULTI_CLASS_BOX_FAST"},
+    {"name": "fast-models", "body_model": "HUMAN_BODY_FAST"},
+    {"name": "neural-depth", "depth_mode": "NEURAL"},
+    {"name": "performance-depth", "depth_mode": "PERFORMANCE", "save_interval_scale": 4.0},
+]
+LADDER_FIELDS = ("save_interval_scale", "resolution", "depth_mode", "body_model", "object_model")
+
+# why the controller switched
+OVERLOADED = "overloaded"
+HEADROOM = "headroom"
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    name: str
+    save_interval_scale: float = 1.0
+    resolution: float = 1.0
+    depth_mode: str = "NEURAL_PLUS"
+    body_model: Optional[str] = None  # None when body tracking is off
+    object_model: Optional[str] = None  # None when object detection is off
+
+
+def build_ladder(steps: List[dict], base: QualityLevel) -> List[QualityLevel]:
+    """Resolve the ``steps`` overrides, each applied on top of the previous level, starting from ``base``."""
+    ladder = []
+    level = base
+    for index, step in enumerate(steps):
+        unknown = set(step) - set(LADDER_FIELDS) - {"name"}
+        if unknown:
+            raise ValueError(f"Unknown quality ladder settings {sorted(unknown)}, expected {LADDER_FIELDS}")
+        overrides = {key: value for key, value in step.items() if key != "name"}
+        # models that are off stay off
+        for key in ("body_model", "object_model"):
+            if getattr(base, key) is None:
+                overrides.pop(key, None)
+        level = replace(level, name=step.get("name", f"level-{index}"), **overrides)
+        ladder.append(level)
+    return ladder
+
+
+def load_ladder(path: Optional[str], base: QualityLevel) -> List[QualityLevel]:
+    """The ladder of a JSON file (a list of overrides, see ``DEFAULT_LADDER``), or the default one."""
+    steps = DEFAULT_LADDER
+    if path:
+        with Path(path).open(mode="r") as fin:
+            steps = json.load(fin)
+    # level 0 is always the configured capture
+    if steps and any(key in steps[0] for key in LADDER_FIELDS):
+        steps = [{"name": "configured"}] + list(steps)
+    return build_ladder(steps, base)
+
+
+@dataclass
+class ControllerConfig:
+    target_fps: float = 30.0
+    window: int = 30  # grabbed frames per decision
+    tolerance: float = 0.1  # a window more than this fraction over budget is overloaded
+    high_backlog: float = 0.75  # persistence queue fill that counts as overloaded
+    low_backlog: float = 0.25  # and below which there is headroom
+    headroom_windows: int = 5  # windows within budget before stepping up
+    max_headroom_windows: int = 80
+
+
+class QualityController:
+    """Decides the quality level from per-frame latencies; the engine applies it on its grab thread."""
+
+    def __init__(self, ladder: List[QualityLevel], config: ControllerConfig = ControllerConfig(),
+                 body_params=None, object_params=None):
+        if not ladder:
+            raise ValueError("The quality ladder needs at least one level")
+        self.ladder = ladder
+        self.config = config
+        # the parameters the models were enabled with, switched to each level's detection model
+        self.body_params = body_params
+        self.object_params = object_params
+        self.level = 0
+        self.headroom_windows = config.headroom_windows
+        self._frames = 0
+        self._busy = 0.0
+        self._backlog = 0.0
+        self._calm = 0
+        self._settling = False
+        self._stepped_up = False
+        self.last_window: dict = {}
+
+    @property
+    def current(self) -> QualityLevel:
+        return self.ladder[self.level]
+
+    def observe(self, grab_seconds: float, retrieve_seconds: float, backlog: float) -> Optional[str]:
+        """Account one grabbed frame; returns the reason when the level changed."""
+        self._frames += 1
+        self._busy += grab_seconds + retrieve_seconds
+        self._backlog = max(self._backlog, backlog)
+        if self._frames < self.config.window:
+            return None
+        load = self._busy / self._frames * self.config.target_fps
+        backlog = self._backlog
+        self._frames, self._busy, self._backlog = 0, 0.0, 0.0
+        self.last_window = {"load": load, "backlog": backlog}
+        if self._settling:
+            # model reloads and camera reopens distort the first window after a switch
+            self._settling = False
+            return None
+
+        stepped_up, self._stepped_up = self._stepped_up, False
+        if load > 1 + self.config.tolerance or backlog > self.config.high_backlog:
+            self._calm = 0
+            if stepped_up:
+                self.headroom_windows = min(self.headroom_windows * 2, self.config.max_headroom_windows)
+            if self.level + 1 < len(self.ladder):
+                self.level += 1
+                self._settling = True
+                return OVERLOADED
+            return None
+        if load <= 1 + self.config.tolerance / 2 and backlog < self.config.low_backlog:
+            self._calm += 1
+            if self._calm >= self.headroom_windows and self.level > 0:
+                self._calm = 0
+                self.level -= 1
+                self._settling = True
+                self._stepped_up = True
+                return HEADROOM
+        else:
+            self._calm = 0
+        return None
+
+    def switch_camera(self, camera: Camera, previous: QualityLevel) -> List[str]:
+        """Switch the camera-side settings that changed since ``previous``; returns the ones that failed."""
+        level = self.current
+        failed = []
+        if level.depth_mode != previous.depth_mode and not camera.set_depth_mode(level.depth_mode):
+            failed.append("depth_mode")
+        if self.body_params is not None and level.body_model != previous.body_model and \
+                not camera.enable_body_tracking(replace(self.body_params, detection_model=level.body_model)):
+            failed.append("body_model")
+        if self.object_params is not None and level.object_model != previous.object_model and \
+                not camera.enable_object_detection(replace(self.object_params, detection_model=level.object_model)):
+            failed.append("object_model")
+        if failed:
+            logger.error(f"Could not switch {failed} to quality level {level.name}")
+        return failed
+
+
+def ladder_metadata(ladder: List[QualityLevel]) -> List[dict]:
+    return [asdict(level) for level in ladder]
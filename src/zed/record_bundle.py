@@ -0,0 +1,53 @@
+import argparse
+import sys
+from pathlib import Path
+
+from loguru import logger
+
+from zed.body_tracking import BodyTracking
+from zed.main import open_camera
+from zed.object_detection import ObjectDetection
+from zed.options import add_camera_arguments
+from zed.virtual_camera import record_bundle
+
+if __name__ == "__main__":
+    logger.remove(0)
+    logger.add(sys.stdout, level="INFO")
+
+    parser = argparse.ArgumentParser(description="Record a frame bundle that --camera replay plays back without the SDK")
+    parser.add_argument('--out', type=str, required=True, help='Directory to write the bundle to')
+    parser.add_argument('--frames', type=int, default=300, help='Frames to record (0 records until the end of the stream)')
+    parser.add_argument('--chunk_frames', type=int, default=16, help='Frames per depth/image chunk')
+    parser.add_argument('--input_svo_file', type=str, help='Path to an .svo file, if you want to replay it', default='')
+    parser.add_argument('--ip_address', type=str, help='IP Address, in format a.b.c.d:port or a.b.c.d, if you have a streaming setup', default='')
+    parser.add_argument('--resolution', type=str, help='Resolution, can be either HD2K, HD1200, HD1080, HD720, SVGA or VGA', default='')
+    parser.add_argument('--enable_body_tracking', action='store_true', help="Record tracked bodies")
+    parser.add_argument('--enable_od', action='store_true', help="Record object detections and their masks")
+    add_camera_arguments(parser)
+    opt = parser.parse_args()
+
+    if opt.camera == "replay":
+        print("Record from --camera zed or synthetic. Exit program")
+        exit(1)
+    if Path(opt.out).exists():
+        print(f"{opt.out} already exists. Exit program")
+        exit(1)
+
+    try:
+        camera = open_camera(opt)
+    except RuntimeError:
+        exit(1)
+    try:
+        # positional tracking is enabled along with object detection, as in zed/main.py
+        object_detection = ObjectDetection(camera) if opt.enable_od else None
+        if object_detection is None:
+            camera.enable_positional_tracking()
+        body_tracker = BodyTracking(camera) if opt.enable_body_tracking else None
+        record_bundle(camera, Path(opt.out), num_frames=opt.frames or None,
+                      bodies=body_tracker is not None and body_tracker.enabled,
+                      objects=object_detection is not None,
+                      chunk_frames=opt.chunk_frames)
+    except KeyboardInterrupt:
+        logger.info("Interrupted by user")
+    finally:
+        camera.close()
@@ -0,0 +1,81 @@
+"""Frame sampling and the offline replay schedule.
+
+A sampler decides which grabbed frames are sampled: ``FrameSampler`` takes
+every ``stride``-th frame, ``TimestampSampler`` the first frame at or after
+every ``interval`` on the camera clock (SVO timestamps when replaying, so the
+result does not depend on how fast the replay runs).
+
+Both can also tell, before a frame is grabbed, whether it may be sampled.
+That lets a replay skip the work for the frames in between:
+
+* ``full``       - grab every frame with depth, as a live camera does
+* ``skip-depth`` - grab every frame, computing depth only for frames that may
+                   be sampled; body and positional tracking still see every
+                   frame
+* ``seek``       - jump straight to the next frame that may be sampled;
+                   fastest, but the tracking modules see a gap at every seek
+"""
+import math
+from enum import Enum
+from typing import Optional
+
+
+class ReplayMode(str, Enum):
+    FULL = "full"
+    SKIP_DEPTH = "skip-depth"
+    SEEK = "seek"
+
+
+class FrameSampler:
+    def __init__(self, stride: int):
+        self.stride = stride
+
+    def may_sample(self, frame: int) -> bool:
+        return frame % self.stride == 0
+
+    def next_candidate(self, frame: int) -> int:
+        return -(-frame // self.stride) * self.stride
+
+    def due(self, frame: int, timestamp: int) -> bool:
+        return frame % self.stride == 0
+
+
+class TimestampSampler:
+    """Samples the first frame at or after each multiple of ``interval_ns`` past the first frame."""
+
+    def __init__(self, interval_ns: int, frame_period_ns: int):
+        self.interval_ns = interval_ns
+        self.frame_period_ns = frame_period_ns
+        # timestamps jitter around the nominal frame period
+        self.tolerance_ns = frame_period_ns // 2
+        self.next_due: Optional[int] = None
+        self._anchor = 0
+        self._last = None  # (frame, timestamp) of the last grabbed frame
+
+    def _expected(self, frame: int) -> Optional[int]:
+        if self._last is None:
+            return None
+        last_frame, last_timestamp = self._last
+        return last_timestamp + (frame - last_frame) * self.frame_period_ns
+
+    def may_sample(self, frame: int) -> bool:
+        expected = self._expected(frame)
+        return expected is None or expected >= self.next_due - self.tolerance_ns
+
+    def next_candidate(self, frame: int) -> int:
+        if self._last is None:
+            return frame
+        last_frame, last_timestamp = self._last
+        ahead = math.ceil((self.next_due - self.tolerance_ns - last_timestamp) / self.frame_period_ns)
+        return max(frame, last_frame + ahead)
+
+    def due(self, frame: int, timestamp: int) -> bool:
+        self._last = (frame, timestamp)
+        if self.next_due is None:
+            self._anchor = timestamp
+        elif timestamp < self.next_due - self.tolerance_ns:
+            return False
+        # the next interval after this frame, so a gap in the recording does not cause a burst
+        intervals = (timestamp + self.tolerance_ns - self._anchor) // self.interval_ns + 1
+        self.next_due = self._anchor + intervals * self.interval_ns
+        return True
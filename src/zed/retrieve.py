@@ -1,135 +1,130 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
 import numpy as np
-from pyzed import sl
+from zed.buffer_pool import BufferPool, Lease
+from zed.camera import BODIES, DEPTH, IMAGE, OBJECTS, Camera, DetectedObject
+from utils.telemetry import TELEMETRY
+from utils.trajectory import CameraPose
+
 
 class ZedRetrieval:
-    def __init__(self,zed):
-        self.zed = zed
+    def __init__(self,camera: Camera, pool_size: int = 4, max_pool_size: int = 16):
+        self.camera = camera
+        self.pool_size = pool_size
+        self.max_pool_size = max_pool_size
+        # seconds to wait for a buffer when a pool is exhausted, None waits for one to come back
+        self.buffer_timeout: Optional[float] = 0
+        self._pools: Dict[Tuple, BufferPool] = {}
+        self.copies = 0
+        self._frame_mark = (0, 0)
+        self.last_frame_stats = {"allocations": 0, "copies": 0}
+
+    def _pool(self, key: Tuple, factory) -> BufferPool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = BufferPool(factory, size=self.pool_size, max_size=self.max_pool_size, name="-".join(map(str, key)))
+            self._pools[key] = pool
+        return pool
+
+    def _buffer_pool(self, kind: str, camera_res=None) -> BufferPool:
+        if camera_res is None:
+            return self._pool((kind,), lambda: self.camera.new_buffer(kind))
+        width, height = camera_res.width, camera_res.height
+        return self._pool((kind, width, height), lambda: self.camera.new_buffer(kind, width, height))
+
+    @property
+    def allocations(self) -> int:
+        return sum(pool.allocations for pool in self._pools.values())
+
+    def allocation_stats(self) -> dict:
+        return {
+            "allocations": self.allocations,
+            "copies": self.copies,
+            "exhausted": sum(pool.exhausted for pool in self._pools.values()),
+            "in_use": sum(pool.in_use for pool in self._pools.values()),
+        }
 
-    def zed_retrieve_object_detections(self, runtime_params: sl.ObjectDetectionRuntimeParameters, instance_id: int) -> Optional[List[sl.ObjectData]]:
-        objects = sl.Objects()
-        if self.zed.retrieve_objects(objects, runtime_params, instance_id) != sl.ERROR_CODE.SUCCESS:
-            logger.error("Cannot retrieve detected objects")
+    def end_frame(self) -> dict:
+        """Close the per-frame accounting window; the steady state should report zeros."""
+        allocations, copies = self.allocations, self.copies
+        self.last_frame_stats = {
+            "allocations": allocations - self._frame_mark[0],
+            "copies": copies - self._frame_mark[1],
+        }
+        self._frame_mark = (allocations, copies)
+        return self.last_frame_stats
+
+    def _lease(self, kind: str, camera_res=None, view: bool = False) -> Optional[Lease]:
+        lease = self._buffer_pool(kind, camera_res).acquire(self.buffer_timeout)
+        if lease is None:
             return None
-        return objects.object_list
-
-
-    def zed_retrieve_depth_map(self, camera_res, deep_copy: bool = True) -> Optional[np.ndarray]:
-        depth = sl.Mat(camera_res.width,
-                    camera_res.height,
-                    memory_type=sl.MEM.CPU,
-                    mat_type=sl.MAT_TYPE.F32_C1)
-        
-        err = self.zed.retrieve_measure(depth, sl.MEASURE.DEPTH, sl.MEM.CPU)
-        if err != sl.ERROR_CODE.SUCCESS:
-            logger.error("Cannot retrieve the depth map")
+        with TELEMETRY.stage(f"retrieve_{kind}"):
+            ok = self.camera.retrieve(kind, lease.item)
+        if not ok:
+            logger.error(f"Cannot retrieve {kind}")
+            lease.release()
             return None
-        depth_image_np = depth.get_data(deep_copy=deep_copy)
-        return depth_image_np
-    
-    def zed_retrieve_left_image(self, camera_res) -> Optional[np.ndarray]:
-        left_image = sl.Mat(camera_res.width,
-                            camera_res.height,
-                            memory_type=sl.MEM.CPU,
-                            mat_type=sl.MAT_TYPE.U8_C4)
-        err = self.zed.retrieve_image(left_image, sl.VIEW.LEFT)
-        if err != sl.ERROR_CODE.SUCCESS:
-            logger.error("Cannot retrieve the left image")
+        if view:
+            lease.view = self.camera.view(lease.item)
+        return lease
+
+    def lease_object_detections(self) -> Optional[Lease]:
+        return self._lease(OBJECTS)
+
+    def zed_retrieve_object_detections(self) -> Optional[List[DetectedObject]]:
+        lease = self.lease_object_detections()
+        if lease is None:
+            return None
+        with lease:
+            return self.camera.objects(lease.item)
+
+    def lease_depth_map(self, camera_res) -> Optional[Lease]:
+        """Retrieve the depth map into a pooled buffer; ``lease.view`` is a zero-copy view of it."""
+        return self._lease(DEPTH, camera_res, view=True)
+
+    def zed_retrieve_depth_map(self, camera_res) -> Optional[np.ndarray]:
+        # a copy, since the pooled buffer is recycled once released; lease_depth_map avoids it
+        lease = self.lease_depth_map(camera_res)
+        if lease is None:
             return None
-        
-        image_np = left_image.get_data(deep_copy=True)
-        return image_np
-    
-    def zed_retrieve_bodies(self,tracking_params,instance_module_id:int) -> Optional[sl.Bodies]:
-        """Retrieve body tracking data from ZED camera"""
-        bodies = sl.Bodies()
-        
-        if self.zed.retrieve_bodies(bodies, tracking_params,instance_module_id) == sl.ERROR_CODE.SUCCESS:
-            return bodies
-        else:
-            logger.error("Cannot retrieve body tracking data")
+        with lease:
+            return self._copy_out(lease.view)
+
+    def lease_left_image(self, camera_res) -> Optional[Lease]:
+        """Retrieve the left BGRA image into a pooled buffer; ``lease.view`` is a zero-copy view of it."""
+        return self._lease(IMAGE, camera_res, view=True)
+
+    def zed_retrieve_left_image(self, camera_res) -> Optional[np.ndarray]:
+        lease = self.lease_left_image(camera_res)
+        if lease is None:
             return None
-    
-    def zed_extract_segmentation_masks(self, objects: List[sl.ObjectData]) -> List[np.ndarray]:
-        masks = []
-        for obj in objects:
-            if obj.mask and obj.mask.is_init():
-                masks.append(obj.mask.get_data(deep_copy=True))
-        return masks
-
-        
-
-    @staticmethod
-    def extract_keypoints_and_masks(bodies: sl.Bodies, camera_res) -> dict:
-        """Extract 2D/3D keypoints and masks from body tracking data"""
-        frame_data = {
-            'bodies': [],
-            'timestamp': bodies.timestamp.get_nanoseconds()
-        }
-        
-        for body in bodies.body_list:
-            if body.tracking_state == sl.OBJECT_TRACKING_STATE.OK:
-                body_data = {
-                    'id': body.id,
-                    'confidence': body.confidence,
-                    'action_state': str(body.action_state),
-                    'keypoints_2d': [],
-                    'keypoints_3d': [],
-                    'bounding_box_2d': [],
-                    'bounding_box_3d': [],
-                    'mask': None
-                }
-                
-                # Extract 2D keypoints
-                keypoints_2d = body.keypoint_2d
-                for i, kp in enumerate(keypoints_2d):
-                    if i < len(keypoints_2d):
-                        body_data['keypoints_2d'].append({
-                            'joint_id': i,
-                            'x': float(kp[0]),
-                            'y': float(kp[1])
-                        })
-                
-                # Extract 3D keypoints
-                keypoints_3d = body.keypoint
-                for i, kp in enumerate(keypoints_3d):
-                    if i < len(keypoints_3d):
-                        body_data['keypoints_3d'].append({
-                            'joint_id': i,
-                            'x': float(kp[0]),
-                            'y': float(kp[1]),
-                            'z': float(kp[2])
-                        })
-                
-                # Extract 2D bounding box
-                bbox_2d = body.bounding_box_2d
-                for corner in bbox_2d:
-                    body_data['bounding_box_2d'].append({
-                        'x': float(corner[0]),
-                        'y': float(corner[1])
-                    })
-                
-                # Extract 3D bounding box
-                bbox_3d = body.bounding_box
-                for corner in bbox_3d:
-                    body_data['bounding_box_3d'].append({
-                        'x': float(corner[0]),
-                        'y': float(corner[1]),
-                        'z': float(corner[2])
-                    })
-                
-                frame_data['bodies'].append(body_data)
-        
-        return frame_data
+        with lease:
+            return self._copy_out(lease.view)
+
+    def _copy_out(self, view: np.ndarray) -> np.ndarray:
+        self.copies += 1
+        return view.copy()
+
+    def lease_bodies(self) -> Optional[Lease]:
+        return self._lease(BODIES)
+
+    def body_records(self, bodies, frame_id: int) -> np.ndarray:
+        """Records of every tracked body in a leased bodies buffer"""
+        return self.camera.body_records(bodies, frame_id)
+
+    def detected_objects(self, objects) -> List[DetectedObject]:
+        """Detections of a leased objects buffer, with copies of their masks"""
+        detected = self.camera.objects(objects)
+        self.copies += sum(obj.mask is not None for obj in detected)
+        return detected
+
+    def zed_extract_segmentation_masks(self, objects) -> List[np.ndarray]:
+        """Copies of the masks of a leased objects buffer"""
+        return [obj.mask for obj in self.detected_objects(objects) if obj.mask is not None]
+
+    def retrieve_camera_pose(self) -> CameraPose:
+        return self.camera.pose()
 
     def retrieve_camera_extrinsic_matrix(self)->Optional[np.ndarray]:
-        pose = sl.Pose()
-        state = self.zed.get_position(pose, sl.REFERENCE_FRAME.WORLD)
-        if state == sl.POSITIONAL_TRACKING_STATE.OK:
-            translation_orientation_data = pose.pose_data()
-            cam_extrinsics:np.ndarray = translation_orientation_data.m
-            return cam_extrinsics.tolist()
-        else:
-            logger.error("Cannot retrieve body tracking data")
-        return None
\ No newline at end of file
+        pose = self.retrieve_camera_pose()
+        return pose.matrix.tolist() if pose.ok else None
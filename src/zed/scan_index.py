@@ -0,0 +1,228 @@
+"""Two-pass extraction: a cheap scan of a recording, then full-quality capture of the interesting parts.
+
+``scan_recording`` replays a recording with only body tracking running (fast
+model, lowest depth mode, depth skipped on the frames in between) and keeps
+one fixed-size record per scanned frame: SVO position, timestamp, number of
+bodies, best body confidence and the union of their 2D boxes, normalised to
+the frame size so it does not depend on the scan resolution.
+
+The records are written to ``<recording>.scan.bin`` with a
+``<recording>.scan.json`` header holding the record dtype, the scan settings
+and the size and mtime of the recording. ``load_scan_index`` only returns an
+index that is still current, so repeated extractions with different settings
+(``select_segments`` thresholds, sampling, resolutions) reuse one scan.
+
+``select_segments`` turns an index into SVO frame ranges, which
+``zed/extract_svo.py --scan_index`` hands to ``plan_segment_shards``.
+"""
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from utils.body_records import descr_to_dtype
+from zed.body_tracking import BodyTrackingParameters
+from zed.camera import BODIES, Camera, GrabStatus
+from zed.replay import ReplayMode
+
+SCAN_SUFFIX = ".scan"
+SCAN_VERSION = 1
+
+SCAN_DTYPE = np.dtype([
+    ("frame", "<i8"),  # SVO position
+    ("timestamp", "<i8"),  # ns
+    ("num_bodies", "<i4"),
+    ("confidence", "<f4"),  # best body confidence, 0 without a body
+    ("bbox", "<f4", (4,)),  # x0, y0, x1, y1 of all bodies as a fraction of the frame, NaN without a body
+])
+
+# what the scan runs: the fastest body model, without fitting
+SCAN_BODY_PARAMETERS = BodyTrackingParameters(enable_body_fitting=False, detection_model="HUMAN_BODY_FAST")
+
+
+@dataclass
+class ScanSettings:
+    stride: int = 1  # scan every N-th frame
+    replay_mode: str = ReplayMode.SKIP_DEPTH.value  # how the frames in between are passed over
+    detection_model: str = SCAN_BODY_PARAMETERS.detection_model
+    depth_mode: str = "PERFORMANCE"
+    resolution: str = ""
+
+
+@dataclass
+class Segment:
+    start: int  # first SVO frame
+    end: int  # one past the last SVO frame
+
+    def __len__(self):
+        return self.end - self.start
+
+
+def index_paths(recording: str) -> Tuple[Path, Path]:
+    """``(records, header)`` paths of the scan index of a recording."""
+    base = f"{recording}{SCAN_SUFFIX}"
+    return Path(base + ".bin"), Path(base + ".json")
+
+
+def _fingerprint(recording: str) -> Optional[dict]:
+    # stand-in recordings (synthetic, bundles) have no file to compare against
+    if not os.path.isfile(recording):
+        return None
+    stat = os.stat(recording)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _frame_record(camera: Camera, bodies, frame: int, width: int, height: int) -> np.ndarray:
+    record = np.zeros(1, dtype=SCAN_DTYPE)
+    record["frame"] = frame
+    record["timestamp"] = camera.timestamp()
+    record["bbox"] = np.nan
+    if bodies is None or not camera.retrieve(BODIES, bodies):
+        return record
+    bodies_records = camera.body_records(bodies, frame)
+    record["num_bodies"] = len(bodies_records)
+    if not len(bodies_records):
+        return record
+    record["confidence"] = bodies_records["confidence"].max()
+    boxes = bodies_records["bounding_box_2d"].reshape(-1, 4, 2).astype(np.float64)
+    # the SDK leaves zeros when a box is not available
+    boxes = boxes[np.isfinite(boxes).all(axis=(1, 2)) & boxes.any(axis=(1, 2))]
+    if len(boxes):
+        (x0, y0), (x1, y1) = boxes.min(axis=(0, 1)), boxes.max(axis=(0, 1))
+        record["bbox"] = np.clip([x0 / width, y0 / height, x1 / width, y1 / height], 0, 1)
+    return record
+
+
+def scan_recording(camera: Camera, settings: ScanSettings = ScanSettings(), body_tracking: bool = True) -> np.ndarray:
+    """One ``SCAN_DTYPE`` record per scanned frame, until the end of the recording.
+
+    ``body_tracking`` tells whether the camera has body tracking enabled;
+    without it the index only holds positions and timestamps.
+    """
+    bodies = camera.new_buffer(BODIES) if body_tracking else None
+    width, height = camera.info.width, camera.info.height
+    seek = ReplayMode(settings.replay_mode) == ReplayMode.SEEK and settings.stride > 1
+    records = []
+    frame = 0
+    # frames up to the last one grabbed; a final seek may land past the end
+    covered = 0
+    start = time.perf_counter()
+    while True:
+        scanned = frame % settings.stride == 0
+        if not scanned and seek:
+            frame = -(-frame // settings.stride) * settings.stride
+            camera.seek(frame)
+            scanned = True
+        # body tracking needs depth on the frames it runs on
+        status = camera.grab(compute_depth=scanned)
+        if status == GrabStatus.END_OF_STREAM:
+            break
+        if status != GrabStatus.SUCCESS:
+            logger.error(f"Failed to grab frame {frame}: {status}, stopping the scan")
+            break
+        covered = frame + 1
+        if scanned:
+            records.append(_frame_record(camera, bodies, frame, width, height))
+            if len(records) % 1000 == 0:
+                logger.info(f"Scanned {frame + 1} frames in {time.perf_counter() - start:.1f}s")
+        frame += 1
+    records = np.concatenate(records) if records else np.zeros(0, dtype=SCAN_DTYPE)
+    logger.info(f"Scanned {covered} frames ({len(records)} indexed) in {time.perf_counter() - start:.1f}s, "
+                f"{int((records['num_bodies'] > 0).sum())} with a body")
+    return records
+
+
+def write_scan_index(recording: str, records: np.ndarray, settings: ScanSettings, num_frames: int,
+                     fps: float) -> Path:
+    records_path, header_path = index_paths(recording)
+    records.astype(SCAN_DTYPE).tofile(records_path)
+    with header_path.open(mode="w") as fout:
+        json.dump({
+            "version": SCAN_VERSION,
+            "dtype": np.lib.format.dtype_to_descr(SCAN_DTYPE),
+            "recording": str(recording),
+            "source": _fingerprint(recording),
+            "num_frames": num_frames,
+            "fps": fps,
+            "settings": asdict(settings),
+        }, fout, indent=4)
+    logger.info(f"Wrote scan index {records_path} ({len(records)} records)")
+    return records_path
+
+
+def load_scan_index(recording: str, settings: Optional[ScanSettings] = None) -> Optional[Tuple[np.ndarray, dict]]:
+    """``(records, header)`` of the recording's scan index, None if there is none or it is stale.
+
+    With ``settings`` the index must also have been scanned with them.
+    """
+    records_path, header_path = index_paths(recording)
+    if not (records_path.exists() and header_path.exists()):
+        return None
+    with header_path.open(mode="r") as fin:
+        header = json.load(fin)
+    if header.get("version") != SCAN_VERSION:
+        logger.info(f"{header_path} has version {header.get('version')}, expected {SCAN_VERSION}")
+        return None
+    if header["source"] != _fingerprint(recording):
+        logger.info(f"{recording} changed since it was scanned")
+        return None
+    if settings is not None and header["settings"] != asdict(settings):
+        logger.info(f"{header_path} was scanned with {header['settings']}")
+        return None
+    return np.fromfile(records_path, dtype=descr_to_dtype(header["dtype"])), header
+
+
+def select_segments(records: np.ndarray, num_frames: int, min_confidence: float = 50.0, min_bodies: int = 1,
+                    max_gap: int = 30, padding: int = 15, min_frames: int = 15) -> List[Segment]:
+    """SVO frame ranges where the index shows at least ``min_bodies`` bodies of ``min_confidence``.
+
+    Hits less than ``max_gap`` frames apart are merged into one segment, every
+    segment is widened by ``padding`` frames on both sides (and merged with its
+    neighbours if they then overlap), and segments shorter than ``min_frames``
+    are dropped.
+    """
+    if not len(records):
+        return []
+    frames = records["frame"]
+    # a scanned frame stands for the frames up to the next scanned one
+    step = int(np.median(np.diff(frames))) if len(frames) > 1 else 1
+    hits = frames[(records["num_bodies"] >= min_bodies) & (records["confidence"] >= min_confidence)]
+    segments: List[Segment] = []
+    for frame in hits:
+        start, end = int(frame), int(frame) + step
+        if segments and start - segments[-1].end < max_gap:
+            segments[-1].end = end
+        else:
+            segments.append(Segment(start, end))
+
+    padded: List[Segment] = []
+    for segment in segments:
+        start, end = max(0, segment.start - padding), min(num_frames, segment.end + padding)
+        if padded and start <= padded[-1].end:
+            padded[-1].end = max(padded[-1].end, end)
+        else:
+            padded.append(Segment(start, end))
+    return [segment for segment in padded if len(segment) >= min_frames]
+
+
+def parse_frame_ranges(ranges: List[str]) -> List[Segment]:
+    """``START:END`` strings (END exclusive) as sorted, non-overlapping segments."""
+    segments = []
+    for text in ranges:
+        start, sep, end = text.partition(":")
+        if not sep or not start.isdigit() or not end.isdigit() or int(end) <= int(start):
+            raise ValueError(f"Invalid frame range {text!r}, expected START:END with END > START")
+        segments.append(Segment(int(start), int(end)))
+    segments.sort(key=lambda segment: segment.start)
+    merged: List[Segment] = []
+    for segment in segments:
+        if merged and segment.start <= merged[-1].end:
+            merged[-1].end = max(merged[-1].end, segment.end)
+        else:
+            merged.append(segment)
+    return merged
@@ -0,0 +1,67 @@
+import argparse
+import copy
+import sys
+
+from loguru import logger
+
+from zed.body_tracking import BodyTracking
+from zed.main import open_camera
+from zed.options import add_camera_arguments
+from zed.replay import ReplayMode
+from zed.scan_index import SCAN_BODY_PARAMETERS, ScanSettings, load_scan_index, scan_recording, write_scan_index
+
+
+def scan_file(path: str, opt, settings: ScanSettings):
+    opt = copy.copy(opt)
+    opt.input_svo_file = path
+    opt.ip_address = ''
+    opt.depth_mode = settings.depth_mode
+    camera = open_camera(opt)
+    try:
+        # body tracking needs positional tracking
+        camera.enable_positional_tracking()
+        body_tracker = BodyTracking(camera, SCAN_BODY_PARAMETERS)
+        records = scan_recording(camera, settings, body_tracking=body_tracker.enabled)
+        write_scan_index(path, records, settings, num_frames=camera.num_frames() or 0, fps=camera.info.fps)
+    finally:
+        camera.close()
+
+
+if __name__ == "__main__":
+    logger.remove(0)
+    logger.add(sys.stdout, level="INFO")
+
+    parser = argparse.ArgumentParser(description="First pass of a two-pass extraction: index where the bodies are, "
+                                                 "then run zed/extract_svo.py --scan_index")
+    parser.add_argument('--input_svo_files', type=str, nargs='+', required=True, help='One or more .svo files to scan')
+    parser.add_argument('--stride', type=int, default=3, help='Run body tracking on every N-th frame')
+    parser.add_argument('--replay_mode', type=str, default=ReplayMode.SKIP_DEPTH.value,
+                        choices=[ReplayMode.SKIP_DEPTH.value, ReplayMode.SEEK.value],
+                        help="Grab the frames in between without depth, or seek past them")
+    parser.add_argument('--depth_mode', type=str, default="PERFORMANCE", help='sl.DEPTH_MODE body tracking runs on')
+    parser.add_argument('--resolution', type=str, default='VGA',
+                        help='Resolution of a live camera; an SVO keeps the resolution it was recorded at')
+    parser.add_argument('--force', action='store_true', help='Rescan even if a current index exists')
+    add_camera_arguments(parser)
+    opt = parser.parse_args()
+
+    if opt.stride < 1:
+        print("--stride must be at least 1. Exit program")
+        exit(1)
+    if opt.camera == "replay":
+        print("Scan SVO files (--camera zed) or a synthetic camera. Exit program")
+        exit(1)
+
+    settings = ScanSettings(stride=opt.stride, replay_mode=opt.replay_mode, depth_mode=opt.depth_mode,
+                            resolution=opt.resolution)
+    for path in opt.input_svo_files:
+        if not opt.force and load_scan_index(path, settings) is not None:
+            logger.info(f"{path} already scanned, skipping (--force rescans)")
+            continue
+        try:
+            scan_file(path, opt, settings)
+        except RuntimeError:
+            exit(1)
+        except KeyboardInterrupt:
+            logger.info("Interrupted by user")
+            exit(1)
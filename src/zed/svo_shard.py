@@ -0,0 +1,320 @@
+"""Offline SVO extraction sharded by frame range.
+
+``plan_shards`` cuts a recording into contiguous frame ranges whose boundaries
+fall on the sampling stride, so every shard samples exactly the frames a
+sequential replay would and knows the id of its first sampled frame. Each
+range is replayed by its own process with its own camera, seeked with
+``set_svo_position``, and written as a regular experiment layout under
+``EXP/shards/NNN`` using those global ids, so shards never collide.
+``merge_shards`` then moves every shard into ``EXP``; when a shard sampled
+fewer frames than planned (a failed grab, a dead worker, ``--gate``) the ids
+after it are shifted down so the index stays contiguous.
+``plan_segment_shards`` does the same for selected frame ranges only (the
+second pass of a two-pass extraction, see ``zed.scan_index``).
+
+Workers run a ``capture`` callable: ``capture_with_sdk`` goes through the
+regular CaptureEngine, ``capture_with_stand_in`` swaps the ZED for a
+``SyntheticCamera`` so planning, seeking, batching and merging work without
+pyzed.
+"""
+import copy
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from utils.body_records import RECORDS_FILE, RECORDS_HEADER, descr_to_dtype
+from utils.roi import ROI_FILE, ROI_HEADER
+from utils.trajectory import TRAJECTORY_FILE, TRAJECTORY_HEADER
+from zed.options import CAPTURE_FPS, sampling_stride
+from zed.persist import EXPERIMENTS_ROOT, new_experiment_dir
+from zed.scan_index import Segment
+
+SHARDS_DIR = "shards"
+SHARD_MANIFEST = "shard.json"
+MERGE_MANIFEST = "shards.json"
+# append-only session files and the headers holding their record dtype
+SESSION_FILES = ((RECORDS_FILE, RECORDS_HEADER), (TRAJECTORY_FILE, TRAJECTORY_HEADER), (ROI_FILE, ROI_HEADER))
+
+
+@dataclass(frozen=True)
+class FrameRange:
+    start: int  # first SVO frame
+    end: int  # one past the last SVO frame
+    first_id: int  # counter of the first sampled frame
+    num_samples: int
+
+
+def plan_shards(num_frames: int, num_shards: int, stride: int) -> List[FrameRange]:
+    """Split ``num_frames`` into at most ``num_shards`` ranges with a near-equal number of sampled frames."""
+    samples = -(-num_frames // stride)
+    num_shards = max(1, min(num_shards, samples))
+    ranges = []
+    for index in range(num_shards):
+        first = samples * index // num_shards
+        last = samples * (index + 1) // num_shards
+        ranges.append(FrameRange(start=first * stride, end=min(last * stride, num_frames),
+                                 first_id=first, num_samples=last - first))
+    return ranges
+
+
+def plan_segment_shards(segments: List[Segment], num_shards: int, stride: int) -> List[FrameRange]:
+    """Shard only the frames of ``segments``, ids running on from one segment to the next.
+
+    Long segments are cut so that there are about ``num_shards`` ranges of a
+    near-equal number of sampled frames; cuts fall on the stride.
+    """
+    # multiples of the stride in [start, end), as the sampler sees absolute SVO positions
+    counts = [-(-segment.end // stride) - -(-segment.start // stride) for segment in segments]
+    target = max(1, -(-sum(counts) // max(1, num_shards)))
+    ranges = []
+    first_id = 0
+    for segment, samples in zip(segments, counts):
+        if samples == 0:
+            continue
+        first_sample = -(-segment.start // stride)
+        pieces = -(-samples // target)
+        for index in range(pieces):
+            first = samples * index // pieces
+            last = samples * (index + 1) // pieces
+            start = segment.start if index == 0 else (first_sample + first) * stride
+            end = segment.end if index == pieces - 1 else (first_sample + last) * stride
+            ranges.append(FrameRange(start=start, end=end, first_id=first_id + first, num_samples=last - first))
+        first_id += samples
+    return ranges
+
+
+@dataclass
+class ShardJob:
+    svo_path: str
+    exp_dir: Path
+    index: int
+    frames: FrameRange
+    opt: object  # the parsed capture options
+    warmup_frames: int = 0
+
+    @property
+    def shard_dir(self) -> Path:
+        return self.exp_dir / SHARDS_DIR / f"{self.index:03}"
+
+
+def _write_manifest(job: ShardJob, **fields) -> dict:
+    manifest = {"index": job.index, "svo": str(job.svo_path), **asdict(job.frames),
+                "gated": bool(getattr(job.opt, "gate", False)), **fields}
+    with (job.shard_dir / SHARD_MANIFEST).open(mode="w") as fout:
+        json.dump(manifest, fout, indent=4)
+    return manifest
+
+
+def run_shard(job: ShardJob, capture: Callable[[ShardJob], int]) -> dict:
+    """Worker entry point: capture one frame range into the job's shard directory."""
+    job.shard_dir.mkdir(parents=True, exist_ok=True)
+    # written up front so merge_shards knows the range even if this process dies
+    _write_manifest(job, sampled=None)
+    logger.info(f"Shard {job.index} of {job.svo_path}: frames {job.frames.start}..{job.frames.end}")
+    start = time.perf_counter()
+    try:
+        sampled = capture(job)
+        error = None
+    except Exception as e:
+        logger.error(f"Shard {job.index} of {job.svo_path} failed: {e}")
+        sampled, error = None, repr(e)
+    return _write_manifest(job, sampled=sampled, seconds=time.perf_counter() - start, error=error)
+
+
+def count_frames_with_sdk(svo_path: str) -> int:
+    # imported here so the module stays importable without pyzed
+    from pyzed import sl
+
+    init = sl.InitParameters(depth_mode=sl.DEPTH_MODE.NONE)
+    init.set_from_svo_file(str(svo_path))
+    zed = sl.Camera()
+    status = zed.open(init)
+    if status != sl.ERROR_CODE.SUCCESS:
+        raise RuntimeError(f"Cannot open {svo_path}: {repr(status)}")
+    try:
+        return zed.get_svo_number_of_frames()
+    finally:
+        zed.close()
+
+
+def _run_capture(job: ShardJob, opt) -> int:
+    from zed.main import run_capture
+
+    if getattr(opt, "telemetry", False):
+        # one export per worker, next to the shards rather than inside them
+        suffix = Path(opt.telemetry_path).suffix if opt.telemetry_path else \
+            (".prom" if opt.telemetry_format == "prometheus" else ".json")
+        opt.telemetry_path = str(job.exp_dir / f"telemetry-{job.index:03}{suffix}")
+    engine = run_capture(opt, job.shard_dir,
+                         start_frame=job.frames.start,
+                         end_frame=job.frames.end,
+                         first_counter=job.frames.first_id,
+                         warmup_frames=job.warmup_frames)
+    return engine.frames_sampled
+
+
+def capture_with_sdk(job: ShardJob) -> int:
+    opt = copy.copy(job.opt)
+    opt.camera = "zed"
+    opt.input_svo_file = str(job.svo_path)
+    opt.ip_address = ""
+    return _run_capture(job, opt)
+
+
+def capture_with_stand_in(job: ShardJob) -> int:
+    """Replays a SyntheticCamera of ``opt.stand_in_frames`` frames through the regular CaptureEngine.
+
+    Pose timestamps are ``frame / fps`` seconds, so a merged experiment shows
+    which frame landed where.
+    """
+    opt = copy.copy(job.opt)
+    opt.camera = "synthetic"
+    opt.synthetic_frames = opt.stand_in_frames
+    opt.realtime = False
+    return _run_capture(job, opt)
+
+
+def _frame_files(shard_dir: Path) -> List[Tuple[Path, int]]:
+    """``(path, frame id)`` for every per-frame file (``<modality>/NNNNN.<ext>``) of a shard."""
+    files = []
+    for modality_dir in shard_dir.iterdir():
+        if not modality_dir.is_dir():
+            continue
+        for path in modality_dir.iterdir():
+            if path.stem.isdigit():
+                # ZedSaver numbers files from counter + 1
+                files.append((path, int(path.stem) - 1))
+    return files
+
+
+def _append_session_file(shard_dir: Path, exp_dir: Path, records_file: str, header_file: str, shift: int):
+    source = shard_dir / records_file
+    if not source.exists():
+        return
+    with (shard_dir / header_file).open(mode="r") as fin:
+        header = json.load(fin)
+    records = np.fromfile(source, dtype=descr_to_dtype(header["dtype"]))
+    records["frame_id"] += shift
+    if not (exp_dir / header_file).exists():
+        shutil.copyfile(shard_dir / header_file, exp_dir / header_file)
+    with (exp_dir / records_file).open(mode="ab") as fout:
+        fout.write(records.tobytes())
+
+
+def merge_shards(exp_dir: Path, keep_shards: bool = False) -> dict:
+    """Move ``EXP/shards/*`` into ``EXP`` with contiguous frame ids; returns the merge manifest."""
+    exp_dir = Path(exp_dir)
+    shards_root = exp_dir / SHARDS_DIR
+    session_files = {name for pair in SESSION_FILES for name in pair}
+    shards = []
+    next_id = 0
+    for shard_dir in sorted(path for path in shards_root.iterdir() if path.is_dir()):
+        with (shard_dir / SHARD_MANIFEST).open(mode="r") as fin:
+            manifest = json.load(fin)
+        files = _frame_files(shard_dir)
+        first_id = manifest["first_id"]
+        sampled = manifest["sampled"]
+        if sampled is None:
+            # the worker died: keep whatever it managed to write
+            sampled = max((frame_id for _, frame_id in files), default=first_id - 1) - first_id + 1
+        shift = next_id - first_id
+        # gated shards keep fewer frames than planned by design
+        if sampled != manifest["num_samples"] and not manifest.get("gated"):
+            logger.warning(f"Shard {shard_dir.name} sampled {sampled} of {manifest['num_samples']} planned frames, "
+                           f"renumbering the frames after it")
+
+        for path, frame_id in files:
+            target_dir = exp_dir / path.parent.name
+            target_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target_dir / f"{frame_id + shift + 1:05}{path.suffix}")
+        for records_file, header_file in SESSION_FILES:
+            _append_session_file(shard_dir, exp_dir, records_file, header_file, shift)
+        # per-session files such as camera_intrinsic.json: the first shard's copy wins
+        for path in shard_dir.iterdir():
+            if path.is_file() and path.name not in session_files and path.name != SHARD_MANIFEST \
+                    and not (exp_dir / path.name).exists():
+                os.replace(path, exp_dir / path.name)
+
+        manifest.update(sampled=sampled, merged_first_id=next_id)
+        shards.append(manifest)
+        next_id += sampled
+
+    merged = {"frames": next_id, "shards": shards}
+    with (exp_dir / MERGE_MANIFEST).open(mode="w") as fout:
+        json.dump(merged, fout, indent=4)
+    if not keep_shards:
+        shutil.rmtree(shards_root)
+    logger.info(f"Merged {len(shards)} shards into {exp_dir}: {next_id} frames")
+    return merged
+
+
+def extract_svo_files(svo_paths: List[str],
+                      opt,
+                      workers: int,
+                      num_shards: int,
+                      capture: Callable[[ShardJob], int] = capture_with_sdk,
+                      count_frames: Callable[[str], int] = count_frames_with_sdk,
+                      warmup_frames: int = 0,
+                      keep_shards: bool = False,
+                      root: Path = EXPERIMENTS_ROOT,
+                      segments: Optional[Dict[str, List[Segment]]] = None) -> Dict[str, Path]:
+    """Shard every SVO file, run all shards on one process pool and merge each experiment once its shards finish.
+
+    ``capture`` must be a module-level function so it can be sent to the
+    (spawned) worker processes. With ``segments``, only those frame ranges of
+    each file are extracted (see ``zed.scan_index``).
+    """
+    stride = sampling_stride(CAPTURE_FPS, opt.save_interval)
+    if stride is None:
+        raise ValueError("Sharded extraction needs frame-count based sampling")
+    jobs: List[ShardJob] = []
+    experiments: Dict[str, Path] = {}
+    for svo_path in svo_paths:
+        num_frames = count_frames(svo_path)
+        exp_dir = new_experiment_dir(root)
+        experiments[svo_path] = exp_dir
+        if segments is None:
+            ranges = plan_shards(num_frames, num_shards, stride)
+            logger.info(f"{svo_path}: {num_frames} frames in {len(ranges)} shards -> {exp_dir}")
+        else:
+            selected = [Segment(segment.start, min(segment.end, num_frames))
+                        for segment in segments[svo_path] if segment.start < num_frames]
+            ranges = plan_segment_shards(selected, num_shards, stride)
+            logger.info(f"{svo_path}: {sum(len(segment) for segment in selected)} of {num_frames} frames "
+                        f"in {len(selected)} segments, {len(ranges)} shards -> {exp_dir}")
+        if not ranges:
+            logger.warning(f"{svo_path}: nothing to extract")
+        jobs.extend(ShardJob(svo_path=svo_path, exp_dir=exp_dir, index=index, frames=frames, opt=opt,
+                             warmup_frames=warmup_frames)
+                    for index, frames in enumerate(ranges))
+
+    remaining = {exp_dir: 0 for exp_dir in experiments.values()}
+    for job in jobs:
+        remaining[job.exp_dir] += 1
+    start = time.perf_counter()
+    # the SDK's CUDA context does not survive fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {executor.submit(run_shard, job, capture): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                manifest = future.result()
+                logger.info(f"Shard {job.index} of {job.svo_path} done: {manifest['sampled']} frames "
+                            f"in {manifest['seconds']:.1f}s")
+            except Exception as e:
+                logger.error(f"Shard {job.index} of {job.svo_path} died: {e}")
+            remaining[job.exp_dir] -= 1
+            if remaining[job.exp_dir] == 0:
+                merge_shards(job.exp_dir, keep_shards=keep_shards)
+    logger.info(f"Extracted {len(svo_paths)} files in {time.perf_counter() - start:.1f}s")
+    return experiments
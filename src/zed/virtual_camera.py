@@ -0,0 +1,386 @@
+"""Camera backends that need neither a ZED nor the SDK.
+
+``SyntheticCamera`` renders deterministic frames at any resolution: a static
+textured BGRA background and depth ramp, with ``num_bodies`` box-shaped people
+walking back and forth, their BODY_38 keypoints, a PERSON detection with its
+mask, and a camera orbiting the scene. Backgrounds are rendered once, so a
+frame costs about what copying it out of the SDK does.
+
+``record_bundle`` captures a "frame bundle" from any Camera (typically a
+ZedCamera on a real session): a capture store (``utils.capture_store``)
+holding raw ``depth`` and ``image`` array streams, ``body-records``,
+``objects`` and ``trajectory`` blobs, plus ``bundle.json`` with the camera
+info. ``ReplayCamera`` plays a bundle back.
+"""
+import io
+import json
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from utils.body_records import NUM_KEYPOINTS_BODY_38, body_record_dtype, descr_to_dtype
+from utils.capture_store import CaptureStoreReader, CaptureStoreWriter
+from utils.trajectory import TRAJECTORY_DTYPE, CameraPose
+from zed.camera import BODIES, DEPTH, IMAGE, OBJECTS, Camera, CameraInfo, DetectedObject, GrabStatus
+
+BUNDLE_FILE = "bundle.json"
+BUNDLE_VERSION = 1
+TRACKING_STATE_OK = 1  # sl.POSITIONAL_TRACKING_STATE.OK
+
+
+class _Bodies:
+    """Bodies buffer of the virtual backends."""
+    __slots__ = ("records",)
+
+    def __init__(self):
+        self.records = np.zeros(0, dtype=body_record_dtype())
+
+
+class _Objects:
+    """Objects buffer of the virtual backends."""
+    __slots__ = ("objects",)
+
+    def __init__(self):
+        self.objects: List[DetectedObject] = []
+
+
+def _resample(src: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Nearest-neighbour resize, for buffers requested at another resolution."""
+    if src.shape[:2] == (height, width):
+        return src
+    rows = np.arange(height) * src.shape[0] // height
+    cols = np.arange(width) * src.shape[1] // width
+    return src[rows[:, None], cols]
+
+
+class _VirtualCamera(Camera):
+    """Frame counting, seeking, real-time pacing and NumPy buffers shared by the virtual backends."""
+
+    def __init__(self, num_frames: Optional[int], fps: float, realtime: bool):
+        self._num_frames = num_frames
+        self._fps = fps
+        self.realtime = realtime
+        self.frame = -1
+        self.has_depth = False
+        self.depth_mode = "NEURAL_PLUS"
+        self._next = 0
+        self._clock: Optional[Tuple[float, int]] = None
+
+    def grab(self, compute_depth: bool = True) -> GrabStatus:
+        if self._num_frames is not None and self._next >= self._num_frames:
+            return GrabStatus.END_OF_STREAM
+        if self.realtime:
+            if self._clock is None:
+                self._clock = (time.perf_counter(), self._next)
+            start, first = self._clock
+            delay = start + (self._next - first) / self._fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.frame = self._next
+        self._next += 1
+        # like the SDK, no depth for frames grabbed without it
+        self.has_depth = compute_depth
+        return GrabStatus.SUCCESS
+
+    def seek(self, frame: int):
+        self._next = frame
+        self._clock = None
+
+    def set_depth_mode(self, mode: str) -> bool:
+        # the virtual depth costs the same in every mode
+        self.depth_mode = mode
+        return True
+
+    def num_frames(self) -> Optional[int]:
+        return self._num_frames
+
+    def timestamp(self) -> int:
+        return int(round(self.frame * 1e9 / self._fps))
+
+    def new_buffer(self, kind: str, width: int = 0, height: int = 0):
+        if kind == DEPTH:
+            return np.empty((height, width), dtype=np.float32)
+        if kind == IMAGE:
+            return np.empty((height, width, 4), dtype=np.uint8)
+        if kind == BODIES:
+            return _Bodies()
+        if kind == OBJECTS:
+            return _Objects()
+        raise ValueError(f"Unknown buffer kind {kind}")
+
+    def body_records(self, buffer: _Bodies, frame_id: int) -> np.ndarray:
+        records = buffer.records.copy()
+        records["frame_id"] = frame_id
+        return records
+
+    def objects(self, buffer: _Objects) -> List[DetectedObject]:
+        return [DetectedObject(id=obj.id, confidence=obj.confidence, bounding_box_2d=obj.bounding_box_2d.copy(),
+                               mask=None if obj.mask is None else obj.mask.copy())
+                for obj in buffer.objects]
+
+
+class SyntheticCamera(_VirtualCamera):
+    """Deterministic frames; ``num_frames=None`` streams forever like a live camera."""
+
+    def __init__(self, width: int = 2208, height: int = 1242, fps: float = 30, num_frames: Optional[int] = None,
+                 num_bodies: int = 1, seed: int = 0, realtime: bool = False):
+        super().__init__(num_frames, fps, realtime)
+        # roughly a ZED 2i: ~110 degrees horizontal field of view
+        focal = 0.48 * width
+        self.info = CameraInfo(width=width, height=height, fps=fps, fx=focal, fy=focal, cx=width / 2, cy=height / 2)
+        self.num_bodies = num_bodies
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # joint positions inside a person's box, fixed for the session
+        self._skeleton = rng.uniform(0.1, 0.9, size=(NUM_KEYPOINTS_BODY_38, 2)).astype(np.float32)
+        self._backgrounds: Dict[Tuple[str, int, int], np.ndarray] = {}
+        self._body_tracking = False
+        self._object_detection = False
+        self._positional_tracking = False
+
+    def _background(self, kind: str, height: int, width: int) -> np.ndarray:
+        key = (kind, height, width)
+        background = self._backgrounds.get(key)
+        if background is None:
+            yy, xx = np.mgrid[0:height, 0:width]
+            if kind == DEPTH:
+                # floor far at the top of the frame, near at the bottom
+                background = (2.5 + 3.0 * (1.0 - yy / height)).astype(np.float32)
+            else:
+                base = ((xx + yy) % 256).astype(np.uint8)
+                noise = np.random.default_rng(self.seed).integers(0, 16, (height, width), dtype=np.uint8)
+                background = np.stack([base, base // 2 + noise, 255 - base, np.full_like(base, 255)], axis=2)
+            self._backgrounds[key] = background
+        return background
+
+    def _people(self) -> List[Tuple[float, float, float, float, float]]:
+        """``(x0, y0, x1, y1, depth)`` per body, in normalised image coordinates."""
+        people = []
+        for body in range(self.num_bodies):
+            phase = 2 * np.pi * self.frame / (self._fps * 4) + body * np.pi / max(1, self.num_bodies)
+            center = 0.5 + 0.3 * np.sin(phase)
+            half_width = 0.08
+            people.append((center - half_width, 0.15, center + half_width, 0.9, 2.0 + 0.5 * body))
+        return people
+
+    def enable_positional_tracking(self) -> bool:
+        self._positional_tracking = True
+        return True
+
+    def enable_body_tracking(self, params) -> bool:
+        self._body_tracking = True
+        return True
+
+    def enable_object_detection(self, params) -> bool:
+        self._object_detection = True
+        return True
+
+    def close(self):
+        self._body_tracking = self._object_detection = self._positional_tracking = False
+
+    def retrieve(self, kind: str, buffer) -> bool:
+        if kind == DEPTH and not self.has_depth:
+            return False
+        if kind in (DEPTH, IMAGE):
+            height, width = buffer.shape[:2]
+            np.copyto(buffer, self._background(kind, height, width))
+            for body, (x0, y0, x1, y1, depth) in enumerate(self._people()):
+                region = buffer[int(y0 * height):int(y1 * height), int(x0 * width):int(x1 * width)]
+                region[...] = depth if kind == DEPTH else (40 + 60 * body, 90, 200 - 50 * body, 255)
+            return True
+        if kind == BODIES:
+            if not self._body_tracking:
+                return False
+            buffer.records = self._body_records()
+            return True
+        if kind == OBJECTS:
+            if not self._object_detection:
+                return False
+            buffer.objects = self._objects()
+            return True
+        raise ValueError(f"Unknown buffer kind {kind}")
+
+    def _box(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        width, height = self.info.width, self.info.height
+        return np.array([[x0 * width, y0 * height], [x1 * width, y0 * height],
+                         [x1 * width, y1 * height], [x0 * width, y1 * height]], dtype=np.float32)
+
+    def _body_records(self) -> np.ndarray:
+        people = self._people()
+        records = np.zeros(len(people), dtype=body_record_dtype())
+        records["timestamp"] = self.timestamp()
+        info = self.info
+        for i, (x0, y0, x1, y1, depth) in enumerate(people):
+            box = self._box(x0, y0, x1, y1)
+            keypoints_2d = box[0] + self._skeleton * (box[2] - box[0])
+            records["body_id"][i] = i
+            records["confidence"][i] = 90.0
+            records["action_state"][i] = b"MOVING"
+            records["keypoints_2d"][i] = keypoints_2d
+            # back-projected at the person's depth, RIGHT_HANDED_Y_UP
+            records["keypoints_3d"][i, :, 0] = (keypoints_2d[:, 0] - info.cx) * depth / info.fx
+            records["keypoints_3d"][i, :, 1] = -(keypoints_2d[:, 1] - info.cy) * depth / info.fy
+            records["keypoints_3d"][i, :, 2] = -depth
+            records["keypoint_confidence"][i] = 90.0
+            records["bounding_box_2d"][i] = box
+        return records
+
+    def _objects(self) -> List[DetectedObject]:
+        objects = []
+        for i, (x0, y0, x1, y1, _) in enumerate(self._people()):
+            box = self._box(x0, y0, x1, y1)
+            mask_height = int(box[2, 1]) - int(box[0, 1])
+            mask_width = int(box[2, 0]) - int(box[0, 0])
+            objects.append(DetectedObject(id=i, confidence=90.0, bounding_box_2d=box,
+                                          mask=np.full((mask_height, mask_width), 255, dtype=np.uint8)))
+        return objects
+
+    def pose(self) -> CameraPose:
+        # a slow orbit around the scene, one turn every 20 seconds
+        angle = 2 * np.pi * self.frame / (self._fps * 20)
+        matrix = np.eye(4)
+        matrix[:3, :3] = [[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]]
+        matrix[:3, 3] = [0.5 * np.sin(angle), 0.0, 0.5 * (1 - np.cos(angle))]
+        return CameraPose(matrix=matrix, timestamp=self.timestamp(), tracking_state=TRACKING_STATE_OK,
+                          ok=True)
+
+
+def _pack_objects(objects: List[DetectedObject]) -> bytes:
+    buffer = io.BytesIO()
+    masks = {f"mask_{i}": obj.mask for i, obj in enumerate(objects) if obj.mask is not None}
+    np.savez(buffer,
+             ids=np.array([obj.id for obj in objects], dtype=np.int32),
+             confidences=np.array([obj.confidence for obj in objects], dtype=np.float32),
+             boxes=np.array([obj.bounding_box_2d for obj in objects], dtype=np.float32).reshape(-1, 4, 2),
+             **masks)
+    return buffer.getvalue()
+
+
+def _unpack_objects(data: bytes) -> List[DetectedObject]:
+    with np.load(io.BytesIO(data)) as npz:
+        return [DetectedObject(id=int(obj_id), confidence=float(confidence), bounding_box_2d=box,
+                               mask=npz[f"mask_{i}"] if f"mask_{i}" in npz else None)
+                for i, (obj_id, confidence, box) in enumerate(zip(npz["ids"], npz["confidences"], npz["boxes"]))]
+
+
+def record_bundle(camera: Camera, path: Path, num_frames: Optional[int] = None,
+                  bodies: bool = False, objects: bool = False, chunk_frames: int = 16) -> int:
+    """Record up to ``num_frames`` frames of ``camera`` into a frame bundle; returns the number recorded.
+
+    Enable the camera's modules first: bodies and objects are only recorded
+    when asked for, the pose of every frame always is.
+    """
+    path = Path(path)
+    writer = CaptureStoreWriter(path, chunk_frames=chunk_frames)
+    info = camera.info
+    resolution = (info.width, info.height)
+    kinds = [DEPTH, IMAGE] + ([BODIES] if bodies else []) + ([OBJECTS] if objects else [])
+    buffers = {kind: camera.new_buffer(kind, info.width, info.height) for kind in kinds}
+    frame = 0
+    try:
+        while num_frames is None or frame < num_frames:
+            status = camera.grab()
+            if status != GrabStatus.SUCCESS:
+                if status == GrabStatus.ERROR:
+                    logger.error(f"Grab failed after {frame} frames")
+                break
+            for kind in (DEPTH, IMAGE):
+                if camera.retrieve(kind, buffers[kind]):
+                    writer.append_array(kind, frame, camera.view(buffers[kind]), resolution=resolution)
+            if bodies and camera.retrieve(BODIES, buffers[BODIES]):
+                records = camera.body_records(buffers[BODIES], frame)
+                writer.append_blob("body-records", frame, records.tobytes(), ext=".bin",
+                                   dtype=np.lib.format.dtype_to_descr(records.dtype))
+            if objects and camera.retrieve(OBJECTS, buffers[OBJECTS]):
+                writer.append_blob("objects", frame, _pack_objects(camera.objects(buffers[OBJECTS])), ext=".npz")
+            writer.append_blob("trajectory", frame, camera.pose().to_record(frame).tobytes(), ext=".bin")
+            frame += 1
+    finally:
+        writer.close()
+        with (path / BUNDLE_FILE).open(mode="w") as fout:
+            json.dump({"version": BUNDLE_VERSION, "info": asdict(info), "num_frames": frame}, fout, indent=4)
+    logger.info(f"Recorded {frame} frames to {path}")
+    return frame
+
+
+class ReplayCamera(_VirtualCamera):
+    """Plays back a frame bundle; modules can only be enabled if their stream was recorded."""
+
+    def __init__(self, path: Path, loop: bool = False, realtime: bool = False):
+        self.path = Path(path)
+        with (self.path / BUNDLE_FILE).open(mode="r") as fin:
+            meta = json.load(fin)
+        self.info = CameraInfo(**meta["info"])
+        self.loop = loop
+        super().__init__(None if loop else meta["num_frames"], self.info.fps, realtime)
+        self._length = meta["num_frames"]
+        self.store = CaptureStoreReader(self.path)
+        self._modalities = set(self.store.modalities())
+        self._body_dtype = descr_to_dtype(self.store["body-records"].header["dtype"]) \
+            if "body-records" in self._modalities else None
+        self._enabled = set()
+
+    def grab(self, compute_depth: bool = True) -> GrabStatus:
+        status = super().grab(compute_depth)
+        if self.loop and self._length:
+            self.frame %= self._length
+        return status
+
+    def _enable(self, modality: str) -> bool:
+        if modality not in self._modalities:
+            logger.error(f"{self.path} has no {modality} stream")
+            return False
+        self._enabled.add(modality)
+        return True
+
+    def enable_positional_tracking(self) -> bool:
+        return self._enable("trajectory")
+
+    def enable_body_tracking(self, params) -> bool:
+        return self._enable("body-records")
+
+    def enable_object_detection(self, params) -> bool:
+        return self._enable("objects")
+
+    def close(self):
+        self._enabled.clear()
+
+    def _get(self, modality: str):
+        if modality not in self._modalities or self.frame not in self.store[modality]:
+            return None
+        return self.store[modality].get(self.frame)
+
+    def retrieve(self, kind: str, buffer) -> bool:
+        if kind == DEPTH and not self.has_depth:
+            return False
+        if kind in (DEPTH, IMAGE):
+            frame = self._get(kind)
+            if frame is None:
+                return False
+            np.copyto(buffer, _resample(frame, *buffer.shape[:2]))
+            return True
+        if kind == BODIES:
+            data = self._get("body-records") if "body-records" in self._enabled else None
+            if data is None:
+                return False
+            buffer.records = np.frombuffer(data, dtype=self._body_dtype)
+            return True
+        if kind == OBJECTS:
+            data = self._get("objects") if "objects" in self._enabled else None
+            if data is None:
+                return False
+            buffer.objects = _unpack_objects(data)
+            return True
+        raise ValueError(f"Unknown buffer kind {kind}")
+
+    def pose(self) -> CameraPose:
+        data = self._get("trajectory")
+        if data is None:
+            return CameraPose(matrix=np.eye(4), timestamp=self.timestamp(), tracking_state=0, ok=False)
+        record = np.frombuffer(data, dtype=TRAJECTORY_DTYPE)[0]
+        return CameraPose(matrix=record["pose"].copy(), timestamp=int(record["timestamp"]),
+                          tracking_state=int(record["tracking_state"]), ok=bool(record["ok"]))
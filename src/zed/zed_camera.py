@@ -0,0 +1,249 @@
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+from pyzed import sl
+
+from utils.body_records import NUM_KEYPOINTS_BODY_38, body_record_dtype
+from utils.trajectory import CameraPose
+from utils.zed_utils import parse_args
+from zed.body_tracking import BodyTrackingParameters
+from zed.camera import BODIES, DEPTH, IMAGE, OBJECTS, Camera, CameraInfo, DetectedObject, GrabStatus
+from zed.object_detection import ObjectDetectionParameters
+
+
+def _fill(dst: np.ndarray, src):
+    # the SDK leaves boxes empty when they are not available; keep what dst was initialized to then
+    src = np.asarray(src, dtype=dst.dtype)
+    if src.size == dst.size:
+        dst[...] = src.reshape(dst.shape)
+
+
+def extract_body_records(bodies: sl.Bodies, frame_id: int) -> np.ndarray:
+    """Copy every tracked body straight into one structured record per body"""
+    tracked = [body for body in bodies.body_list if body.tracking_state == sl.OBJECT_TRACKING_STATE.OK]
+    num_keypoints = len(tracked[0].keypoint_2d) if tracked else NUM_KEYPOINTS_BODY_38
+    records = np.zeros(len(tracked), dtype=body_record_dtype(num_keypoints))
+    records['frame_id'] = frame_id
+    records['timestamp'] = bodies.timestamp.get_nanoseconds()
+    # NaN marks a box the SDK did not provide, exported as [] like before the records
+    records['bounding_box_2d'] = np.nan
+    records['bounding_box_3d'] = np.nan
+    for i, body in enumerate(tracked):
+        records['body_id'][i] = body.id
+        records['confidence'][i] = body.confidence
+        records['action_state'][i] = str(body.action_state).encode()
+        _fill(records['keypoints_2d'][i], body.keypoint_2d)
+        _fill(records['keypoints_3d'][i], body.keypoint)
+        _fill(records['keypoint_confidence'][i], body.keypoint_confidence)
+        _fill(records['bounding_box_2d'][i], body.bounding_box_2d)
+        _fill(records['bounding_box_3d'][i], body.bounding_box)
+    return records
+
+
+class ZedCamera(Camera):
+    """A ZED camera, network stream or SVO file."""
+
+    def __init__(self, zed: sl.Camera, runtime_parameters: Optional[sl.RuntimeParameters] = None,
+                 init: Optional[sl.InitParameters] = None):
+        self.zed = zed
+        # kept to reopen the camera in another depth mode
+        self._init = init
+        if runtime_parameters is None:
+            # Initialize the runtime parameters
+            runtime_parameters = sl.RuntimeParameters()
+            runtime_parameters.confidence_threshold = 50  # Reasonable confidence threshold (0-100)
+            runtime_parameters.texture_confidence_threshold = 100  # Filters weak textures (0-100)
+            # runtime_parameters.remove_saturated_areas = True
+        self.runtime_parameters = runtime_parameters
+        # same settings, for frames grabbed only to keep the tracking modules fed
+        self._no_depth_parameters = sl.RuntimeParameters()
+        self._no_depth_parameters.confidence_threshold = runtime_parameters.confidence_threshold
+        self._no_depth_parameters.texture_confidence_threshold = runtime_parameters.texture_confidence_threshold
+        self._no_depth_parameters.enable_depth = False
+        self._pose = sl.Pose()
+        self._body_runtime = None
+        self._body_instance_id = 0
+        self._object_runtime = None
+        self._object_instance_id = 0
+        # what set_depth_mode enables again after reopening
+        self._positional_tracking = False
+        self._body_params: Optional[BodyTrackingParameters] = None
+        self._object_params: Optional[ObjectDetectionParameters] = None
+
+        # Get camera information
+        camera_infos = zed.get_camera_information()
+        camera_res = camera_infos.camera_configuration.resolution
+        left_cam_params = camera_infos.camera_configuration.calibration_parameters.left_cam
+        self.info = CameraInfo(width=camera_res.width, height=camera_res.height,
+                               fps=camera_infos.camera_configuration.fps,
+                               fx=left_cam_params.fx, fy=left_cam_params.fy,
+                               cx=left_cam_params.cx, cy=left_cam_params.cy)
+
+    @classmethod
+    def open(cls, opt) -> "ZedCamera":
+        # Initialize camera parameters
+        init = sl.InitParameters(
+            depth_mode=getattr(sl.DEPTH_MODE, getattr(opt, "depth_mode", "NEURAL_PLUS")),
+            coordinate_units=sl.UNIT.METER,
+            coordinate_system=sl.COORDINATE_SYSTEM.RIGHT_HANDED_Y_UP,
+            camera_resolution=sl.RESOLUTION.HD2K,
+            camera_fps = 30
+        )
+
+        # Parse additional arguments
+        parse_args(init, opt=opt)
+
+        # Create and open camera
+        zed = sl.Camera()
+        status = zed.open(init)
+        if status != sl.ERROR_CODE.SUCCESS:
+            logger.error(f"Cannot open the camera: {repr(status)}")
+            raise RuntimeError(f"Cannot open the camera: {repr(status)}")
+        return cls(zed, init=init)
+
+    def grab(self, compute_depth: bool = True) -> GrabStatus:
+        status = self.zed.grab(self.runtime_parameters if compute_depth else self._no_depth_parameters)
+        if status == sl.ERROR_CODE.SUCCESS:
+            return GrabStatus.SUCCESS
+        if status == sl.ERROR_CODE.END_OF_SVOFILE_REACHED:
+            return GrabStatus.END_OF_STREAM
+        logger.error(f"Failed to grab frame: {status}")
+        return GrabStatus.ERROR
+
+    def timestamp(self) -> int:
+        return self.zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds()
+
+    def seek(self, frame: int):
+        self.zed.set_svo_position(frame)
+
+    def num_frames(self) -> Optional[int]:
+        num_frames = self.zed.get_svo_number_of_frames()
+        return num_frames if num_frames > 0 else None
+
+    def enable_positional_tracking(self) -> bool:
+        positional_tracking_parameters = sl.PositionalTrackingParameters()
+        # If the camera is static in space, enabling this setting below provides better depth quality and faster computation
+        # positional_tracking_parameters.set_as_static = True
+        self._positional_tracking = \
+            self.zed.enable_positional_tracking(positional_tracking_parameters) == sl.ERROR_CODE.SUCCESS
+        return self._positional_tracking
+
+    def enable_body_tracking(self, params: BodyTrackingParameters) -> bool:
+        if self._body_runtime is not None:
+            self.zed.disable_body_tracking(self._body_instance_id)
+            self._body_runtime = None
+        body_param = sl.BodyTrackingParameters()
+        body_param.instance_module_id = params.instance_module_id
+        body_param.enable_tracking = params.enable_tracking
+        body_param.enable_body_fitting = params.enable_body_fitting
+        body_param.detection_model = getattr(sl.BODY_TRACKING_MODEL, params.detection_model)
+        body_param.body_format = getattr(sl.BODY_FORMAT, params.body_format)
+        if self.zed.enable_body_tracking(body_param) != sl.ERROR_CODE.SUCCESS:
+            return False
+        self._body_runtime = sl.BodyTrackingRuntimeParameters()
+        self._body_runtime.detection_confidence_threshold = params.detection_confidence_threshold
+        self._body_instance_id = params.instance_module_id
+        self._body_params = params
+        return True
+
+    def enable_object_detection(self, params: ObjectDetectionParameters) -> bool:
+        if self._object_runtime is not None:
+            self.zed.disable_object_detection(self._object_instance_id)
+            self._object_runtime = None
+        obj_param = sl.ObjectDetectionParameters()
+        obj_param.instance_module_id = params.instance_module_id
+        obj_param.enable_tracking = params.enable_tracking
+        obj_param.enable_segmentation = params.enable_segmentation
+        obj_param.detection_model = getattr(sl.OBJECT_DETECTION_MODEL, params.detection_model)
+        if self.zed.enable_object_detection(obj_param) != sl.ERROR_CODE.SUCCESS:
+            return False
+        self._object_runtime = sl.ObjectDetectionRuntimeParameters()
+        self._object_runtime.detection_confidence_threshold = params.detection_confidence_threshold
+        self._object_runtime.object_class_filter = [getattr(sl.OBJECT_CLASS, name) for name in params.object_class_filter]
+        self._object_instance_id = params.instance_module_id
+        self._object_params = params
+        return True
+
+    def set_depth_mode(self, mode: str) -> bool:
+        """Reopens the camera; positional tracking restarts from the identity pose."""
+        if self._init is None:
+            return False
+        svo_position = self.zed.get_svo_position() if self.num_frames() is not None else None
+        positional_tracking, body_params, object_params = \
+            self._positional_tracking, self._body_params, self._object_params
+        self.close()
+        self._init.depth_mode = getattr(sl.DEPTH_MODE, mode)
+        status = self.zed.open(self._init)
+        if status != sl.ERROR_CODE.SUCCESS:
+            logger.error(f"Cannot reopen the camera in depth mode {mode}: {repr(status)}")
+            return False
+        if svo_position is not None:
+            self.zed.set_svo_position(svo_position)
+        if positional_tracking:
+            self.enable_positional_tracking()
+        if object_params is not None:
+            self.enable_object_detection(object_params)
+        if body_params is not None:
+            self.enable_body_tracking(body_params)
+        return True
+
+    def close(self):
+        if self._body_runtime is not None:
+            self.zed.disable_body_tracking()
+            self._body_runtime = None
+        if self._object_runtime is not None:
+            self.zed.disable_object_detection()
+            self._object_runtime = None
+        self.zed.close()
+
+    def new_buffer(self, kind: str, width: int = 0, height: int = 0):
+        if kind == DEPTH:
+            return sl.Mat(width, height, memory_type=sl.MEM.CPU, mat_type=sl.MAT_TYPE.F32_C1)
+        if kind == IMAGE:
+            return sl.Mat(width, height, memory_type=sl.MEM.CPU, mat_type=sl.MAT_TYPE.U8_C4)
+        if kind == BODIES:
+            return sl.Bodies()
+        if kind == OBJECTS:
+            return sl.Objects()
+        raise ValueError(f"Unknown buffer kind {kind}")
+
+    def retrieve(self, kind: str, buffer) -> bool:
+        if kind == DEPTH:
+            # the SDK resizes to the buffer, which may be smaller than the camera resolution
+            err = self.zed.retrieve_measure(buffer, sl.MEASURE.DEPTH, sl.MEM.CPU, buffer.get_resolution())
+        elif kind == IMAGE:
+            err = self.zed.retrieve_image(buffer, sl.VIEW.LEFT, sl.MEM.CPU, buffer.get_resolution())
+        elif kind == BODIES:
+            err = self.zed.retrieve_bodies(buffer, self._body_runtime, self._body_instance_id)
+        elif kind == OBJECTS:
+            err = self.zed.retrieve_objects(buffer, self._object_runtime, self._object_instance_id)
+        else:
+            raise ValueError(f"Unknown buffer kind {kind}")
+        return err == sl.ERROR_CODE.SUCCESS
+
+    def view(self, buffer: sl.Mat) -> np.ndarray:
+        return buffer.get_data(deep_copy=False)
+
+    def body_records(self, buffer: sl.Bodies, frame_id: int) -> np.ndarray:
+        return extract_body_records(buffer, frame_id)
+
+    def objects(self, buffer: sl.Objects) -> List[DetectedObject]:
+        detected = []
+        for obj in buffer.object_list:
+            mask = obj.mask.get_data(deep_copy=True) if obj.mask and obj.mask.is_init() else None
+            detected.append(DetectedObject(id=obj.id, confidence=obj.confidence,
+                                           bounding_box_2d=np.asarray(obj.bounding_box_2d, dtype=np.float32),
+                                           mask=mask))
+        return detected
+
+    def pose(self) -> CameraPose:
+        """World pose of the last grabbed frame, kept as a NumPy matrix along with its tracking state"""
+        state = self.zed.get_position(self._pose, sl.REFERENCE_FRAME.WORLD)
+        ok = state == sl.POSITIONAL_TRACKING_STATE.OK
+        if not ok:
+            logger.error(f"Camera tracking is not OK: {state}")
+        return CameraPose(matrix=np.array(self._pose.pose_data().m, dtype=np.float64),
+                          timestamp=self._pose.timestamp.get_nanoseconds(),
+                          tracking_state=state.value,
+                          ok=ok)